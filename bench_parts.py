@@ -0,0 +1,191 @@
+import argparse
+import importlib.util
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parent
+
+# 各部分的能力不同, 生成工作负载时据此跳过不支持的输入
+# operands: 一条表达式最多几个操作数(None表示不限)
+# digits: 是否支持多位整数; parens: 是否支持括号
+PARTS: dict[str, dict] = {
+    'part1/calc1.py': {'operands': 2, 'digits': False, 'parens': False},
+    'part1/calc2.py': {'operands': 2, 'digits': True, 'parens': False},
+    'part2/calc2.py': {'operands': None, 'digits': True, 'parens': False},
+    'part3/calc3.py': {'operands': None, 'digits': True, 'parens': False},
+    'part4/calc4.py': {'operands': None, 'digits': True, 'parens': False},
+    'part5/calc5.py': {'operands': None, 'digits': True, 'parens': False},
+    'part6/calc6.py': {'operands': None, 'digits': True, 'parens': True},
+    'part7/spi.py': {'operands': None, 'digits': True, 'parens': True},
+}
+
+
+def load(path: str) -> ModuleType:
+    # 各部分的模块名互相重复(calc2.py), 按文件路径加载成互不冲突的模块
+    name = 'bench_' + path.replace('/', '_').removesuffix('.py')
+    spec = importlib.util.spec_from_file_location(name, ROOT / path)
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, str((ROOT / path).parent))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.pop(0)
+    return module
+
+
+def drain(text: str, next_token: Callable[[], object], eof: object) -> int:
+    # token数不可能超过字符数, 超过说明词法分析器在原地打转(part1/calc2.py在结尾的数字处会回退)
+    for count in range(len(text) + 1):
+        token = next_token()
+        typ = getattr(token, 'typ', None) or getattr(token, 'token_type', None)
+        if typ == eof:
+            return count
+    raise RuntimeError('词法分析没有到达EOF')
+
+
+def phases(module: ModuleType) -> dict[str, Callable[[str], object]]:
+    # 每个部分能单独计时的阶段: lex只做词法分析, parse做到AST为止, eval只对现成的AST求值
+    # total从文本到结果; 1~6部分的解析和求值是一体的, 只有total
+    result: dict[str, Callable[[str], object]] = {}
+    if hasattr(module, 'Lexer'):
+        eof = module.EToken.EOF if hasattr(module, 'EToken') else module.TokenType.EOF
+        result['lex'] = lambda text: drain(text, module.Lexer(text).get_next_token, eof)
+    elif hasattr(module.Interpreter, 'get_next_token'):
+        eof = module.TokenType.EOF if hasattr(module, 'TokenType') else module.EOF
+        result['lex'] = lambda text: drain(text, module.Interpreter(text).get_next_token, eof)
+
+    if hasattr(module, 'Parser'):
+        result['parse'] = lambda text: module.Parser(module.Lexer(text)).parse()
+        result['eval'] = lambda ast: module.Interpreter(None).visit(ast)
+        result['total'] = lambda text: module.Interpreter(module.Parser(module.Lexer(text))).interpret()
+    elif hasattr(module, 'Lexer'):
+        result['total'] = lambda text: module.Interpreter(module.Lexer(text)).expr()
+    else:
+        result['total'] = lambda text: module.Interpreter(text).expr()
+    return result
+
+
+def flat_sum(caps: dict, scale: int) -> list[str] | None:
+    if caps['operands'] is not None:
+        return None
+    # 400项: part7的递归求值器对左深链每项要一层栈帧, 控制在默认递归上限以内
+    return ['+'.join(str((i + j) % 9 + 1) for i in range(400)) for j in range(10 * scale)]
+
+
+def deep_nesting(caps: dict, scale: int) -> list[str] | None:
+    if not caps['parens']:
+        return None
+    # 递归下降每层括号要用掉好几个栈帧, 深度控制在默认递归上限以内
+    depth = 100
+    return ['(' * depth + '1' + '+1)' * depth for _ in range(scale)]
+
+
+def many_small(caps: dict, scale: int) -> list[str] | None:
+    return [f'{i % 9 + 1}+{i % 7 + 1}' for i in range(1000 * scale)]
+
+
+def huge_literals(caps: dict, scale: int) -> list[str] | None:
+    if not caps['digits']:
+        return None
+    # 4000位: 低于CPython默认的int_max_str_digits(4300)
+    return [f'{"9" * 4000}+{"1" * 4000}' for _ in range(scale)]
+
+
+WORKLOADS: dict[str, Callable[[dict, int], list[str] | None]] = {
+    'flat_sum': flat_sum,
+    'deep_nesting': deep_nesting,
+    'many_small': many_small,
+    'huge_literals': huge_literals,
+}
+
+
+def measure(func: Callable[[object], object], inputs: list, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(parts: list[str], workloads: list[str], scale: int, repeat: int) -> dict:
+    results = []
+    for path in parts:
+        module = load(path)
+        funcs = phases(module)
+        for workload in workloads:
+            texts = WORKLOADS[workload](PARTS[path], scale)
+            if texts is None:
+                results.append({'part': path, 'workload': workload, 'status': 'skipped'})
+                continue
+            for phase, func in funcs.items():
+                entry = {'part': path, 'workload': workload, 'phase': phase, 'items': len(texts)}
+                try:
+                    inputs = [funcs['parse'](text) for text in texts] if phase == 'eval' else texts
+                    seconds = measure(func, inputs, repeat)
+                except Exception as e:
+                    entry.update(status='error', error=f'{type(e).__name__}: {e}')
+                else:
+                    entry.update(
+                        status='ok',
+                        seconds=seconds,
+                        us_per_item=seconds / len(texts) * 1e6,
+                        chars_per_second=sum(map(len, texts)) / seconds if seconds else None,
+                    )
+                results.append(entry)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'scale': scale,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def regressions(report: dict, baseline: dict, threshold: float) -> list[dict]:
+    # 与基线按(部分, 工作负载, 阶段)对齐, 变慢超过threshold倍的项记为回归
+    before = {
+        (e['part'], e['workload'], e.get('phase')): e['seconds']
+        for e in baseline['results'] if e['status'] == 'ok'
+    }
+    found = []
+    for e in report['results']:
+        old = before.get((e['part'], e['workload'], e.get('phase')))
+        if e['status'] == 'ok' and old and e['seconds'] > old * threshold:
+            found.append({'part': e['part'], 'workload': e['workload'], 'phase': e['phase'],
+                          'before': old, 'after': e['seconds'], 'slowdown': e['seconds'] / old})
+    return found
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog='bench_parts', description='对各部分的Lexer/Parser/Interpreter分阶段计时, 输出JSON')
+    parser.add_argument('--parts', nargs='*', choices=list(PARTS), default=list(PARTS))
+    parser.add_argument('--workloads', nargs='*', choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument('--scale', type=int, default=1, help='工作负载规模倍数')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数, 取最好成绩')
+    parser.add_argument('-o', '--output', help='输出文件, 默认写到标准输出')
+    parser.add_argument('--baseline', help='之前输出的JSON, 指定后在结果中附上回归列表, 有回归时退出码为1')
+    parser.add_argument('--threshold', type=float, default=1.2, help='慢于基线多少倍算回归')
+    args = parser.parse_args(argv)
+
+    report = run(args.parts, args.workloads, args.scale, args.repeat)
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        report['regressions'] = regressions(report, baseline, args.threshold)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(f'{text}\n', encoding='utf-8')
+    else:
+        print(text)
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import struct
+import sys
+from array import array
+
+from spi import AstNode, BinOp, EToken, Integer, Lexer, OPERATOR_TOKENS, RegexLexer, integer_token
+
+# 节点操作码: 0是整数字面量, 其余是二元运算
+OP_INTEGER, OP_ADD, OP_SUB, OP_MUL, OP_DIV = range(5)
+
+OPCODES: dict[EToken, int] = {
+    EToken.PLUS: OP_ADD,
+    EToken.MINUS: OP_SUB,
+    EToken.MUL: OP_MUL,
+    EToken.DIV: OP_DIV,
+}
+
+OP_TOKENS: dict[int, EToken] = {op: typ for typ, op in OPCODES.items()}
+
+MAGIC = b'SPIA'
+VERSION = 1
+HEADER = struct.Struct('<4sHxxIII')
+# 各列在字节流中固定为4字节有符号小端整数, 与主机的字节序和array('i')的宽度无关
+COLUMN = struct.Struct('<i')
+
+
+def column_bytes(column: array) -> bytes:
+    if column.itemsize != COLUMN.size:
+        return struct.pack(f'<{len(column)}i', *column)
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def read_column(column: array, data: memoryview, count: int):
+    if column.itemsize != COLUMN.size:
+        column.extend(struct.unpack(f'<{count}i', data))
+        return
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+
+
+class AstArena:
+
+    def __init__(self):
+        # 第i个节点: ops[i]为操作码, lefts[i]/rights[i]为子节点下标, lits[i]为字面量在常量池中的下标
+        # 子节点总是先于父节点加入, 所以下标小的节点不会依赖下标大的节点
+        self.ops = array('i')
+        self.lefts = array('i')
+        self.rights = array('i')
+        self.lits = array('i')
+        self.consts: list[int] = []
+        self.__const_index: dict[int, int] = {}
+        self.root = -1
+
+    def __len__(self) -> int: return len(self.ops)
+
+    def const(self, value: int) -> int:
+        lit = self.__const_index.get(value)
+        if lit is None:
+            lit = len(self.consts)
+            self.consts.append(value)
+            self.__const_index[value] = lit
+        return lit
+
+    def integer(self, value: int) -> int:
+        return self.__append(OP_INTEGER, -1, -1, self.const(value))
+
+    def bin_op(self, op: int, left: int, right: int) -> int:
+        return self.__append(op, left, right, -1)
+
+    def first(self, index: int) -> int:
+        # 一棵子树的节点在数组中是连续的, 起点就是它最左边的叶子
+        ops, lefts = self.ops, self.lefts
+        while ops[index] != OP_INTEGER:
+            index = lefts[index]
+        return index
+
+    def __append(self, op: int, left: int, right: int, lit: int) -> int:
+        index = len(self.ops)
+        self.ops.append(op)
+        self.lefts.append(left)
+        self.rights.append(right)
+        self.lits.append(lit)
+        self.root = index
+        return index
+
+    @classmethod
+    def from_ast(cls, node: AstNode) -> 'AstArena':
+        arena = cls()
+        # 显式栈做后序遍历, 左深的长链也不会递归过深
+        results: list[int] = []
+        stack: list[tuple[AstNode, bool]] = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if isinstance(node, Integer):
+                results.append(arena.integer(node.value.val))
+            elif not isinstance(node, BinOp):
+                raise TypeError(f'arena只支持整数和二元运算节点, 不支持{node.name()}')
+            elif expanded:
+                right = results.pop()
+                left = results.pop()
+                results.append(arena.bin_op(OPCODES[node.op.typ], left, right))
+            else:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+        arena.root = results[-1]
+        return arena
+
+    def to_ast(self, index: int | None = None) -> AstNode:
+        index = self.root if index is None else index
+        nodes: dict[int, AstNode] = {}
+        ops, lefts, rights, lits, consts = self.ops, self.lefts, self.rights, self.lits, self.consts
+        for i in range(self.first(index), index + 1):
+            op = ops[i]
+            if op == OP_INTEGER:
+                nodes[i] = Integer(integer_token(consts[lits[i]]))
+            else:
+                nodes[i] = BinOp(nodes[lefts[i]], OPERATOR_TOKENS[OP_TOKENS[op]], nodes[rights[i]])
+        return nodes[index]
+
+    def to_bytes(self) -> bytes:
+        # 常量池中每个整数编码为: 4字节长度 + 有符号小端字节
+        pool = bytearray()
+        for value in self.consts:
+            raw = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+            pool += struct.pack('<I', len(raw))
+            pool += raw
+        header = HEADER.pack(MAGIC, VERSION, len(self.ops), len(self.consts), self.root & 0xffffffff)
+        return b''.join((
+            header,
+            column_bytes(self.ops),
+            column_bytes(self.lefts),
+            column_bytes(self.rights),
+            column_bytes(self.lits),
+            bytes(pool),
+        ))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'AstArena':
+        if len(data) < HEADER.size:
+            raise ValueError('arena长度不符')
+        magic, version, count, const_count, root = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('不支持的arena格式')
+        arena = cls()
+        view = memoryview(data)
+        offset = HEADER.size
+        size = count * COLUMN.size
+        if offset + 4 * size > len(view):
+            raise ValueError('arena长度不符')
+        for column in (arena.ops, arena.lefts, arena.rights, arena.lits):
+            read_column(column, view[offset:offset + size], count)
+            offset += size
+        for _ in range(const_count):
+            if offset + 4 > len(view):
+                raise ValueError('arena长度不符')
+            (length,) = struct.unpack_from('<I', data, offset)
+            offset += 4
+            if offset + length > len(view):
+                raise ValueError('arena长度不符')
+            arena.const(int.from_bytes(view[offset:offset + length], 'little', signed=True))
+            offset += length
+        if offset != len(view):
+            raise ValueError('arena长度不符')
+        arena.root = root if root != 0xffffffff else -1
+        return arena
+
+
+class ArenaParser:
+
+    def __init__(
+            self,
+            lexer: Lexer | RegexLexer,
+            arena: AstArena | None = None
+    ):
+        self.__lexer = lexer
+        self.__arena = AstArena() if arena is None else arena
+        self.__cur_token = self.__lexer.get_next_token()
+
+    def eat(self, e: EToken):
+        if self.__cur_token.typ == e:
+            self.__cur_token = self.__lexer.get_next_token()
+        else:
+            self.__lexer.error()
+
+    def factor(self) -> int:
+        if self.__cur_token.typ == EToken.INTEGER:
+            index = self.__arena.integer(self.__cur_token.val)
+            self.eat(EToken.INTEGER)
+            return index
+        if self.__cur_token.typ == EToken.LPAREN:
+            self.eat(EToken.LPAREN)
+            index = self.expr()
+            self.eat(EToken.RPAREN)
+            return index
+        self.__lexer.error()
+
+    def term(self) -> int:
+        index = self.factor()
+        while self.__cur_token.typ in (
+            EToken.MUL,
+            EToken.DIV,
+        ):
+            op = OPCODES[self.__cur_token.typ]
+            self.eat(self.__cur_token.typ)
+            index = self.__arena.bin_op(op, index, self.factor())
+        return index
+
+    def expr(self) -> int:
+        index = self.term()
+        while self.__cur_token.typ in (
+            EToken.PLUS,
+            EToken.MINUS,
+        ):
+            op = OPCODES[self.__cur_token.typ]
+            self.eat(self.__cur_token.typ)
+            index = self.__arena.bin_op(op, index, self.term())
+        return index
+
+    def parse(self) -> AstArena:
+        self.__arena.root = self.expr()
+        return self.__arena
+
+
+class ArenaInterpreter:
+
+    def evaluate(self, arena: AstArena, index: int | None = None) -> int:
+        # 子节点下标总小于父节点, 按下标顺序求值即可, 不需要递归
+        index = arena.root if index is None else index
+        values: list[int] = [0] * (index + 1)
+        ops, lefts, rights, lits, consts = arena.ops, arena.lefts, arena.rights, arena.lits, arena.consts
+        for i in range(arena.first(index), index + 1):
+            op = ops[i]
+            if op == OP_INTEGER:
+                values[i] = consts[lits[i]]
+            elif op == OP_ADD:
+                values[i] = values[lefts[i]] + values[rights[i]]
+            elif op == OP_SUB:
+                values[i] = values[lefts[i]] - values[rights[i]]
+            elif op == OP_MUL:
+                values[i] = values[lefts[i]] * values[rights[i]]
+            else:
+                values[i] = values[lefts[i]] // values[rights[i]]
+        return values[index]
@@ -0,0 +1,769 @@
+import argparse
+import io
+import random
+import time
+from typing import Callable
+
+from spi import EToken, Interpreter, Lexer, Parser, RegexLexer, evaluate_many
+from testsupport import exprs, spaced, tokens, tree_eval
+
+BENCHMARKS: dict[str, Callable[[argparse.Namespace], None]] = {}
+
+
+def benchmark(name: str):
+    def register(func: Callable[[argparse.Namespace], None]):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def timeit(func: Callable[[], object], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, seconds: float, count: int):
+    print(f'{name:<24} {seconds * 1e3:10.2f} ms {count / seconds:14.0f} evals/s')
+
+
+@benchmark('vm')
+def bench_vm(args: argparse.Namespace):
+    from vm import VM, compile_ast
+
+    texts = exprs(args.count, args.depth)
+    asts = [Parser(Lexer(text)).parse() for text in texts]
+    codes = [compile_ast(ast) for ast in asts]
+    expected = [tree_eval(text) for text in texts]
+    vm = VM()
+    assert [vm.run(code) for code in codes] == expected
+
+    def run_tree():
+        interpreter = Interpreter(None)
+        for ast in asts:
+            interpreter.visit(ast)
+
+    def run_vm():
+        for code in codes:
+            vm.run(code)
+
+    report('tree (pre-parsed)', timeit(run_tree, args.repeat), len(texts))
+    report('vm (pre-compiled)', timeit(run_vm, args.repeat), len(texts))
+
+
+@benchmark('lexer')
+def bench_lexer(args: argparse.Namespace):
+    # 两种实现的token流是否一致由test_lexer.py检查, 这里只测吞吐量
+    rng = random.Random(1)
+    text = '+'.join(spaced(rng, e) for e in exprs(args.count, args.depth, seed=3))
+    while len(text) < 4_000_000:
+        text = f'{text}+{text}'
+    for name, lexer_type in (('Lexer', Lexer), ('RegexLexer', RegexLexer)):
+        seconds = timeit(lambda: tokens(lexer_type(text)), 1)
+        print(f'{name:<24} {seconds * 1e3:10.2f} ms {len(text) / seconds / 1e6:10.2f} MB/s')
+
+    # 开启spans的额外开销: 只数token不保留, 排除token列表本身的内存和GC影响
+    def count(lexer: Lexer | RegexLexer) -> int:
+        get_next_token = lexer.get_next_token
+        n = 0
+        while get_next_token().typ != EToken.EOF:
+            n += 1
+        return n
+
+    text = text[:1_000_000]
+    for name, lexer_type in (('Lexer', Lexer), ('RegexLexer', RegexLexer)):
+        plain = timeit(lambda: count(lexer_type(text)), args.repeat)
+        with_spans = timeit(lambda: count(lexer_type(text, spans=True)), args.repeat)
+        print(f'{name + " spans":<24} {plain * 1e3:10.2f} ms -> {with_spans * 1e3:10.2f} ms ({with_spans / plain - 1:+.1%})')
+
+
+@benchmark('batch')
+def bench_batch(args: argparse.Namespace):
+    # unique: 每行都不同, 省下的只有词法分析; repeated: 从十分之一的不同表达式中有放回地抽取, 重复的行不再解析
+    rng = random.Random(3)
+    unique = exprs(args.count, args.depth // 2)
+    library = exprs(args.count // 10 or 1, args.depth // 2, seed=4)
+    repeated = [rng.choice(library) for _ in range(args.count)]
+    for name, texts in (('unique', unique), ('repeated', repeated)):
+        assert [value for value, _ in evaluate_many(texts)] == [tree_eval(text) for text in texts]
+        fresh = timeit(lambda: [tree_eval(text) for text in texts], args.repeat)
+        batched = timeit(lambda: list(evaluate_many(texts)), args.repeat)
+        report(f'{name}: Lexer per line', fresh, len(texts))
+        report(f'{name}: evaluate_many', batched, len(texts))
+        print(f'{"":<24} {fresh / batched:.2f}x')
+
+
+@benchmark('cache')
+def bench_cache(args: argparse.Namespace):
+    from cache import ParseCache
+
+    rng = random.Random(4)
+    library = exprs(args.count // 10 or 1, args.depth)
+    texts = [rng.choice(library) for _ in range(args.count)]
+    for name, max_entries in (('cache (fits)', len(library)), ('cache (half)', len(library) // 2 or 1)):
+        cache = ParseCache(max_entries=max_entries)
+        seconds = timeit(lambda: [cache.get(text) for text in texts], args.repeat)
+        report(name, seconds, len(texts))
+        print(f'{"":<24} {cache.stats()}')
+    seconds = timeit(lambda: [Parser(Lexer(text)).parse() for text in texts], args.repeat)
+    report('no cache', seconds, len(texts))
+
+
+@benchmark('fold')
+def bench_fold(args: argparse.Namespace):
+    from cache import count_nodes
+    from optimizer import fold
+
+    texts = exprs(args.count, args.depth)
+    asts = [Parser(Lexer(text)).parse() for text in texts]
+    folded = [fold(ast) for ast in asts]
+    interpreter = Interpreter(None)
+    assert [interpreter.visit(ast) for ast, _ in folded] == [interpreter.visit(ast) for ast in asts]
+    report('unfolded', timeit(lambda: [interpreter.visit(ast) for ast in asts], args.repeat), len(asts))
+    report('folded', timeit(lambda: [interpreter.visit(ast) for ast, _ in folded], args.repeat), len(asts))
+    nodes = sum(count_nodes(ast) for ast in asts)
+    print(f'{"":<24} 共{nodes}个节点, 平均每条表达式折叠{sum(n for _, n in folded) / len(asts):.1f}个')
+
+
+@benchmark('pycompile')
+def bench_pycompile(args: argparse.Namespace):
+    from pycompile import compile_closure, compile_function
+
+    texts = exprs(args.count, args.depth)
+    asts = [Parser(Lexer(text)).parse() for text in texts]
+    closures = [compile_closure(ast) for ast in asts]
+    functions = [compile_function(ast) for ast in asts]
+    expected = [tree_eval(text) for text in texts]
+    assert [f() for f in closures] == expected
+    assert [f() for f in functions] == expected
+
+    def run_interpret():
+        for text in texts:
+            Interpreter(Parser(Lexer(text))).interpret()
+
+    report('Interpreter.interpret', timeit(run_interpret, args.repeat), len(texts))
+    report('closures', timeit(lambda: [f() for f in closures], args.repeat), len(texts))
+    report('compile()', timeit(lambda: [f() for f in functions], args.repeat), len(texts))
+
+
+@benchmark('memory')
+def bench_memory(args: argparse.Namespace):
+    import gc
+    import multiprocessing
+    import resource
+    import tracemalloc
+
+    class OldToken:
+
+        # 旧版Token: 没有__slots__, 每个实例带一个__dict__, 词法分析器每个token都新建一个
+
+        def __init__(self, typ, val):
+            self.__typ = typ
+            self.__val = val
+
+        @property
+        def typ(self): return self.__typ
+
+        @property
+        def val(self): return self.__val
+
+    class OldBinOp:
+
+        def __init__(self, left, op, right):
+            self.__left = left
+            self.__op = op
+            self.__right = right
+
+        @property
+        def left(self): return self.__left
+
+        @property
+        def op(self): return self.__op
+
+        @property
+        def right(self): return self.__right
+
+    class OldInteger:
+
+        def __init__(self, value):
+            self.__value = value
+
+        @property
+        def value(self): return self.__value
+
+    def parse_old(text: str):
+        # 输入只有字面量和加号, 按旧版Parser.expr的循环建树; 词法分析同样用RegexLexer, 只有节点和token的表示不同
+        lexer = RegexLexer(text)
+
+        def next_token():
+            token = lexer.get_next_token()
+            return OldToken(token.typ, token.val)
+
+        node = OldInteger(next_token())
+        token = next_token()
+        while token.typ == EToken.PLUS:
+            node = OldBinOp(node, token, OldInteger(next_token()))
+            token = next_token()
+        return node
+
+    def measure(parse: Callable[[str], object], text: str, conn):
+        # 在fork出的子进程里测, 前一种表示的峰值RSS不会算到后一种头上
+        gc.collect()
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        ast = parse(text)
+        seconds = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        del ast
+        gc.collect()
+
+        tracemalloc.start()
+        ast = parse(text)
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        conn.send((seconds, rss_after - rss_before, peak, blocks))
+        conn.close()
+
+    # 左深的加法链: 50万个字面量 + 约50万个BinOp, 共约100万个节点
+    text = '+'.join(str(i % 100) for i in range(500_000))
+    context = multiprocessing.get_context('fork')
+    for name, parse in (
+            ('dict-backed (old)', parse_old),
+            ('slots + interned', lambda text: Parser(RegexLexer(text)).parse()),
+    ):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=measure, args=(parse, text, sender))
+        process.start()
+        seconds, rss, peak, blocks = receiver.recv()
+        process.join()
+        print(f'{name:<24} parse {seconds * 1e3:6.0f} ms, 峰值RSS增长 {rss / 1024:6.1f} MB, '
+              f'tracemalloc峰值 {peak / 2 ** 20:6.1f} MB, 存活分配块 {blocks}')
+
+
+@benchmark('arena')
+def bench_arena(args: argparse.Namespace):
+    import tracemalloc
+
+    from arena import ArenaInterpreter, ArenaParser, AstArena
+
+    texts = exprs(args.count, args.depth)
+    expected = [tree_eval(text) for text in texts]
+    arenas = [ArenaParser(RegexLexer(text)).parse() for text in texts]
+    interpreter = ArenaInterpreter()
+    assert [interpreter.evaluate(arena) for arena in arenas] == expected
+    assert [interpreter.evaluate(AstArena.from_bytes(arena.to_bytes())) for arena in arenas] == expected
+    report('arena evaluate', timeit(lambda: [interpreter.evaluate(arena) for arena in arenas], args.repeat), len(texts))
+
+    text = '+'.join(str(i % 100) for i in range(500_000))
+    for name, parse in (
+            ('objects', lambda: Parser(RegexLexer(text)).parse()),
+            ('arena', lambda: ArenaParser(RegexLexer(text)).parse()),
+    ):
+        tracemalloc.start()
+        start = time.perf_counter()
+        tree = parse()
+        seconds = time.perf_counter() - start
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{name:<24} parse {seconds * 1e3:8.0f} ms, tracemalloc峰值 {peak / 2 ** 20:6.1f} MB, 存活分配块 {blocks}')
+        del tree
+    arena = ArenaParser(RegexLexer(text)).parse()
+    data = arena.to_bytes()
+    seconds = timeit(lambda: AstArena.from_bytes(data), args.repeat)
+    print(f'{"":<24} 序列化 {len(data) / 2 ** 20:.1f} MB, 反序列化 {seconds * 1e3:.1f} ms')
+    report('arena evaluate (1M)', timeit(lambda: interpreter.evaluate(arena), 1), 1)
+
+
+@benchmark('iterative')
+def bench_iterative(args: argparse.Namespace):
+    from iterative import IterativeInterpreter, IterativeParser
+
+    texts = exprs(args.count, args.depth)
+    expected = [tree_eval(text) for text in texts]
+    asts = [IterativeParser(RegexLexer(text)).parse() for text in texts]
+    evaluator = IterativeInterpreter()
+    assert [evaluator.evaluate(ast) for ast in asts] == expected
+
+    report('Parser', timeit(lambda: [Parser(RegexLexer(text)).parse() for text in texts], args.repeat), len(texts))
+    report('IterativeParser', timeit(lambda: [IterativeParser(RegexLexer(text)).parse() for text in texts], args.repeat), len(texts))
+    interpreter = Interpreter(None)
+    report('Interpreter.visit', timeit(lambda: [interpreter.visit(ast) for ast in asts], args.repeat), len(texts))
+    report('IterativeInterpreter', timeit(lambda: [evaluator.evaluate(ast) for ast in asts], args.repeat), len(texts))
+
+    for name, text in (
+            ('nested parens', '(' * 100_000 + '1' + '+1)' * 100_000),
+            ('left-deep chain', '-'.join(['1'] * 200_000)),
+    ):
+        seconds = timeit(lambda: evaluator.evaluate(IterativeParser(RegexLexer(text)).parse()), 1)
+        print(f'{name:<24} {seconds * 1e3:10.2f} ms')
+
+
+@benchmark('render')
+def bench_render(args: argparse.Namespace):
+    import contextlib
+    import io
+
+    from spi import InfixRenderer, PrefixRenderer, RpnRenderer
+
+    class PrintingInterpreter(Interpreter):
+
+        # 重现旧版Interpreter: 每访问一个节点就print一次
+
+        def visit_integer(self, node):
+            print(node.value.val, end='')
+            return super().visit_integer(node)
+
+        def visit_bin_op(self, node):
+            print(f'({node.op.val}', end='')
+            result = super().visit_bin_op(node)
+            print(')', end='')
+            return result
+
+    texts = exprs(args.count, args.depth)
+    asts = [Parser(RegexLexer(text)).parse() for text in texts]
+    for ast in asts:
+        again = Parser(Lexer(InfixRenderer().render(ast))).parse()
+        assert PrefixRenderer().render(again) == PrefixRenderer().render(ast)
+    printing = PrintingInterpreter(None)
+    interpreter = Interpreter(None)
+
+    def run_printing():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for ast in asts:
+                printing.visit(ast)
+
+    report('print per node (old)', timeit(run_printing, args.repeat), len(asts))
+    report('evaluate only', timeit(lambda: [interpreter.visit(ast) for ast in asts], args.repeat), len(asts))
+    for renderer in (PrefixRenderer(), InfixRenderer(), RpnRenderer()):
+        seconds = timeit(lambda: [renderer.render(ast) for ast in asts], args.repeat)
+        report(type(renderer).__name__, seconds, len(asts))
+
+
+@benchmark('stream')
+def bench_stream(args: argparse.Namespace):
+    import mmap
+    import tempfile
+    import tracemalloc
+
+    def count_tokens(lexer: Lexer) -> int:
+        count = 0
+        while lexer.get_next_token().typ != EToken.EOF:
+            count += 1
+        return count
+
+    # 约4MB的单条表达式写进临时文件, 以文件对象/mmap喂给Lexer, 只做词法分析不建树
+    line = '+'.join(spaced(random.Random(5), e) for e in exprs(100, 6, seed=5))
+    with tempfile.TemporaryFile('w+b') as f:
+        size = 0
+        while size < 4_000_000:
+            f.write(f'{line}+'.encode())
+            size += len(line) + 1
+        f.write(b'0\n')
+        f.flush()
+
+        sources = {
+            'file object': lambda: io.TextIOWrapper(f, encoding='utf-8', newline=''),
+            'mmap': lambda: mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ),
+        }
+        for name, open_source in sources.items():
+            for traced in (False, True):
+                f.seek(0)
+                source = open_source()
+                if traced:
+                    tracemalloc.start()
+                    count_tokens(Lexer(source))
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                else:
+                    start = time.perf_counter()
+                    count = count_tokens(Lexer(source))
+                    seconds = time.perf_counter() - start
+                if isinstance(source, io.TextIOWrapper):
+                    source.detach()
+                else:
+                    source.close()
+            print(f'{name:<24} {count} tokens, {size / seconds / 1e6:8.2f} MB/s, '
+                  f'tracemalloc峰值 {peak / 2 ** 20:.2f} MB')
+
+
+@benchmark('formula')
+def bench_formula(args: argparse.Namespace):
+    from pycompile import compile_formula
+    from vm import VM, compile_text
+
+    text = '(price * qty - discount) * (100 + tax) / 100 + shipping * (qty / 10 + 1)'
+    rng = random.Random(6)
+    rows = [
+        {'price': rng.randint(1, 1000), 'qty': rng.randint(1, 50), 'discount': rng.randint(0, 100),
+         'tax': rng.randint(0, 25), 'shipping': rng.randint(0, 20)}
+        for _ in range(args.count * 10)
+    ]
+    formula = compile_formula(text)
+    code = compile_text(text)
+    ast = Parser(Lexer(text)).parse()
+    interpreter = Interpreter(None)
+    vm = VM()
+
+    def run_reparse():
+        for row in rows:
+            Interpreter(Parser(Lexer(text)), row).interpret()
+
+    def run_tree():
+        for row in rows:
+            interpreter.env = row
+            interpreter.visit(ast)
+
+    expected = [Interpreter(Parser(Lexer(text)), row).interpret() for row in rows]
+    assert list(formula.evaluate_many(rows)) == expected
+    assert [vm.run(code, row) for row in rows] == expected
+    report('parse + interpret', timeit(run_reparse, 1), len(rows))
+    report('Interpreter (parsed once)', timeit(run_tree, args.repeat), len(rows))
+    report('VM (compiled once)', timeit(lambda: [vm.run(code, row) for row in rows], args.repeat), len(rows))
+    report('Formula.evaluate_many', timeit(lambda: list(formula.evaluate_many(rows)), args.repeat), len(rows))
+
+
+@benchmark('vectorized')
+def bench_vectorized(args: argparse.Namespace):
+    try:
+        import numpy as np
+    except ImportError:
+        print('需要安装numpy, 跳过')
+        return
+
+    from pycompile import compile_formula
+    from vectorized import evaluate_columns
+
+    text = '(a * b - c) / (d + 1) + a * 3 - b / 7'
+    formula = compile_formula(text)
+
+    rng = np.random.default_rng(7)
+    for exponent in range(3, 8):
+        n = 10 ** exponent
+        columns = {name: rng.integers(0, 1000, n) for name in 'abcd'}
+        seconds = timeit(lambda: evaluate_columns(text, columns), 1 if n >= 10 ** 6 else args.repeat)
+        report(f'numpy {n:.0e} rows', seconds, n)
+        # 标量路径最多跑1e5行, 更多的行按同样的速率外推
+        m = min(n, 10 ** 5)
+        sample = [{name: int(column[i]) for name, column in columns.items()} for i in range(m)]
+        seconds = timeit(lambda: list(formula.evaluate_many(sample)), 1) * n / m
+        report(f'Formula {n:.0e} rows', seconds, n)
+
+
+@benchmark('dag')
+def bench_dag(args: argparse.Namespace):
+    from dag import MemoInterpreter, share
+
+    # 生成含大量重复子表达式的公式: 每层都把上一层的结果用两次
+    rng = random.Random(8)
+    texts = []
+    for _ in range(args.count // 10 or 1):
+        text = f'(a+{rng.randint(1, 9)})'
+        for _ in range(args.depth + 4):
+            text = f'({text}*{text}-{text}/{rng.randint(1, 9)})'
+        texts.append(text)
+    env = {'a': 3}
+    asts = [Parser(RegexLexer(text)).parse() for text in texts]
+    shared = [share(ast) for ast in asts]
+    interpreter = Interpreter(None, env)
+    memo = MemoInterpreter(env=env)
+    assert [memo.evaluate(dag) for dag, _ in shared] == [interpreter.visit(ast) for ast in asts]
+    total = sum(stats.total for _, stats in shared)
+    unique = sum(stats.unique for _, stats in shared)
+    print(f'{"":<24} {total} 个节点 -> {unique} 个共享节点, 共享比例 {1 - unique / total:.2%}')
+    report('tree', timeit(lambda: [interpreter.visit(ast) for ast in asts], args.repeat), len(asts))
+    report('dag + memo', timeit(lambda: [memo.evaluate(dag) for dag, _ in shared], args.repeat), len(asts))
+    report('share', timeit(lambda: [share(ast) for ast in asts], args.repeat), len(asts))
+
+
+@benchmark('dispatch')
+def bench_dispatch(args: argparse.Namespace):
+    from cache import count_nodes
+    from spi import BinOp, NodeVisitor
+
+    class Counter(NodeVisitor):
+
+        def visit_integer(self, node):
+            return 1
+
+        def visit_var(self, node):
+            return 1
+
+        def visit_bin_op(self, node):
+            return self.visit(node.left) + self.visit(node.right) + 1
+
+    class GetattrCounter(Counter):
+
+        # 旧版NodeVisitor.visit: 每个节点拼一次方法名再getattr
+
+        def visit(self, node):
+            method = getattr(self, f'visit_{node.name()}', None)
+            if method:
+                return method(node)
+            raise RuntimeError
+
+    class OldInterpreter(Interpreter):
+
+        # 旧版visit_bin_op: 按运算符逐个if比较
+
+        def visit(self, node):
+            method = getattr(self, f'visit_{node.name()}', None)
+            if method:
+                return method(node)
+            raise RuntimeError
+
+        def visit_bin_op(self, node: BinOp) -> int:
+            if node.op.typ == EToken.PLUS:
+                return self.visit(node.left) + self.visit(node.right)
+            if node.op.typ == EToken.MINUS:
+                return self.visit(node.left) - self.visit(node.right)
+            if node.op.typ == EToken.MUL:
+                return self.visit(node.left) * self.visit(node.right)
+            if node.op.typ == EToken.DIV:
+                return self.visit(node.left) // self.visit(node.right)
+
+    texts = exprs(args.count, args.depth)
+    asts = [Parser(RegexLexer(text)).parse() for text in texts]
+    nodes = sum(count_nodes(ast) for ast in asts)
+    results = {}
+    for name, visitor in (
+            ('getattr dispatch', GetattrCounter()),
+            ('table dispatch', Counter()),
+            ('old Interpreter', OldInterpreter(None)),
+            ('Interpreter', Interpreter(None)),
+    ):
+        results[name] = [visitor.visit(ast) for ast in asts]
+        seconds = timeit(lambda: [visitor.visit(ast) for ast in asts], args.repeat)
+        print(f'{name:<24} {seconds * 1e3:10.2f} ms {seconds / nodes * 1e9:10.1f} ns/node')
+    assert results['getattr dispatch'] == results['table dispatch']
+    assert results['old Interpreter'] == results['Interpreter']
+
+
+@benchmark('profile')
+def bench_profile(args: argparse.Namespace):
+    from profiler import ProfileStats, profile
+
+    # 不开启分析时走的是原来的类, 和开启后的插桩版本对比开销
+    texts = exprs(args.count, args.depth)
+    plain = [tree_eval(text) for text in texts]
+    profiled = [profile(text)[0] for text in texts]
+    assert plain == profiled
+
+    total = ProfileStats()
+    for text in texts:
+        stats = profile(text)[1]
+        total.tokens += stats.tokens
+        total.nodes.update(stats.nodes)
+        total.visits.update(stats.visits)
+        total.parse_depth = max(total.parse_depth, stats.parse_depth)
+        total.eval_depth = max(total.eval_depth, stats.eval_depth)
+        for phase, seconds in stats.phases.items():
+            total.add_phase(phase, seconds)
+    print(total.format())
+
+    seconds = timeit(lambda: [tree_eval(text) for text in texts], args.repeat)
+    report('disabled', seconds, len(texts))
+    profiled_seconds = timeit(lambda: [profile(text) for text in texts], args.repeat)
+    report('enabled', profiled_seconds, len(texts))
+    print(f'overhead when enabled: {profiled_seconds / seconds:.2f}x')
+
+
+@benchmark('serialize')
+def bench_serialize(args: argparse.Namespace):
+    import os
+    import tempfile
+
+    from serialize import Library, dump, dumps, load, loads
+    from spi import PrefixRenderer
+
+    # 冷启动: 重新解析整个表达式库, 与从序列化格式加载对比
+    texts = exprs(args.count, args.depth)
+    library = {f'f{i}': text for i, text in enumerate(texts)}
+    data = dumps(library)
+    print(f'library: {len(texts)} 条, 文本 {sum(map(len, texts))} 字节, 序列化 {len(data)} 字节')
+
+    parsed = {name: Parser(Lexer(text)).parse() for name, text in library.items()}
+    render = lambda nodes: {name: PrefixRenderer().render(node) for name, node in nodes.items()}
+    assert render(loads(data)) == render(parsed)
+
+    fd, path = tempfile.mkstemp(suffix='.spil')
+    os.close(fd)
+    try:
+        dump(library, path)
+        assert render(load(path)) == render(parsed)
+        for name, func in (
+                ('reparse (Lexer)', lambda: {name: Parser(Lexer(text)).parse() for name, text in library.items()}),
+                ('reparse (RegexLexer)', lambda: {name: Parser(RegexLexer(text)).parse() for name, text in library.items()}),
+                ('loads (bytes)', lambda: loads(data)),
+                ('load (mmap)', lambda: load(path)),
+                ('Library index only', lambda: Library(data)),
+        ):
+            report(name, timeit(func, args.repeat), len(texts))
+    finally:
+        os.unlink(path)
+
+
+@benchmark('incremental')
+def bench_incremental(args: argparse.Namespace):
+    import sys
+
+    from incremental import CachedInterpreter, IncrementalParser
+
+    # 两个公式, 每次把一个非0数字改成另一个非0数字; 不改动0, 所以(...*0+k)形式的除数保持不变, 不会出现除以0
+    #   grouped  200个带括号的随机子表达式相加
+    #   flat     不带括号的乘积之和, 整棵树是一条左深的加法链, 只能靠按起点复用的term和链前缀
+    rng = random.Random(0)
+    formulas = (
+        ('grouped', '+'.join(f'({t})' for t in exprs(200, args.depth))),
+        ('flat', '+'.join(f'{rng.randint(1, 9)}*{rng.randint(1, 9)}' for _ in range(5000))),
+    )
+    # 左深的加法链递归求值需要的深度与项数成正比
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 50_000))
+    try:
+        for name, text in formulas:
+            positions = [i for i, c in enumerate(text) if c in '123456789']
+            edits = [(rng.choice(positions), rng.choice('123456789')) for _ in range(args.count // 10)]
+            print(f'{name}: {len(text)} 字符, {len(edits)} 次编辑')
+
+            def full():
+                current = text
+                results = []
+                for offset, inserted in edits:
+                    current = current[:offset] + inserted + current[offset + 1:]
+                    results.append(Interpreter(Parser(RegexLexer(current))).interpret())
+                return results
+
+            stats = {'relexed': 0, 'reused': 0, 'computed': 0}
+
+            def incremental():
+                parser = IncrementalParser(text)
+                interpreter = CachedInterpreter()
+                interpreter.evaluate(parser.ast)
+                results = []
+                for offset, inserted in edits:
+                    node = parser.edit(offset, 1, inserted)
+                    results.append(interpreter.evaluate(node))
+                    stats['relexed'] += parser.relexed
+                    stats['reused'] += parser.reused
+                    stats['computed'] += interpreter.computed
+                return results
+
+            assert full() == incremental()
+            n = len(edits)
+            print(f'每次编辑平均: 重新扫描 {stats["relexed"] / n:.1f} 个token, 复用 {stats["reused"] / n:.1f} 棵子树, '
+                  f'重新计算 {stats["computed"] / n:.1f} 个节点')
+
+            report(f'{name} full reparse + eval', timeit(full, args.repeat), n)
+            report(f'{name} incremental + cached', timeit(incremental, args.repeat), n)
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+@benchmark('literals')
+def bench_literals(args: argparse.Namespace):
+    # 旧版Lexer.integer: 每读一位数字就拼出一个新字符串, 总拷贝量是位数的平方
+    def concat_scan(text: str) -> str:
+        result = ''
+        for c in text:
+            result = f'{result}{c}'
+        return result
+
+    for digits in (10_000, 100_000, 1_000_000):
+        hex_text = '0x' + 'f' * digits
+        samples = (
+            ('hex', hex_text),
+            # 按块读入时字面量跨越多个块
+            ('hex 64K chunks', [hex_text[i:i + 65536] for i in range(0, len(hex_text), 65536)]),
+            ('decimal', '7' * digits),
+            ('decimal underscores', '_'.join(['7777'] * (digits // 4))),
+        )
+        for name, text in samples:
+            seconds = timeit(lambda: tokens(Lexer(text)), 1)
+            print(f'{name:<20} {digits:>9} 位 {seconds * 1e3:10.2f} ms {seconds / digits * 1e9:8.1f} ns/位')
+        if digits <= 100_000:
+            seconds = timeit(lambda: concat_scan('7' * digits), 1)
+            print(f'{"old concat scan":<20} {digits:>9} 位 {seconds * 1e3:10.2f} ms {seconds / digits * 1e9:8.1f} ns/位')
+
+
+@benchmark('resultcache')
+def bench_resultcache(args: argparse.Namespace):
+    import os
+    import tempfile
+
+    from resultcache import PersistentInterpreter, ResultCache
+
+    # 正文短但求值代价大的表达式: 随机表达式乘上32次8000位的x, 请求在其中有放回地抽取
+    rng = random.Random(5)
+    power = '*'.join(['x'] * 32)
+    library = [f'({text})*{power}' for text in exprs(args.count // 10 or 1, args.depth)]
+    texts = [rng.choice(library) for _ in range(args.count)]
+    env = {'x': (1 << 8000) - 1}
+    expected = [Interpreter(Parser(Lexer(text)), env).interpret() for text in texts]
+    directory = tempfile.mkdtemp(prefix='spi-')
+    path = os.path.join(directory, 'results.db')
+
+    def cached(cache: ResultCache) -> list[int]:
+        return [PersistentInterpreter(Parser(Lexer(text)), cache, env).interpret() for text in texts]
+
+    try:
+        report('no cache', timeit(lambda: [Interpreter(Parser(Lexer(text)), env).interpret() for text in texts], 1), len(texts))
+        for name, max_bytes in (('cold', 64 << 20), ('warm (reopened)', 64 << 20), ('quarter budget', None)):
+            if max_bytes is None:
+                # 只能放下约四分之一的不同结果
+                max_bytes = footprint // 4
+                os.unlink(path)
+            with ResultCache(path, max_bytes) as cache:
+                start = time.perf_counter()
+                assert cached(cache) == expected
+                report(name, time.perf_counter() - start, len(texts))
+                print(f'{"":<24} {cache.stats()}')
+                footprint = cache.bytes
+    finally:
+        for name in os.listdir(directory):
+            os.unlink(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+@benchmark('canonical')
+def bench_canonical(args: argparse.Namespace):
+    from cache import ParseCache
+    from canonical import fingerprint, source_key
+
+    # 同一条表达式加上不同的空白, 按原文和按source_key缓存的命中率
+    rng = random.Random(6)
+    library = exprs(args.count // 10 or 1, args.depth)
+    texts = [spaced(rng, rng.choice(library)) for _ in range(args.count)]
+    for name, key in (('text key', None), ('source_key', source_key)):
+        cache = ParseCache(key=key)
+        report(f'parse cache ({name})', timeit(lambda: [cache.get(text) for text in texts], 1), len(texts))
+        print(f'{"":<24} {cache.stats()}')
+
+    # 线性: 节点数翻倍, 时间也只翻倍
+    for n in (50_000, 100_000, 200_000):
+        ast = Parser(RegexLexer('+'.join(f'x{i % 7}*{i}' for i in range(n)))).parse()
+        seconds = timeit(lambda: fingerprint(ast, True), args.repeat)
+        print(f'{"fingerprint":<24} {4 * n - 1:>9} 个节点 {seconds * 1e3:10.2f} ms {seconds / (4 * n - 1) * 1e9:8.1f} ns/节点')
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog='bench')
+    parser.add_argument('names', nargs='*', metavar='name', help=', '.join(BENCHMARKS))
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--depth', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f'未知的benchmark: {name}')
+    for name in args.names or BENCHMARKS:
+        print(f'== {name}')
+        BENCHMARKS[name](args)
+
+
+if __name__ == '__main__':
+    main()
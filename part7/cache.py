@@ -0,0 +1,134 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from spi import AstNode, BinOp, EToken, Integer, Lexer, Parser, Token
+from vm import Code
+
+
+def parse(text: str) -> AstNode:
+    return Parser(Lexer(text)).parse()
+
+
+def count_nodes(node: AstNode) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if isinstance(node, BinOp):
+            stack.append(node.left)
+            stack.append(node.right)
+    return count
+
+
+# 估算单个节点占用的字节数: 运算符token是共享的, 只有字面量节点各自持有Token
+NODE_BYTES: int = max(
+    sys.getsizeof(BinOp(None, None, None)),
+    sys.getsizeof(Integer(None)) + sys.getsizeof(Token(EToken.INTEGER, 0)),
+)
+
+
+def estimate_size(text: str, value: object) -> int:
+    size = sys.getsizeof(text)
+    if isinstance(value, AstNode):
+        return size + count_nodes(value) * NODE_BYTES
+    if isinstance(value, Code):
+        return size + sys.getsizeof(value.ops) + sys.getsizeof(value.args) + sys.getsizeof(value.consts)
+    return size + sys.getsizeof(value)
+
+
+class ParseCache:
+
+    def __init__(
+            self,
+            compile: Callable[[str], object] = parse,
+            max_entries: int = 4096,
+            max_bytes: int | None = None,
+            sizeof: Callable[[str, object], int] = estimate_size,
+            key: Callable[[str], str] | None = None
+    ):
+        if max_entries <= 0:
+            raise ValueError('max_entries必须大于0')
+        self.__compile = compile
+        self.__max_entries = max_entries
+        self.__max_bytes = max_bytes
+        self.__sizeof = sizeof
+        # 文本先经过key再查表, 例如canonical.source_key, 只差空白的文本共用一项
+        self.__key = key
+
+        self.__lock = threading.Lock()
+        self.__entries: OrderedDict[str, tuple[object, int]] = OrderedDict()
+        self.__bytes = 0
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    @property
+    def hits(self) -> int: return self.__hits
+
+    @property
+    def misses(self) -> int: return self.__misses
+
+    @property
+    def evictions(self) -> int: return self.__evictions
+
+    @property
+    def bytes(self) -> int: return self.__bytes
+
+    def __len__(self) -> int: return len(self.__entries)
+
+    def __contains__(self, text: str) -> bool:
+        return (text if self.__key is None else self.__key(text)) in self.__entries
+
+    def stats(self) -> dict[str, int]:
+        with self.__lock:
+            return {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'evictions': self.__evictions,
+                'entries': len(self.__entries),
+                'bytes': self.__bytes,
+            }
+
+    def get(self, text: str) -> object:
+        key = text if self.__key is None else self.__key(text)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+                self.__hits += 1
+                return entry[0]
+            self.__misses += 1
+
+        # 解析放在锁外, 不同线程解析不同表达式时互不阻塞; 解析失败的表达式不进缓存
+        value = self.__compile(text)
+        size = self.__sizeof(text, value)
+        if self.__max_bytes is not None and size > self.__max_bytes:
+            return value
+
+        with self.__lock:
+            old = self.__entries.pop(key, None)
+            if old is not None:
+                self.__bytes -= old[1]
+            self.__entries[key] = (value, size)
+            self.__bytes += size
+            self.__evict()
+        return value
+
+    def __evict(self):
+        while len(self.__entries) > self.__max_entries or (
+                self.__max_bytes is not None and self.__bytes > self.__max_bytes
+        ):
+            _, (_, size) = self.__entries.popitem(last=False)
+            self.__bytes -= size
+            self.__evictions += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def __repr__(self) -> str: return f'ParseCache({self.stats()})'
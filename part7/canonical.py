@@ -0,0 +1,110 @@
+import hashlib
+import re
+
+from spi import AstNode, BinOp, EToken, Integer, InfixRenderer, Var
+
+# AST的结构指纹和规范形式
+#
+# AST里本来就没有括号节点, 1+2, 1 + 2, (1+2), ((1))+(2)解析出的树结构相同, 指纹也相同
+# 每个节点的指纹只由节点类型和子节点的定长指纹算出, 每个节点常数时间(字面量与其字节数成正比),
+# 整棵树按后序一次遍历, 总时间与树的大小成线性, 用显式栈不受嵌套深度限制
+#
+# commutative=True时, 加法和乘法的两个操作数按指纹排序, a+b和b+a得到相同的指纹和规范形式
+# 整数的加法和乘法满足交换律, 结果不变; 但求值顺序会变, 两边都出错时报出的可能是另一个错误,
+# 所以只适合作为结果缓存这类只缓存成功结果的键
+
+DIGEST_SIZE = 16
+
+# 各类节点的标记字节互不相同, 不同类型的节点即使其余字节相同也不会得到相同的指纹
+OP_TAGS: dict[EToken, bytes] = {
+    EToken.PLUS: b'+',
+    EToken.MINUS: b'-',
+    EToken.MUL: b'*',
+    EToken.DIV: b'/',
+}
+INTEGER_TAG = b'i'
+VAR_TAG = b'v'
+
+COMMUTATIVE = frozenset((EToken.PLUS, EToken.MUL))
+
+# 夹在两个单词字符(数字, 变量名)之间的空白会分隔token, 只能压成一个空格, 其余的空白都可以去掉
+# 第一个分支只在一段空白的开头尝试, 不匹配时由第二个分支整段吃掉, 总体仍是一遍线性扫描
+SPACE_RE = re.compile(r'(?<=\w)(\s+)(?=\w)|\s+')
+
+
+def source_key(text: str) -> str:
+    # 不解析, 只去掉不影响token划分的空白, 用作按文本缓存时的键: '1 + 2'和'1+2'得到同一个键, '1 2'和'12'不同
+    return SPACE_RE.sub(lambda m: ' ' if m.group(1) else '', text)
+
+
+class Canonicalizer:
+
+    # names记录遇到的变量名, 按第一次出现的顺序; 同一个Canonicalizer可以处理多棵树
+
+    def __init__(
+            self,
+            commutative: bool = False
+    ):
+        self.__commutative = commutative
+        self.__names: dict[str, None] = {}
+
+    @property
+    def commutative(self) -> bool: return self.__commutative
+
+    @property
+    def names(self) -> tuple[str, ...]: return tuple(self.__names)
+
+    def fingerprint(self, node: AstNode) -> bytes:
+        return self.__walk(node, False)[0]
+
+    def normalize(self, node: AstNode) -> AstNode:
+        # 没有变化的子树原样复用, 不复制
+        return self.__walk(node, True)[1]
+
+    def __walk(self, node: AstNode, rebuild: bool) -> tuple[bytes, AstNode]:
+        blake2b = hashlib.blake2b
+        commutative = self.__commutative
+        results: list[tuple[bytes, AstNode]] = []
+        stack: list[tuple[AstNode, bool]] = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            cls = type(node)
+            if cls is BinOp:
+                if not expanded:
+                    stack.append((node, True))
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+                    continue
+                right = results.pop()
+                left = results.pop()
+                typ = node.op.typ
+                if commutative and typ in COMMUTATIVE and right[0] < left[0]:
+                    left, right = right, left
+                digest = blake2b(OP_TAGS[typ] + left[0] + right[0], digest_size=DIGEST_SIZE).digest()
+                if rebuild and (left[1] is not node.left or right[1] is not node.right):
+                    node = BinOp(left[1], node.op, right[1])
+            elif cls is Integer:
+                value = node.value.val
+                raw = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+                digest = blake2b(INTEGER_TAG + raw, digest_size=DIGEST_SIZE).digest()
+            elif cls is Var:
+                name = node.value.val
+                self.__names[name] = None
+                digest = blake2b(VAR_TAG + name.encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+            else:
+                raise TypeError(f'不支持的节点: {node.name()}')
+            results.append((digest, node))
+        return results[-1]
+
+
+def fingerprint(node: AstNode, commutative: bool = False) -> bytes:
+    return Canonicalizer(commutative).fingerprint(node)
+
+
+def normalize(node: AstNode, commutative: bool = False) -> AstNode:
+    return Canonicalizer(commutative).normalize(node)
+
+
+def canonical_text(node: AstNode, commutative: bool = False) -> str:
+    # 规范形式的中缀文本, 只保留优先级和结合性需要的括号
+    return InfixRenderer().render(normalize(node, commutative))
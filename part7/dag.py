@@ -0,0 +1,105 @@
+from typing import Mapping
+
+from spi import AstNode, BinOp, Integer, Interpreter, Parser, Var
+
+
+class SharingStats:
+
+    def __init__(
+            self,
+            total: int,
+            unique: int
+    ):
+        self.__total = total
+        self.__unique = unique
+
+    @property
+    def total(self) -> int: return self.__total
+
+    @property
+    def unique(self) -> int: return self.__unique
+
+    @property
+    def ratio(self) -> float: return 0.0 if self.__total == 0 else 1 - self.__unique / self.__total
+
+    def __repr__(self) -> str: return f'SharingStats(total={self.total}, unique={self.unique}, ratio={self.ratio:.1%})'
+
+
+class HashConser:
+
+    # 相同结构的子树只保留一个节点: 叶子按值/变量名, BinOp按(运算符, 左子节点, 右子节点)查表
+    # 子节点已经是共享后的节点, 所以用id做键就足够, 表本身持有节点保证id不会被复用
+    # 同一个HashConser可以处理多棵树, 它们之间的公共子树也会被共享
+
+    def __init__(self):
+        self.__table: dict[tuple, AstNode] = {}
+
+    def __len__(self) -> int: return len(self.__table)
+
+    def share(self, node: AstNode) -> tuple[AstNode, SharingStats]:
+        table = self.__table
+        total = 0
+        seen: set[int] = set()
+        results: list[AstNode] = []
+        stack: list[tuple[AstNode, bool]] = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if isinstance(node, BinOp) and not expanded:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+                continue
+            total += 1
+            if isinstance(node, BinOp):
+                right = results.pop()
+                left = results.pop()
+                key = (node.op.typ, id(left), id(right))
+            elif isinstance(node, Integer):
+                key = (Integer, node.value.val)
+            elif isinstance(node, Var):
+                key = (Var, node.value.val)
+            else:
+                raise TypeError(f'不支持的节点: {node.name()}')
+            shared = table.get(key)
+            if shared is None:
+                if isinstance(node, BinOp) and (left is not node.left or right is not node.right):
+                    node = BinOp(left, node.op, right)
+                shared = table[key] = node
+            seen.add(id(shared))
+            results.append(shared)
+        return results[-1], SharingStats(total, len(seen))
+
+
+def share(node: AstNode) -> tuple[AstNode, SharingStats]:
+    return HashConser().share(node)
+
+
+class MemoInterpreter(Interpreter):
+
+    # 在一次evaluate内按节点缓存结果, 共享的子树只算一次
+    # 缓存按id记录, 只在evaluate期间有效, 结束后立即丢弃, 不会被之后复用的id误命中
+
+    def __init__(
+            self,
+            parser: Parser | None = None,
+            env: Mapping[str, int] | None = None
+    ):
+        super().__init__(parser, env)
+        self.__memo: dict[int, int] | None = None
+
+    def visit(self, node: AstNode) -> int:
+        memo = self.__memo
+        if memo is None:
+            return super().visit(node)
+        key = id(node)
+        if key in memo:
+            return memo[key]
+        value = memo[key] = super().visit(node)
+        return value
+
+    def evaluate(self, node: AstNode) -> int:
+        self.__memo = {}
+        try:
+            return self.visit(node)
+        finally:
+            self.__memo = None
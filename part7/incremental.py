@@ -0,0 +1,318 @@
+import bisect
+from typing import Callable, Mapping
+
+from spi import AstNode, BinOp, EToken, Integer, Interpreter, ParseError, RegexLexer, Token, Var, integer_token, parse_integer, position
+
+# 增量解析: 保留上一次的token流(带字符偏移)和解析过程中产生的子树
+#
+# 重新词法分析: 从编辑位置之前最后一个完整token的末尾开始, 边扫描边和旧token对齐,
+#   一旦某个新token和编辑区之后的旧token起止位置(平移后)相同, 之后的token直接沿用
+# 重新语法分析: factor/term/expr在某个token下标处的解析结果只取决于从这里开始的token,
+#   所以按起点记下每一层的结果, 编辑后仍然有效的直接复用:
+#   factors  起点 -> (token数, 节点), 字面量, 变量和整个括号组
+#   terms    起点 -> (各中间结果的token数, 各中间结果), 左结合的乘除链, 每多吃一个操作数记一项
+#   exprs    同上, 加减链
+#   链上第k项之后的token决定了最后一个操作数在哪里结束, 所以只有这个token也在编辑区之前时第k项才有效;
+#   整条链都在编辑区之后的原样平移. 左结合的链从编辑区之前的最长有效前缀接着往后解析,
+#   编辑区之后的操作数本身仍然复用, 只有编辑点的各层祖先是新建的节点
+# 复用的子树保持原来的对象身份, CachedInterpreter据此只计算新建的节点
+
+TOKEN_RE = RegexLexer.TOKEN_RE
+OPERATORS = RegexLexer.OPERATORS
+
+
+def scan(text: str, pos: int):
+    # 逐个产生(token, 起点, 终点); 非法字符产生None, 由解析器报错
+    match = TOKEN_RE.match
+    while True:
+        m = match(text, pos)
+        if m is None:
+            return
+        pos = m.end()
+        group = m.lastindex
+        if group == 1:
+            value = parse_integer(m.group(1))
+            yield None if value is None else integer_token(value), m.start(1), pos
+        elif group == 2:
+            yield Token(EToken.ID, m.group(2)), m.start(2), pos
+        elif group == 3:
+            yield OPERATORS[m.group(3)], m.start(3), pos
+        else:
+            yield None, m.start(4), pos
+
+
+class IncrementalParser:
+
+    # 文本不合法时不抛出异常, error记下最近一次解析的错误, ast为None; token流和已解析的子树照常保留,
+    # 之后的编辑可以把它改成合法的表达式
+
+    def __init__(
+            self,
+            text: str
+    ):
+        self.__text = text
+        self.__tokens: list[Token | None] = []
+        self.__starts: list[int] = []
+        self.__ends: list[int] = []
+        for token, start, end in scan(text, 0):
+            self.__tokens.append(token)
+            self.__starts.append(start)
+            self.__ends.append(end)
+        self.__factors: dict[int, tuple[int, AstNode]] = {}
+        self.__terms: dict[int, tuple[list[int], list[AstNode]]] = {}
+        self.__exprs: dict[int, tuple[list[int], list[AstNode]]] = {}
+        self.__pos = 0
+        self.__reused = 0
+        self.__relexed = len(self.__tokens)
+        self.__error: ParseError | None = None
+        self.__ast: AstNode | None = self.__parse_all()
+
+    @property
+    def text(self) -> str: return self.__text
+
+    @property
+    def tokens(self) -> list[Token | None]: return self.__tokens
+
+    @property
+    def ast(self) -> AstNode | None: return self.__ast
+
+    @property
+    def error(self) -> ParseError | None: return self.__error
+
+    @property
+    def relexed(self) -> int: return self.__relexed
+
+    @property
+    def reused(self) -> int: return self.__reused
+
+    def span(self, index: int) -> tuple[int, int]:
+        return self.__starts[index], self.__ends[index]
+
+    def group_span(self, node: AstNode) -> tuple[int, int] | None:
+        # 带括号的子表达式在原文中的范围(含括号)
+        for start, (length, group) in self.__factors.items():
+            if group is node and self.__tokens[start].typ == EToken.LPAREN:
+                return self.__starts[start], self.__ends[start + length - 1]
+        return None
+
+    def edit(self, offset: int, removed: int, inserted: str) -> AstNode | None:
+        text = self.__text
+        if not 0 <= offset <= offset + removed <= len(text):
+            raise ValueError(f'编辑范围越界: {offset}+{removed}')
+        new_text = self.__text = text[:offset] + inserted + text[offset + removed:]
+        delta = len(inserted) - removed
+        tokens, starts, ends = self.__tokens, self.__starts, self.__ends
+
+        # 末尾恰好落在offset的token也可能和插入的文本连成一个token, 从它开始重新扫描
+        first = bisect.bisect_left(ends, offset)
+        pos = ends[first - 1] if first > 0 else 0
+        # 编辑区之后的旧token, 平移delta后用来对齐
+        old = bisect.bisect_left(starts, offset + removed)
+        edit_end = offset + len(inserted)
+        new_tokens: list[Token | None] = []
+        new_starts: list[int] = []
+        new_ends: list[int] = []
+        resync = len(tokens)
+        for token, start, end in scan(new_text, pos):
+            if start >= edit_end:
+                while old < len(tokens) and starts[old] + delta < start:
+                    old += 1
+                if old < len(tokens) and starts[old] + delta == start and ends[old] + delta == end:
+                    resync = old
+                    break
+            new_tokens.append(token)
+            new_starts.append(start)
+            new_ends.append(end)
+
+        # 旧token [first, resync) 被替换为新扫描出的token
+        shift = len(new_tokens) - (resync - first)
+        tokens[first:] = new_tokens + tokens[resync:]
+        starts[first:] = new_starts + [s + delta for s in starts[resync:]]
+        ends[first:] = new_ends + [e + delta for e in ends[resync:]]
+        self.__relexed = len(new_tokens)
+
+        # factor只看自己的token, 结束在first之前即可; 链上的项还要看紧随其后的一个token
+        # 长度都相对起点保存, 编辑区之后的项只需要平移键; 逐项比较只用到推导式, 不逐项新建元组
+        factors = self.__factors
+        if shift:
+            factors = self.__factors = {
+                start if start < first else start + shift: entry
+                for start, entry in factors.items() if start >= resync or start + entry[0] <= first
+            }
+        else:
+            for start in [start for start, entry in factors.items() if start < resync and start + entry[0] > first]:
+                del factors[start]
+        self.__terms = self.__keep(self.__terms, first, resync, shift)
+        self.__exprs = self.__keep(self.__exprs, first, resync, shift)
+        self.__ast = None
+        self.__ast = self.__parse_all()
+        return self.__ast
+
+    @staticmethod
+    def __keep(
+            chains: dict[int, tuple[list[int], list[AstNode]]],
+            first: int,
+            resync: int,
+            shift: int
+    ) -> dict[int, tuple[list[int], list[AstNode]]]:
+        # 平移后编辑区之后的链已经挪走, 剩下要处理的都在bound之前
+        bound = resync
+        if shift:
+            chains = {
+                start if start < first else start + shift: entry
+                for start, entry in chains.items() if start >= resync or start < first
+            }
+            bound = first
+        # 起点在编辑区内的链丢弃, 跨过编辑区的链截到仍然有效的最长前缀
+        for start in [start for start, entry in chains.items() if start < bound and start + entry[0][-1] >= first]:
+            if start >= first:
+                del chains[start]
+                continue
+            lengths, nodes = chains[start]
+            valid = bisect.bisect_left(lengths, first - start)
+            if valid:
+                chains[start] = (lengths[:valid], nodes[:valid])
+            else:
+                del chains[start]
+        return chains
+
+    def __parse_all(self) -> AstNode | None:
+        # 表里已有的结果都对当前的token流有效, 解析时直接复用, 新解析出的也加进去;
+        # 即使这次解析失败, 表里的内容对下一次编辑依然有效
+        self.__pos = 0
+        self.__reused = 0
+        self.__error = None
+        try:
+            node = self.expr()
+            if self.__pos != len(self.__tokens):
+                self.__fail()
+        except ParseError as e:
+            self.__error = e
+            return None
+        return node
+
+    def __fail(self):
+        pos = self.__pos
+        offset = self.__starts[pos] if pos < len(self.__starts) else len(self.__text)
+        raise ParseError(offset, *position(self.__text, offset))
+
+    def __peek(self) -> EToken | None:
+        if self.__pos < len(self.__tokens):
+            token = self.__tokens[self.__pos]
+            return None if token is None else token.typ
+        return EToken.EOF
+
+    def factor(self) -> AstNode:
+        pos = self.__pos
+        reused = self.__factors.get(pos)
+        if reused is not None:
+            length, node = reused
+            self.__pos = pos + length
+            self.__reused += 1
+            return node
+        typ = self.__peek()
+        if typ == EToken.INTEGER:
+            node = Integer(self.__tokens[pos])
+        elif typ == EToken.ID:
+            node = Var(self.__tokens[pos])
+        elif typ == EToken.LPAREN:
+            self.__pos += 1
+            node = self.expr()
+            if self.__peek() != EToken.RPAREN:
+                self.__fail()
+        else:
+            self.__fail()
+        self.__pos += 1
+        self.__factors[pos] = (self.__pos - pos, node)
+        return node
+
+    def __chain(
+            self,
+            chains: dict[int, tuple[list[int], list[AstNode]]],
+            operand: Callable[[], AstNode],
+            operators: tuple[EToken, EToken]
+    ) -> AstNode:
+        start = self.__pos
+        chain = chains.get(start)
+        if chain is not None:
+            # 从仍然有效的最长前缀接着解析, 新的中间结果追加在同一条链上
+            lengths, nodes = chain
+            self.__pos = start + lengths[-1]
+            node = nodes[-1]
+            self.__reused += 1
+        else:
+            lengths, nodes = [], []
+            node = operand()
+        while self.__peek() in operators:
+            op = self.__tokens[self.__pos]
+            self.__pos += 1
+            node = BinOp(node, op, operand())
+            lengths.append(self.__pos - start)
+            nodes.append(node)
+            if chain is None:
+                chain = chains[start] = (lengths, nodes)
+        return node
+
+    def term(self) -> AstNode:
+        return self.__chain(self.__terms, self.factor, (EToken.MUL, EToken.DIV))
+
+    def expr(self) -> AstNode:
+        return self.__chain(self.__exprs, self.term, (EToken.PLUS, EToken.MINUS))
+
+
+class CachedInterpreter(Interpreter):
+
+    # 跨多次evaluate按节点身份缓存结果; 缓存同时持有节点, 保证id不会被新节点复用
+    # 增量解析复用的子树直接命中, 只有新建的节点需要计算
+    # 缓存超过当前树节点数的两倍时, 遍历当前树丢弃不再可达的节点
+
+    def __init__(
+            self,
+            env: Mapping[str, int] | None = None
+    ):
+        super().__init__(None, env)
+        self.__memo: dict[int, tuple[AstNode, int]] = {}
+        self.__live = 0
+        self.__computed = 0
+
+    @property
+    def env(self) -> Mapping[str, int]: return Interpreter.env.fget(self)
+
+    @env.setter
+    def env(self, env: Mapping[str, int]):
+        Interpreter.env.fset(self, env)
+        self.__memo.clear()
+
+    @property
+    def computed(self) -> int: return self.__computed
+
+    def visit(self, node: AstNode) -> int:
+        cached = self.__memo.get(id(node))
+        if cached is not None:
+            return cached[1]
+        value = super().visit(node)
+        self.__memo[id(node)] = (node, value)
+        self.__computed += 1
+        return value
+
+    def evaluate(self, node: AstNode) -> int:
+        self.__computed = 0
+        value = self.visit(node)
+        if len(self.__memo) > 2 * self.__live:
+            self.__prune(node)
+        return value
+
+    def __prune(self, root: AstNode):
+        memo = self.__memo
+        kept: dict[int, tuple[AstNode, int]] = {}
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            entry = memo.get(id(node))
+            if entry is not None:
+                kept[id(node)] = entry
+            if isinstance(node, BinOp):
+                stack.append(node.right)
+                stack.append(node.left)
+        self.__memo = kept
+        self.__live = len(kept)
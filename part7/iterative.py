@@ -0,0 +1,104 @@
+from typing import Mapping
+
+from spi import BIN_OPS, AstNode, BinOp, EToken, Integer, Lexer, PRECEDENCE, RegexLexer, Token, Var
+
+
+class IterativeParser:
+
+    def __init__(
+            self,
+            lexer: Lexer | RegexLexer
+    ):
+        self.__lexer = lexer
+
+    def parse(self) -> AstNode:
+        # 调度场算法: operands存已建好的子树, ops存还没归约的运算符和左括号
+        # 括号嵌套多深都只占用这两个列表, 不占Python栈帧
+        get_next_token = self.__lexer.get_next_token
+        operands: list[AstNode] = []
+        ops: list[Token] = []
+        depth = 0
+
+        def reduce():
+            right = operands.pop()
+            operands[-1] = BinOp(operands[-1], ops.pop(), right)
+
+        while True:
+            token = get_next_token()
+            typ = token.typ
+            if typ == EToken.INTEGER:
+                operands.append(Integer(token))
+            elif typ == EToken.ID:
+                operands.append(Var(token))
+            elif typ == EToken.LPAREN:
+                ops.append(token)
+                depth += 1
+                continue
+            else:
+                self.__lexer.error()
+
+            # 读完一个操作数, 接下来应当是运算符或右括号
+            while True:
+                token = get_next_token()
+                typ = token.typ
+                if typ == EToken.RPAREN and depth > 0:
+                    while ops[-1].typ != EToken.LPAREN:
+                        reduce()
+                    ops.pop()
+                    depth -= 1
+                    continue
+                break
+
+            prec = PRECEDENCE.get(typ)
+            if prec is None:
+                # 和递归下降一样, 遇到无法继续的token就结束
+                break
+            while ops and ops[-1].typ != EToken.LPAREN and PRECEDENCE[ops[-1].typ] >= prec:
+                reduce()
+            ops.append(token)
+
+        if depth > 0:
+            self.__lexer.error()
+        while ops:
+            reduce()
+        return operands[-1]
+
+
+class IterativeInterpreter:
+
+    def __init__(
+            self,
+            env: Mapping[str, int] | None = None
+    ):
+        self.env = {} if env is None else env
+
+    def evaluate(self, node: AstNode) -> int:
+        # 显式栈做后序遍历: 弹出BinOp时压入它的运算符token和左右子树, 弹出token时归约
+        funcs = BIN_OPS
+        env = self.env
+        stack: list[AstNode | Token] = [node]
+        push = stack.append
+        pop = stack.pop
+        values: list[int] = []
+        while stack:
+            item = pop()
+            cls = type(item)
+            if cls is Integer:
+                values.append(item.value.val)
+            elif cls is BinOp:
+                push(item.op)
+                push(item.right)
+                push(item.left)
+            elif cls is Var:
+                try:
+                    values.append(env[item.value.val])
+                except KeyError:
+                    raise NameError(f'未定义的变量: {item.value.val}') from None
+            else:
+                right = values.pop()
+                values[-1] = funcs[item.typ](values[-1], right)
+        return values[-1]
+
+
+def evaluate(text: str, env: Mapping[str, int] | None = None) -> int:
+    return IterativeInterpreter(env).evaluate(IterativeParser(Lexer(text)).parse())
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import tempfile
+import time
+
+from server import evaluate_text
+from testsupport import exprs
+
+# 对spi.py serve施加负载: 每个连接按流水线方式保持window条在途请求, 记录每条请求从发出到收到回复的延迟
+
+
+async def connect(args: argparse.Namespace) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    if args.unix:
+        return await asyncio.open_unix_connection(args.unix, limit=1 << 20)
+    return await asyncio.open_connection(args.host, args.port, limit=1 << 20)
+
+
+async def client(args: argparse.Namespace, texts: list[str], expected: list[str] | None) -> list[float]:
+    reader, writer = await connect(args)
+    window = asyncio.Semaphore(args.window)
+    sent: collections.deque[float] = collections.deque()
+    latencies: list[float] = []
+
+    async def send():
+        for text in texts:
+            await window.acquire()
+            sent.append(time.perf_counter())
+            writer.write(f'{text}\n'.encode())
+            await writer.drain()
+
+    sender = asyncio.create_task(send())
+    for i in range(len(texts)):
+        line = await reader.readline()
+        latencies.append(time.perf_counter() - sent.popleft())
+        window.release()
+        if not line:
+            raise ConnectionError('服务端提前关闭了连接')
+        if expected is not None and line.decode().rstrip('\n') != expected[i]:
+            raise AssertionError(f'第{i + 1}条结果不符: {texts[i]!r} -> {line!r}, 应为 {expected[i]!r}')
+    await sender
+    writer.close()
+    await writer.wait_closed()
+    return latencies
+
+
+def percentile(values: list[float], p: float) -> float:
+    # 最近秩法, values已排序
+    index = max(0, min(len(values) - 1, round(p / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+async def run(args: argparse.Namespace) -> dict[str, float]:
+    texts = exprs(args.requests, args.depth, args.seed)
+    expected = [evaluate_text(text) for text in texts] if args.check else None
+    start = time.perf_counter()
+    results = await asyncio.gather(*(client(args, texts, expected) for _ in range(args.connections)))
+    seconds = time.perf_counter() - start
+    latencies = sorted(latency for result in results for latency in result)
+    return {
+        'requests': len(latencies),
+        'seconds': seconds,
+        'throughput': len(latencies) / seconds,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'max': latencies[-1],
+    }
+
+
+async def spawn(args: argparse.Namespace) -> asyncio.subprocess.Process:
+    # 在临时目录的Unix域套接字上起一个服务进程, 等套接字出现后再开始压测
+    args.unix = os.path.join(tempfile.mkdtemp(prefix='spi-'), 'spi.sock')
+    spi = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spi.py')
+    command = [sys.executable, spi, 'serve', '--unix', args.unix, *args.server_args]
+    process = await asyncio.create_subprocess_exec(*command)
+    while not os.path.exists(args.unix):
+        if process.returncode is not None:
+            raise RuntimeError('服务进程启动失败')
+        await asyncio.sleep(0.05)
+    return process
+
+
+async def main_async(args: argparse.Namespace):
+    process = await spawn(args) if args.spawn else None
+    try:
+        stats = await run(args)
+    finally:
+        if process is not None:
+            process.terminate()
+            await process.wait()
+            if os.path.exists(args.unix):
+                os.unlink(args.unix)
+            os.rmdir(os.path.dirname(args.unix))
+    print(f'connections: {args.connections}, window: {args.window}, depth: {args.depth}')
+    print(f'requests: {stats["requests"]}, {stats["seconds"]:.2f} s, {stats["throughput"]:.0f} req/s')
+    print(f'latency p50: {stats["p50"] * 1e3:.2f} ms, p99: {stats["p99"] * 1e3:.2f} ms, max: {stats["max"] * 1e3:.2f} ms')
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog='loadgen', description='对spi.py serve压测, 输出吞吐量和p50/p99延迟')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH', help='连接Unix域套接字, 指定后忽略--host/--port')
+    parser.add_argument('--spawn', action='store_true', help='自己在临时Unix域套接字上启动服务, 压测结束后关闭')
+    parser.add_argument('-c', '--connections', type=int, default=8)
+    parser.add_argument('-n', '--requests', type=int, default=2000, help='每个连接发送的请求数')
+    parser.add_argument('--window', type=int, default=32, help='每个连接的在途请求数')
+    parser.add_argument('--depth', type=int, default=8, help='随机表达式的最大嵌套深度')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check', action='store_true', help='与本地求值结果逐条比对')
+    parser.add_argument('server_args', nargs='*', help='--spawn时传给spi.py serve的参数, 写在--之后')
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+from typing import Mapping
+
+from spi import AstNode, BinOp, EToken, Integer, NodeVisitor, Var, integer_token
+
+
+def integer(value: int) -> Integer:
+    return Integer(integer_token(value))
+
+
+def literal(node: AstNode) -> int | None:
+    return node.value.val if isinstance(node, Integer) else None
+
+
+def cannot_raise(node: AstNode, env: Mapping[str, int] | None = None) -> bool:
+    # 除数不是非零常量的除法可能抛ZeroDivisionError, env中没有绑定的变量可能抛NameError
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Var):
+            if env is None or node.value.val not in env:
+                return False
+        elif isinstance(node, BinOp):
+            if node.op.typ == EToken.DIV and not literal(node.right):
+                return False
+            stack.append(node.left)
+            stack.append(node.right)
+    return True
+
+
+class ConstantFolder(NodeVisitor):
+
+    # env只用来判断变量是否有绑定, 变量不会被替换成它的值
+
+    def __init__(
+            self,
+            env: Mapping[str, int] | None = None
+    ):
+        self.__env = env
+        self.__folded = 0
+
+    @property
+    def folded(self) -> int: return self.__folded
+
+    def visit_integer(self, node: Integer) -> AstNode:
+        return node
+
+    def visit_var(self, node: Var) -> AstNode:
+        return node
+
+    def visit_bin_op(self, node: BinOp) -> AstNode:
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        typ = node.op.typ
+        lval = literal(left)
+        rval = literal(right)
+
+        if lval is not None and rval is not None:
+            # 除以0不折叠, 留到求值时照常抛出ZeroDivisionError
+            if typ == EToken.PLUS:
+                return self.__fold(integer(lval + rval))
+            if typ == EToken.MINUS:
+                return self.__fold(integer(lval - rval))
+            if typ == EToken.MUL:
+                return self.__fold(integer(lval * rval))
+            if typ == EToken.DIV and rval != 0:
+                return self.__fold(integer(lval // rval))
+
+        if typ == EToken.PLUS:
+            if rval == 0:
+                return self.__fold(left)
+            if lval == 0:
+                return self.__fold(right)
+        elif typ == EToken.MINUS:
+            if rval == 0:
+                return self.__fold(left)
+        elif typ == EToken.MUL:
+            if rval == 1:
+                return self.__fold(left)
+            if lval == 1:
+                return self.__fold(right)
+            # x*0只在x求值不会出错时才能化为0
+            if rval == 0 and cannot_raise(left, self.__env):
+                return self.__fold(right)
+            if lval == 0 and cannot_raise(right, self.__env):
+                return self.__fold(left)
+        elif typ == EToken.DIV:
+            if rval == 1:
+                return self.__fold(left)
+
+        if left is node.left and right is node.right:
+            return node
+        return BinOp(left, node.op, right)
+
+    def __fold(self, node: AstNode) -> AstNode:
+        self.__folded += 1
+        return node
+
+    def fold(self, node: AstNode) -> AstNode:
+        return self.visit(node)
+
+
+def fold(node: AstNode, env: Mapping[str, int] | None = None) -> tuple[AstNode, int]:
+    folder = ConstantFolder(env)
+    return folder.fold(node), folder.folded
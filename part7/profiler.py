@@ -0,0 +1,160 @@
+import collections
+import time
+from typing import Mapping
+
+from spi import AstNode, BinOp, Interpreter, Lexer, Parser, Token
+
+# 插桩全部放在子类里: 不开启分析时用的还是原来的Lexer/Parser/Interpreter, 热路径上没有任何额外判断
+# 开启时每个token, 每次expr/term/factor调用, 每次visit都要多做几次计数和perf_counter调用,
+# 绝对耗时会变大, 只适合看各阶段之间的比例
+
+
+class ProfileStats:
+
+    def __init__(self):
+        self.tokens = 0
+        self.nodes: collections.Counter[str] = collections.Counter()
+        self.visits: collections.Counter[str] = collections.Counter()
+        self.parse_depth = 0
+        self.eval_depth = 0
+        self.phases: dict[str, float] = {}
+        # 其他后端没有插桩, 对应的字段不统计, 输出时标为未统计而不是0
+        self.parse_traced = True
+        self.eval_traced = True
+
+    def add_phase(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count_nodes(self, node: AstNode):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self.nodes[node.name()] += 1
+            if isinstance(node, BinOp):
+                stack.append(node.right)
+                stack.append(node.left)
+
+    def format(self) -> str:
+        def counts(counter: Mapping[str, int]) -> str:
+            return ', '.join(f'{name}={count}' for name, count in sorted(counter.items())) or '-'
+
+        phases = ', '.join(f'{name}={seconds * 1e3:.3f}ms' for name, seconds in self.phases.items())
+        visits = counts(self.visits) if self.eval_traced else '未统计'
+        parse_depth = self.parse_depth if self.parse_traced else '未统计'
+        eval_depth = self.eval_depth if self.eval_traced else '未统计'
+        return '\n'.join((
+            f'tokens: {self.tokens}',
+            f'nodes: {counts(self.nodes)}',
+            f'visits: {visits}',
+            f'max depth: parse={parse_depth}, eval={eval_depth}',
+            f'phases: {phases or "-"}',
+        ))
+
+    def __repr__(self) -> str:
+        return (f'ProfileStats(tokens={self.tokens}, nodes={dict(self.nodes)}, visits={dict(self.visits)}, '
+                f'parse_depth={self.parse_depth}, eval_depth={self.eval_depth}, phases={self.phases})')
+
+
+class ProfilingLexer(Lexer):
+
+    # 词法分析和语法分析是交替进行的, lex阶段的时间在这里逐个token累加
+
+    def __init__(
+            self,
+            source,
+            stats: ProfileStats
+    ):
+        self.__stats = stats
+        super().__init__(source)
+
+    def get_next_token(self) -> Token:
+        start = time.perf_counter()
+        token = super().get_next_token()
+        self.__stats.add_phase('lex', time.perf_counter() - start)
+        self.__stats.tokens += 1
+        return token
+
+
+class ProfilingParser(Parser):
+
+    def __init__(
+            self,
+            lexer: Lexer,
+            stats: ProfileStats
+    ):
+        self.__stats = stats
+        self.__depth = 0
+        super().__init__(lexer)
+
+    def __enter(self):
+        self.__depth += 1
+        if self.__depth > self.__stats.parse_depth:
+            self.__stats.parse_depth = self.__depth
+
+    def factor(self) -> AstNode:
+        self.__enter()
+        try:
+            return super().factor()
+        finally:
+            self.__depth -= 1
+
+    def term(self) -> AstNode:
+        self.__enter()
+        try:
+            return super().term()
+        finally:
+            self.__depth -= 1
+
+    def expr(self) -> AstNode:
+        self.__enter()
+        try:
+            return super().expr()
+        finally:
+            self.__depth -= 1
+
+
+class ProfilingInterpreter(Interpreter):
+
+    def __init__(
+            self,
+            stats: ProfileStats,
+            env: Mapping[str, int] | None = None
+    ):
+        super().__init__(None, env)
+        self.__stats = stats
+        self.__depth = 0
+
+    def visit(self, node: AstNode) -> int:
+        stats = self.__stats
+        stats.visits[node.name()] += 1
+        self.__depth += 1
+        if self.__depth > stats.eval_depth:
+            stats.eval_depth = self.__depth
+        try:
+            return super().visit(node)
+        finally:
+            self.__depth -= 1
+
+
+def parse(text: str, stats: ProfileStats) -> AstNode:
+    # parse阶段的时间扣除了其中交替进行的词法分析
+    lexed = stats.phases.get('lex', 0.0)
+    start = time.perf_counter()
+    node = ProfilingParser(ProfilingLexer(text, stats), stats).parse()
+    stats.add_phase('parse', time.perf_counter() - start - (stats.phases.get('lex', 0.0) - lexed))
+    stats.count_nodes(node)
+    return node
+
+
+def evaluate(node: AstNode, stats: ProfileStats, env: Mapping[str, int] | None = None) -> int:
+    start = time.perf_counter()
+    try:
+        return ProfilingInterpreter(stats, env).visit(node)
+    finally:
+        stats.add_phase('eval', time.perf_counter() - start)
+
+
+def profile(text: str, env: Mapping[str, int] | None = None) -> tuple[int, ProfileStats]:
+    stats = ProfileStats()
+    node = parse(text, stats)
+    return evaluate(node, stats, env), stats
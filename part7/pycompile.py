@@ -0,0 +1,178 @@
+import itertools
+import operator
+from typing import Callable, Iterable, Iterator, Mapping
+
+from spi import AstNode, BinOp, EToken, Integer, Lexer, NodeVisitor, Parser, PRECEDENCE, Var
+
+PY_OPERATORS: dict[EToken, str] = {
+    EToken.PLUS: '+',
+    EToken.MINUS: '-',
+    EToken.MUL: '*',
+    EToken.DIV: '//',
+}
+
+
+class VariableTable:
+
+    # 变量按第一次出现的顺序编号, 编译出的函数按这个顺序接收位置参数
+
+    def __init__(self):
+        self.__index: dict[str, int] = {}
+
+    @property
+    def names(self) -> tuple[str, ...]: return tuple(self.__index)
+
+    def index(self, name: str) -> int:
+        index = self.__index.get(name)
+        if index is None:
+            index = self.__index[name] = len(self.__index)
+        return index
+
+
+class ClosureCompiler(NodeVisitor):
+
+    def __init__(self):
+        self.__variables = VariableTable()
+
+    @property
+    def variables(self) -> tuple[str, ...]: return self.__variables.names
+
+    def visit_integer(self, node: Integer) -> Callable[[tuple[int, ...]], int]:
+        value = node.value.val
+        return lambda args: value
+
+    def visit_var(self, node: Var) -> Callable[[tuple[int, ...]], int]:
+        index = self.__variables.index(node.value.val)
+        return lambda args: args[index]
+
+    def visit_bin_op(self, node: BinOp) -> Callable[[tuple[int, ...]], int]:
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        typ = node.op.typ
+        if typ == EToken.PLUS:
+            return lambda args: left(args) + right(args)
+        if typ == EToken.MINUS:
+            return lambda args: left(args) - right(args)
+        if typ == EToken.MUL:
+            return lambda args: left(args) * right(args)
+        if typ == EToken.DIV:
+            return lambda args: left(args) // right(args)
+        raise RuntimeError(f'不支持的运算符: {node.op}')
+
+    def compile(self, node: AstNode) -> Callable[..., int]:
+        root = self.visit(node)
+        return lambda *args: root(args)
+
+
+class SourceCompiler(NodeVisitor):
+
+    def __init__(self):
+        # 字面量放进命名空间按名字引用, 生成的源码里不出现大整数的十进制文本
+        # 变量统一改名为v0, v1, ..., 不会和Python关键字或常量名冲突
+        self.__consts: dict[str, int] = {}
+        self.__names: dict[int, str] = {}
+        self.__variables = VariableTable()
+
+    @property
+    def variables(self) -> tuple[str, ...]: return self.__variables.names
+
+    def visit_integer(self, node: Integer) -> tuple[str, int]:
+        value = node.value.val
+        name = self.__names.get(value)
+        if name is None:
+            name = f'c{len(self.__consts)}'
+            self.__consts[name] = value
+            self.__names[value] = name
+        return name, 3
+
+    def visit_var(self, node: Var) -> tuple[str, int]:
+        return f'v{self.__variables.index(node.value.val)}', 3
+
+    def visit_bin_op(self, node: BinOp) -> tuple[str, int]:
+        prec = PRECEDENCE[node.op.typ]
+        left, left_prec = self.visit(node.left)
+        right, right_prec = self.visit(node.right)
+        if left_prec < prec:
+            left = f'({left})'
+        if right_prec <= prec:
+            right = f'({right})'
+        return f'{left}{PY_OPERATORS[node.op.typ]}{right}', prec
+
+    def source(self, node: AstNode) -> str:
+        body = self.visit(node)[0]
+        params = ', '.join(f'v{i}' for i in range(len(self.variables)))
+        return f'lambda {params}: {body}'
+
+    def compile(self, node: AstNode) -> Callable[..., int]:
+        source = self.source(node)
+        code = compile(source, '<spi>', 'eval')
+        return eval(code, dict(self.__consts))
+
+
+def compile_closure(node: AstNode) -> Callable[..., int]:
+    return ClosureCompiler().compile(node)
+
+
+def compile_function(node: AstNode) -> Callable[..., int]:
+    return compile_with_variables(node)[0]
+
+
+def compile_with_variables(node: AstNode) -> tuple[Callable[..., int], tuple[str, ...]]:
+    # 嵌套过深时CPython编译器会报错, 退回到闭包实现
+    try:
+        compiler = SourceCompiler()
+        return compiler.compile(node), compiler.variables
+    except (RecursionError, SyntaxError, MemoryError):
+        compiler = ClosureCompiler()
+        return compiler.compile(node), compiler.variables
+
+
+class Formula:
+
+    # 表达式只解析和编译一次, 之后对每组变量绑定直接调用编译好的函数
+
+    def __init__(
+            self,
+            node: AstNode
+    ):
+        self.__func, self.__variables = compile_with_variables(node)
+
+    @property
+    def variables(self) -> tuple[str, ...]: return self.__variables
+
+    @property
+    def func(self) -> Callable[..., int]: return self.__func
+
+    def __call__(self, **bindings: int) -> int:
+        return self.evaluate(bindings)
+
+    def evaluate(self, bindings: Mapping[str, int]) -> int:
+        try:
+            return self.__func(*[bindings[name] for name in self.__variables])
+        except KeyError as e:
+            raise NameError(f'未定义的变量: {e.args[0]}') from None
+
+    def evaluate_many(self, rows: Iterable[Mapping[str, int]]) -> Iterator[int]:
+        # 每行只做一次itemgetter取值和一次函数调用
+        func = self.__func
+        if not self.__variables:
+            yield from (func() for _ in rows)
+            return
+        getter = operator.itemgetter(*self.__variables)
+        if len(self.__variables) == 1:
+            results = map(func, map(getter, rows))
+        else:
+            results = itertools.starmap(func, map(getter, rows))
+        try:
+            yield from results
+        except KeyError as e:
+            # 和evaluate一样, 缺少的变量报NameError而不是itemgetter的KeyError
+            raise NameError(f'未定义的变量: {e.args[0]}') from None
+
+    def evaluate_rows(self, rows: Iterable[tuple[int, ...]]) -> Iterator[int]:
+        # rows中每个元组按self.variables的顺序给出变量值
+        return itertools.starmap(self.__func, rows)
+
+
+def compile_formula(text: str) -> Formula:
+    return Formula(Parser(Lexer(text)).parse())
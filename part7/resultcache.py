@@ -0,0 +1,207 @@
+import hashlib
+import sqlite3
+import time
+from typing import Callable, Mapping
+
+from canonical import Canonicalizer
+from spi import AstNode, Interpreter, Parser
+
+# 求值语义(除法取整方式, 运算符含义等)或键的算法改变时加一, 旧版本写入的结果在打开时整体作废
+RESULT_VERSION = 2
+
+# 每行除了键和值之外的大致开销, 用于按字节数淘汰
+ROW_OVERHEAD = 32
+
+
+def encode_int(value: int) -> bytes:
+    # 大整数按二进制字节存取是线性的, 不经过十进制字符串, 也不受int_max_str_digits限制
+    return value.to_bytes(value.bit_length() // 8 + 1, 'little', signed=True)
+
+
+def decode_int(data: bytes) -> int:
+    return int.from_bytes(data, 'little', signed=True)
+
+
+def result_key(node: AstNode, env: Mapping[str, int] | None = None) -> bytes | None:
+    # 键为AST的规范指纹(加法乘法的操作数不计顺序)和用到的变量取值的sha256, 与空白, 多余的括号无关
+    # 用到未定义的变量时返回None, 这样的表达式不进缓存
+    canonicalizer = Canonicalizer(commutative=True)
+    digest = hashlib.sha256(canonicalizer.fingerprint(node))
+    for name in sorted(canonicalizer.names):
+        if env is None or name not in env:
+            return None
+        digest.update(b'\0' + name.encode('utf-8') + b'=' + encode_int(env[name]))
+    return digest.digest()
+
+
+class ResultCache:
+
+    # sqlite中的一张表: 键, 结果, 字节数, 最近使用时间(单调递增的计数)
+    # 总字节数超过max_bytes时按最近使用时间从旧到新淘汰
+    # 命中时只在内存里记下, 下一次写入或close时再批量更新最近使用时间, 读路径上没有写操作
+
+    def __init__(
+            self,
+            path: str,
+            max_bytes: int = 64 << 20,
+            version: int = RESULT_VERSION
+    ):
+        self.__db = sqlite3.connect(path)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('PRAGMA synchronous=NORMAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self.__db.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key BLOB PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used INTEGER NOT NULL)'
+        )
+        self.__db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        row = self.__db.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        if row is None or row[0] != version:
+            self.__db.execute('DELETE FROM results')
+            self.__db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        self.__db.commit()
+
+        self.__max_bytes = max_bytes
+        self.__bytes, self.__clock = self.__db.execute(
+            'SELECT COALESCE(SUM(size), 0), COALESCE(MAX(used), 0) FROM results'
+        ).fetchone()
+        self.__touched: dict[bytes, int] = {}
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__lookup_seconds = 0.0
+        self.__lookup_max = 0.0
+
+    @property
+    def hits(self) -> int: return self.__hits
+
+    @property
+    def misses(self) -> int: return self.__misses
+
+    @property
+    def evictions(self) -> int: return self.__evictions
+
+    @property
+    def bytes(self) -> int: return self.__bytes
+
+    def __len__(self) -> int:
+        return self.__db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.__hits + self.__misses
+        return {
+            'hits': self.__hits,
+            'misses': self.__misses,
+            'hit_rate': self.__hits / lookups if lookups else 0.0,
+            'evictions': self.__evictions,
+            'bytes': self.__bytes,
+            'lookup_us': self.__lookup_seconds / lookups * 1e6 if lookups else 0.0,
+            'lookup_max_us': self.__lookup_max * 1e6,
+        }
+
+    def get(self, key: bytes) -> int | None:
+        start = time.perf_counter()
+        row = self.__db.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        value = None if row is None else decode_int(row[0])
+        seconds = time.perf_counter() - start
+        self.__lookup_seconds += seconds
+        self.__lookup_max = max(self.__lookup_max, seconds)
+        if value is None:
+            self.__misses += 1
+        else:
+            self.__hits += 1
+            self.__clock += 1
+            self.__touched[key] = self.__clock
+        return value
+
+    def put(self, key: bytes, value: int):
+        data = encode_int(value)
+        size = len(key) + len(data) + ROW_OVERHEAD
+        if size > self.__max_bytes:
+            return
+        self.__clock += 1
+        old = self.__db.execute('SELECT size FROM results WHERE key = ?', (key,)).fetchone()
+        if old is not None:
+            self.__bytes -= old[0]
+        self.__db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', (key, data, size, self.__clock))
+        self.__bytes += size
+        self.__flush()
+        self.__evict()
+        self.__db.commit()
+
+    def __flush(self):
+        if self.__touched:
+            self.__db.executemany(
+                'UPDATE results SET used = ? WHERE key = ?',
+                [(used, key) for key, used in self.__touched.items()],
+            )
+            self.__touched.clear()
+
+    def __evict(self):
+        while self.__bytes > self.__max_bytes:
+            rows = self.__db.execute('SELECT key, size FROM results ORDER BY used LIMIT 64').fetchall()
+            if not rows:
+                self.__bytes = 0
+                return
+            victims = []
+            for key, size in rows:
+                victims.append((key,))
+                self.__bytes -= size
+                if self.__bytes <= self.__max_bytes:
+                    break
+            self.__db.executemany('DELETE FROM results WHERE key = ?', victims)
+            self.__evictions += len(victims)
+
+    def evaluate(
+            self,
+            node: AstNode,
+            env: Mapping[str, int] | None = None,
+            compute: Callable[[AstNode], int] | None = None
+    ) -> int:
+        key = result_key(node, env)
+        if key is not None:
+            value = self.get(key)
+            if value is not None:
+                return value
+        value = Interpreter(None, env).visit(node) if compute is None else compute(node)
+        if key is not None:
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        self.__db.execute('DELETE FROM results')
+        self.__db.commit()
+        self.__bytes = 0
+        self.__touched.clear()
+
+    def close(self):
+        self.__flush()
+        self.__db.commit()
+        self.__db.close()
+
+    def __enter__(self) -> 'ResultCache':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self) -> str: return f'ResultCache({self.stats()})'
+
+
+class PersistentInterpreter(Interpreter):
+
+    # interpret()先按AST查持久缓存, 未命中时才求值
+
+    def __init__(
+            self,
+            parser: Parser,
+            cache: ResultCache,
+            env: Mapping[str, int] | None = None
+    ):
+        super().__init__(parser, env)
+        self.__parser = parser
+        self.__cache = cache
+
+    def interpret(self) -> int:
+        return self.__cache.evaluate(self.__parser.parse(), self.env, self.visit)
@@ -0,0 +1,239 @@
+import mmap
+import struct
+from collections.abc import Mapping
+from typing import Iterator
+
+from spi import AstNode, BinOp, EToken, Integer, Lexer, OPERATOR_TOKENS, Parser, Token, Var, integer_token
+
+# 表达式库的二进制格式, 整数都是小端
+#
+#   头部    HEADER: 魔数b'SPIL', 版本号, 变量名个数, 表达式个数
+#   变量名  每个为 varint字节数 + UTF-8, 整个库共用一张表
+#   索引    每条表达式为 varint名字字节数 + UTF-8名字 + varint正文字节数
+#   正文    各表达式的后序字节码依次相连
+#
+# 正文中每个节点一个操作码:
+#   OP_INT  后跟zigzag varint, 用于int64范围内的字面量(常量折叠后可能为负)
+#   OP_BIG  后跟varint字节数 + 有符号小端字节, 大整数按字节整块转换, 不必逐7位拼接
+#   OP_VAR  后跟varint变量名下标
+#   其余    二元运算符, 从栈上弹出右, 左两个子树
+#
+# 加载只需要一个显式栈, 不经过Lexer/Parser, 也不受嵌套深度限制
+
+MAGIC = b'SPIL'
+VERSION = 1
+HEADER = struct.Struct('<4sHxxII')
+
+OP_INT = 0
+OP_BIG = 1
+OP_VAR = 2
+OP_CODES: dict[EToken, int] = {
+    EToken.PLUS: 3,
+    EToken.MINUS: 4,
+    EToken.MUL: 5,
+    EToken.DIV: 6,
+}
+OP_TOKENS: dict[int, Token] = {code: OPERATOR_TOKENS[e] for e, code in OP_CODES.items()}
+
+INT64_MIN: int = -(1 << 63)
+INT64_MAX: int = (1 << 63) - 1
+
+
+def write_varint(out: bytearray, value: int):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class Encoder:
+
+    # 变量名表在同一个库的所有表达式之间共享
+
+    def __init__(self):
+        self.__names: dict[str, int] = {}
+
+    @property
+    def names(self) -> tuple[str, ...]: return tuple(self.__names)
+
+    def encode(self, node: AstNode) -> bytes:
+        out = bytearray()
+        stack: list[tuple[AstNode, bool]] = [(node, False)]
+        while stack:
+            node, expanded = stack.pop()
+            cls = type(node)
+            if cls is BinOp:
+                if expanded:
+                    out.append(OP_CODES[node.op.typ])
+                else:
+                    stack.append((node, True))
+                    stack.append((node.right, False))
+                    stack.append((node.left, False))
+            elif cls is Integer:
+                value = node.value.val
+                if INT64_MIN <= value <= INT64_MAX:
+                    out.append(OP_INT)
+                    write_varint(out, (value << 1) ^ (value >> 63))
+                else:
+                    raw = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+                    out.append(OP_BIG)
+                    write_varint(out, len(raw))
+                    out += raw
+            elif cls is Var:
+                name = node.value.val
+                index = self.__names.get(name)
+                if index is None:
+                    index = self.__names[name] = len(self.__names)
+                out.append(OP_VAR)
+                write_varint(out, index)
+            else:
+                raise TypeError(f'不支持的节点: {node.name()}')
+        return bytes(out)
+
+
+def decode(data, start: int, end: int, names: list[Token]) -> AstNode:
+    stack: list[AstNode] = []
+    push = stack.append
+    pos = start
+    while pos < end:
+        code = data[pos]
+        pos += 1
+        if code == OP_INT:
+            # 绝大多数字面量只占一个字节, 不调用read_varint
+            value = data[pos]
+            if value < 0x80:
+                pos += 1
+            else:
+                value, pos = read_varint(data, pos)
+            push(Integer(integer_token((value >> 1) ^ -(value & 1))))
+        elif code == OP_VAR:
+            index, pos = read_varint(data, pos)
+            push(Var(names[index]))
+        elif code == OP_BIG:
+            length, pos = read_varint(data, pos)
+            push(Integer(integer_token(int.from_bytes(data[pos:pos + length], 'little', signed=True))))
+            pos += length
+        else:
+            right = stack.pop()
+            stack[-1] = BinOp(stack[-1], OP_TOKENS[code], right)
+    if len(stack) != 1:
+        raise ValueError('表达式正文损坏')
+    return stack[0]
+
+
+def dumps(library: Mapping[str, AstNode | str]) -> bytes:
+    # 值可以是已经解析好的AST, 也可以是表达式文本
+    encoder = Encoder()
+    bodies = []
+    for name, node in library.items():
+        if isinstance(node, str):
+            node = Parser(Lexer(node)).parse()
+        bodies.append((name.encode('utf-8'), encoder.encode(node)))
+
+    out = bytearray(HEADER.pack(MAGIC, VERSION, len(encoder.names), len(bodies)))
+    for name in encoder.names:
+        raw = name.encode('utf-8')
+        write_varint(out, len(raw))
+        out += raw
+    for name, body in bodies:
+        write_varint(out, len(name))
+        out += name
+        write_varint(out, len(body))
+    for _, body in bodies:
+        out += body
+    return bytes(out)
+
+
+def dump(library: Mapping[str, AstNode | str], path: str):
+    with open(path, 'wb') as f:
+        f.write(dumps(library))
+
+
+class Library(Mapping):
+
+    # 只解析头部, 变量名表和索引, 每条表达式在第一次访问时才解码
+    # data可以是bytes, memoryview或mmap; 解码出的AST不引用data, 之后可以关闭mmap
+
+    def __init__(
+            self,
+            data
+    ):
+        view = memoryview(data)
+        try:
+            self.__read_index(view)
+        except Exception:
+            # 出错时也要放开引用, 否则调用方无法关闭mmap
+            view.release()
+            raise
+        self.__data = view
+        self.__nodes: dict[str, AstNode] = {}
+
+    def __read_index(self, view: memoryview):
+        magic, version, name_count, count = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError('不是spi表达式库')
+        if version != VERSION:
+            raise ValueError(f'不支持的表达式库版本: {version}')
+        pos = HEADER.size
+        names: list[Token] = []
+        for _ in range(name_count):
+            length, pos = read_varint(view, pos)
+            names.append(Token(EToken.ID, str(view[pos:pos + length], 'utf-8')))
+            pos += length
+        index: list[tuple[str, int]] = []
+        for _ in range(count):
+            length, pos = read_varint(view, pos)
+            name = str(view[pos:pos + length], 'utf-8')
+            pos += length
+            size, pos = read_varint(view, pos)
+            index.append((name, size))
+        self.__spans: dict[str, tuple[int, int]] = {}
+        for name, size in index:
+            self.__spans[name] = (pos, pos + size)
+            pos += size
+        if pos != len(view):
+            raise ValueError('表达式库长度不符')
+        self.__names = names
+
+    def __getitem__(self, name: str) -> AstNode:
+        node = self.__nodes.get(name)
+        if node is None:
+            start, end = self.__spans[name]
+            node = self.__nodes[name] = decode(self.__data, start, end, self.__names)
+        return node
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__spans)
+
+    def __len__(self) -> int:
+        return len(self.__spans)
+
+    def release(self):
+        # 解码剩下的表达式并放开对底层缓冲区的引用
+        for name in self.__spans:
+            self[name]
+        self.__data.release()
+
+
+def loads(data) -> dict[str, AstNode]:
+    return dict(Library(data))
+
+
+def load(path: str) -> dict[str, AstNode]:
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        library = Library(data)
+        nodes = dict(library)
+        library.release()
+        return nodes
@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import concurrent.futures
+import concurrent.futures.process
+import multiprocessing
+import os
+import signal
+import sys
+from typing import Mapping
+
+from spi import Interpreter, Lexer, Parser
+
+# 协议: 每行一条表达式, 每行回复一行, 回复顺序与请求顺序一致(流水线)
+# 成功回复结果, 失败回复 error: 异常类型: 信息, 与batch的输出格式相同
+#
+# 并发控制分三层:
+#   每个连接最多per_connection条在途请求, 用满后不再读这个连接, 内核缓冲区写满后客户端自然被阻塞
+#   回复写回时await drain, 客户端不读回复时同样停止读取新的请求
+#   所有连接共享max_pending个执行器名额, 长表达式送进进程池求值, 事件循环本身不做重计算
+# 短表达式在事件循环里直接求值, 送进进程池的序列化开销比求值本身还大
+
+
+def evaluate_text(text: str, env: Mapping[str, int] | None = None) -> str:
+    try:
+        return str(Interpreter(Parser(Lexer(text)), env).interpret())
+    except Exception as e:
+        return f'error: {type(e).__name__}: {e}'
+
+
+class EvalServer:
+
+    def __init__(
+            self,
+            env: Mapping[str, int] | None = None,
+            workers: int | None = None,
+            max_pending: int | None = None,
+            per_connection: int = 64,
+            inline_limit: int = 256,
+            max_line: int = 1 << 20
+    ):
+        self.__env = {} if env is None else dict(env)
+        self.__workers = workers or os.cpu_count() or 1
+        self.__executor: concurrent.futures.Executor | None = None
+        self.__slots = asyncio.Semaphore(max_pending or self.__workers * 4)
+        self.__per_connection = per_connection
+        self.__inline_limit = inline_limit
+        self.__max_line = max_line
+        self.__requests = 0
+        self.__offloaded = 0
+        self.__connections = 0
+
+    @property
+    def max_line(self) -> int: return self.__max_line
+
+    @property
+    def requests(self) -> int: return self.__requests
+
+    @property
+    def offloaded(self) -> int: return self.__offloaded
+
+    @property
+    def connections(self) -> int: return self.__connections
+
+    def __enter__(self) -> 'EvalServer':
+        # 进程池在第一个送进去的请求时才启动工作进程, 用fork的话当时打开的客户端套接字会被复制进工作进程,
+        # 服务端关闭连接后客户端收不到EOF; forkserver启动的工作进程不继承这些描述符
+        self.__executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.__workers,
+            mp_context=multiprocessing.get_context('forkserver'),
+        )
+        return self
+
+    def __exit__(self, *exc):
+        self.__executor.shutdown(cancel_futures=True)
+        self.__executor = None
+
+    async def evaluate(self, text: str) -> str:
+        self.__requests += 1
+        if len(text) <= self.__inline_limit:
+            return evaluate_text(text, self.__env)
+        self.__offloaded += 1
+        async with self.__slots:
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(self.__executor, evaluate_text, text, self.__env)
+            except concurrent.futures.process.BrokenProcessPool as e:
+                return f'error: {type(e).__name__}: {e}'
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.__connections += 1
+        # 队列里按请求顺序放求值任务, 容量就是这个连接的在途上限
+        pending: asyncio.Queue[asyncio.Task | None] = asyncio.Queue(self.__per_connection)
+        responder = asyncio.create_task(self.__respond(pending, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # 超过max_line的行无法按行切分, 回复错误后断开
+                    await pending.put(asyncio.create_task(self.__fail('error: ValueError: 表达式过长')))
+                    break
+                if not line:
+                    break
+                text = line.decode('utf-8', errors='replace').strip()
+                if not text:
+                    continue
+                await pending.put(asyncio.create_task(self.evaluate(text)))
+        except ConnectionError:
+            pass
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+            self.__connections -= 1
+
+    @staticmethod
+    async def __fail(message: str) -> str:
+        return message
+
+    @staticmethod
+    async def __respond(pending: asyncio.Queue, writer: asyncio.StreamWriter):
+        # 连接断开后继续取走队列里的任务, 读请求的一侧不会卡在已满的队列上
+        broken = False
+        while True:
+            task = await pending.get()
+            if task is None:
+                return
+            result = await task
+            if broken:
+                continue
+            try:
+                writer.write(f'{result}\n'.encode())
+                # 缓冲区超过高水位时等待客户端读走, 期间队列会被填满, 读请求的一侧随之停下
+                await writer.drain()
+            except ConnectionError:
+                broken = True
+
+    async def start(self, host: str | None = None, port: int | None = None, path: str | None = None):
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path, limit=self.__max_line)
+        return await asyncio.start_server(self.handle, host, port, limit=self.__max_line)
+
+
+async def serve(args: argparse.Namespace, env: Mapping[str, int]):
+    with EvalServer(env, args.workers, args.max_pending, args.per_connection, args.inline_limit) as server:
+        listener = await server.start(args.host, args.port, args.unix)
+        for sock in listener.sockets:
+            print(f'listening on {sock.getsockname()}', file=sys.stderr)
+        # SIGTERM(例如loadgen --spawn结束时)和Ctrl-C一样正常退出, 离开with时关闭进程池, 不留下孤儿工作进程
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        try:
+            async with listener:
+                await listener.start_serving()
+                await stop.wait()
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+
+
+def main(args: argparse.Namespace, env: Mapping[str, int]):
+    try:
+        asyncio.run(serve(args, env))
+    except KeyboardInterrupt:
+        pass
@@ -1,10 +1,23 @@
 import abc
+import argparse
+import codecs
+import collections
+import concurrent.futures
+import contextlib
+import itertools
+import mmap
+import operator
+import os
+import re
+import sys
+import time
 from enum import Enum
-from typing import Callable
+from typing import IO, Callable, Iterable, Iterator, Mapping
 
 
 class EToken(Enum):
     INTEGER = 'integer'
+    ID = 'id'
 
     PLUS = '+'
     MINUS = '-'
@@ -19,13 +32,22 @@ class EToken(Enum):
 
 class Token:
 
+    # start/end是token在整个输入中的字符偏移, 只有开启spans的词法分析器才会填写
+    # 共享的运算符/EOF/小整数token没有位置
+
+    __slots__ = ('__typ', '__val', '__start', '__end')
+
     def __init__(
             self,
             typ: EToken,
-            val: int | str | None
+            val: int | str | None,
+            start: int | None = None,
+            end: int | None = None
     ):
         self.__typ = typ
         self.__val = val
+        self.__start = start
+        self.__end = end
 
     @property
     def typ(self) -> EToken: return self.__typ
@@ -33,73 +55,352 @@ class Token:
     @property
     def val(self) -> int | str | None: return self.__val
 
+    @property
+    def start(self) -> int | None: return self.__start
+
+    @property
+    def end(self) -> int | None: return self.__end
+
     def __repr__(self) -> str: return f'{self.typ}: {self.val}'
 
 
+# Token不可变, 运算符/EOF/小整数token全局只建一份, 词法分析和语法分析直接复用
+OPERATOR_TOKENS: dict[EToken, Token] = {
+    e: Token(e, e.value) for e in (
+        EToken.PLUS,
+        EToken.MINUS,
+        EToken.MUL,
+        EToken.DIV,
+        EToken.LPAREN,
+        EToken.RPAREN,
+    )
+}
+
+EOF_TOKEN: Token = Token(EToken.EOF, None)
+
+SMALL_INT_TOKENS: tuple[Token, ...] = tuple(Token(EToken.INTEGER, i) for i in range(256))
+
+
+def integer_token(value: int) -> Token:
+    if 0 <= value < 256:
+        return SMALL_INT_TOKENS[value]
+    return Token(EToken.INTEGER, value)
+
+
+# 与Python一致的整数字面量: 0x/0o/0b前缀, 数字之间可以有单个下划线; 十进制允许前导0
+DECIMAL_RE = re.compile(r'\d(?:_?\d)*')
+INTEGER_BASES: dict[str, int] = {'x': 16, 'X': 16, 'o': 8, 'O': 8, 'b': 2, 'B': 2}
+
+# 低于CPython默认的int_max_str_digits(4300), 每段都能直接交给int()
+DECIMAL_CHUNK = 4000
+
+
+def decimal(digits: str) -> int:
+    # int()转换十进制是平方复杂度, 超过int_max_str_digits还会直接报错
+    # 分治: 高半部分 * 10**低半部分位数 + 低半部分, 乘法走Karatsuba; 同样位数的10的幂只算一次
+    powers: dict[int, int] = {}
+
+    def convert(lo: int, hi: int) -> int:
+        if hi - lo <= DECIMAL_CHUNK:
+            return int(digits[lo:hi])
+        low = (hi - lo) // 2
+        power = powers.get(low)
+        if power is None:
+            power = powers[low] = 10 ** low
+        return convert(lo, hi - low) * power + convert(hi - low, hi)
+
+    return convert(0, len(digits))
+
+
+def parse_integer(literal: str) -> int | None:
+    # 不是合法的整数字面量时返回None, 由词法分析器报出位置
+    if literal.isdecimal():
+        return decimal(literal)
+    base = INTEGER_BASES.get(literal[1:2], 10) if literal[0] == '0' else 10
+    if base != 10:
+        # 前缀和下划线由int()按Python的规则校验; 2的幂进制的转换是线性的, 也不受int_max_str_digits限制
+        try:
+            return int(literal, base)
+        except ValueError:
+            return None
+    if DECIMAL_RE.fullmatch(literal) is None:
+        return None
+    return decimal(literal.replace('_', ''))
+
+
+class ParseError(EOFError):
+
+    # 继承EOFError, 原先捕获EOFError('解析错误')的代码不受影响
+    # line和column从1开始, offset是在整个输入中的字符偏移
+
+    def __init__(
+            self,
+            offset: int,
+            line: int,
+            column: int
+    ):
+        super().__init__(f'解析错误: 第{line}行第{column}列')
+        self.__offset = offset
+        self.__line = line
+        self.__column = column
+
+    @property
+    def offset(self) -> int: return self.__offset
+
+    @property
+    def line(self) -> int: return self.__line
+
+    @property
+    def column(self) -> int: return self.__column
+
+
+def position(text: str, offset: int) -> tuple[int, int]:
+    line_start = text.rfind('\n', 0, offset) + 1
+    return text.count('\n', 0, offset) + 1, offset - line_start + 1
+
+
+Source = str | bytes | bytearray | memoryview | mmap.mmap | IO | Iterable[str]
+
+
+def chunks(source: Source, size: int = 1 << 16) -> Iterator[str]:
+    # 把各种输入统一成str分块, 任何时候只持有当前一块
+    if isinstance(source, str):
+        yield source
+        return
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        # UTF-8多字节字符可能被切开, 用增量解码器拼回去
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        view = memoryview(source)
+        for start in range(0, len(view), size):
+            yield decoder.decode(view[start:start + size])
+        yield decoder.decode(b'', final=True)
+        return
+    if hasattr(source, 'read'):
+        decoder = None
+        while True:
+            chunk = source.read(size)
+            if not chunk:
+                break
+            if isinstance(chunk, bytes):
+                decoder = decoder or codecs.getincrementaldecoder('utf-8')()
+                chunk = decoder.decode(chunk)
+            yield chunk
+        if decoder is not None:
+            yield decoder.decode(b'', final=True)
+        return
+    yield from source
+
+
+WORD_RE = re.compile(r'\w*')
+
+
 class Lexer:
 
     def __init__(
             self,
-            text: str
+            text: Source,
+            spans: bool = False
     ):
+        self.reset(text)
+        if spans:
+            # 不开启时get_next_token不做任何额外判断, 只多记录一次token起点
+            self.get_next_token = self.__get_next_token_with_span
 
-        self.__text = text
+    def reset(self, text: Source):
+        # text可以是str, 也可以是分块的可迭代对象/文件对象/mmap, 按块增量读取
+        self.__chunks = chunks(text)
+        self.__chunk = ''
         self.__pos = 0
+        self.__cur_char = None
+        # 当前块之前的字符数, 换行数, 以及最后一行的起点, 报错时据此算出行列号
+        self.__base = 0
+        self.__lines = 0
+        self.__line_start = 0
+        self.__token_start = 0
+        self.next_chunk()
+
+    @property
+    def offset(self) -> int: return self.__base + self.__pos
 
-        self.__cur_char = None if len(self.__text) == 0 else self.__text[self.__pos]
+    def next_chunk(self):
+        chunk = self.__chunk
+        if chunk:
+            last = chunk.rfind('\n')
+            if last >= 0:
+                self.__lines += chunk.count('\n')
+                self.__line_start = self.__base + last + 1
+            self.__base += len(chunk)
+        for chunk in self.__chunks:
+            if chunk:
+                self.__chunk = chunk
+                self.__pos = 0
+                self.__cur_char = chunk[0]
+                return
+        self.__chunk = ''
+        self.__pos = 0
+        self.__cur_char = None
 
-    def error(self):
-        raise EOFError('解析错误')
+    def error(self, offset: int | None = None):
+        # 默认报在最近一个token的起点, 也就是Parser当前看到的token
+        if offset is None:
+            offset = self.__token_start
+        # 跨块的token不含换行, 起点在上一块时行号和当前块开头相同
+        local = max(offset - self.__base, 0)
+        newline = self.__chunk.rfind('\n', 0, local)
+        line_start = self.__line_start if newline < 0 else self.__base + newline + 1
+        line = self.__lines + self.__chunk.count('\n', 0, local) + 1
+        raise ParseError(offset, line, offset - line_start + 1)
 
     def advance(self):
         self.__pos += 1
-        if self.__pos >= len(self.__text):
-            self.__cur_char = None
+        if self.__pos >= len(self.__chunk):
+            self.next_chunk()
         else:
-            self.__cur_char = self.__text[self.__pos]
+            self.__cur_char = self.__chunk[self.__pos]
 
     def skip_whitespace(self):
         while self.__cur_char and self.__cur_char.isspace():
             self.advance()
 
+    def __word(self) -> str:
+        # 一个\w串在每块里只切一次片, 跨块时最后拼接一次
+        pieces: list[str] = []
+        while self.__cur_char is not None:
+            chunk = self.__chunk
+            end = WORD_RE.match(chunk, self.__pos).end()
+            pieces.append(chunk[self.__pos:end])
+            if end < len(chunk):
+                self.__pos = end
+                self.__cur_char = chunk[end]
+                break
+            self.next_chunk()
+        return pieces[0] if len(pieces) == 1 else ''.join(pieces)
+
     def integer(self) -> int:
-        result: str = ''
-        while self.__cur_char and self.__cur_char.isdigit():
-            result = f'{result}{self.__cur_char}'
-            self.advance()
-        return None if len(result) == 0 else int(result)
+        # 取到整个\w串为止再整体校验, 12abc, 0xZ, 1__2这样的输入报错而不是被拆成几个token
+        start = self.__base + self.__pos
+        value = parse_integer(self.__word())
+        if value is None:
+            self.error(start)
+        return value
+
+    def identifier(self) -> str:
+        # \w与isalnum()或下划线判断的字符相同
+        return self.__word()
 
     def get_next_token(self) -> Token:
         if self.__cur_char is None:
-            return Token(EToken.EOF, None)
+            self.__token_start = self.__base + self.__pos
+            return EOF_TOKEN
 
         self.skip_whitespace()
+        self.__token_start = self.__base + self.__pos
+        if self.__cur_char is None:
+            return EOF_TOKEN
+
+        # 与RegexLexer的\d和[^\W\d]一致: '²'这类isdigit()但不是十进制数字的字符算作变量名
+        if self.__cur_char.isdecimal():
+            return integer_token(self.integer())
 
-        if self.__cur_char.isdigit():
-            return Token(EToken.INTEGER, self.integer())
+        if self.__cur_char.isalnum() or self.__cur_char == '_':
+            return Token(EToken.ID, self.identifier())
 
         if self.__cur_char == EToken.PLUS.value:
             self.advance()
-            return Token(EToken.PLUS, EToken.PLUS.value)
+            return OPERATOR_TOKENS[EToken.PLUS]
         if self.__cur_char == EToken.MINUS.value:
             self.advance()
-            return Token(EToken.MINUS, EToken.MINUS.value)
+            return OPERATOR_TOKENS[EToken.MINUS]
         if self.__cur_char == EToken.MUL.value:
             self.advance()
-            return Token(EToken.MUL, EToken.MUL.value)
+            return OPERATOR_TOKENS[EToken.MUL]
         if self.__cur_char == EToken.DIV.value:
             self.advance()
-            return Token(EToken.DIV, EToken.DIV.value)
+            return OPERATOR_TOKENS[EToken.DIV]
         if self.__cur_char == EToken.LPAREN.value:
             self.advance()
-            return Token(EToken.LPAREN, EToken.LPAREN.value)
+            return OPERATOR_TOKENS[EToken.LPAREN]
         if self.__cur_char == EToken.RPAREN.value:
             self.advance()
-            return Token(EToken.RPAREN, EToken.RPAREN.value)
+            return OPERATOR_TOKENS[EToken.RPAREN]
+        self.error()
+
+    def __get_next_token_with_span(self) -> Token:
+        # 按类型取get_next_token, 子类(如ProfilingLexer)的覆盖依然生效
+        # 只有字面量和变量名成为叶子节点, 需要位置; 运算符, 括号和EOF照常返回共享的token
+        token = type(self).get_next_token(self)
+        typ = token.typ
+        if typ is EToken.INTEGER or typ is EToken.ID:
+            return Token(typ, token.val, self.__token_start, self.__base + self.__pos)
+        return token
+
+
+class RegexLexer:
+
+    # 一条主正则完成跳过空白和识别token, 整个输入只扫描一遍
+    # 最后一个分组兜底匹配任何非法字符, 保证finditer不会跳过它们
+    TOKEN_RE = re.compile(r'\s*(?:(\d\w*)|([^\W\d]\w*)|([-+*/()])|(\S))')
+
+    OPERATORS: dict[str, Token] = {token.val: token for token in OPERATOR_TOKENS.values()}
+
+    def __init__(
+            self,
+            text: str,
+            spans: bool = False
+    ):
+        self.reset(text)
+        if spans:
+            self.get_next_token = self.__get_next_token_with_span
+
+    def reset(self, text: str):
+        self.__text = text
+        self.__matches = self.TOKEN_RE.finditer(text)
+        self.__match = None
+
+    def error(self, offset: int | None = None):
+        if offset is None:
+            m = self.__match
+            offset = len(self.__text) if m is None else m.start(m.lastindex)
+        raise ParseError(offset, *position(self.__text, offset))
+
+    def get_next_token(self) -> Token:
+        m = self.__match = next(self.__matches, None)
+        if m is None:
+            return EOF_TOKEN
+        digits, name, op, _ = m.groups()
+        if digits is not None:
+            value = parse_integer(digits)
+            if value is None:
+                self.error(m.start(1))
+            return integer_token(value)
+        if name is not None:
+            return Token(EToken.ID, name)
+        if op is not None:
+            return self.OPERATORS[op]
+        self.error()
+
+    def __get_next_token_with_span(self) -> Token:
+        # 运算符最多, 先判断; 它们和EOF一样返回共享的token, 只给字面量和变量名新建带位置的token
+        m = self.__match = next(self.__matches, None)
+        if m is None:
+            return EOF_TOKEN
+        group = m.lastindex
+        if group == 3:
+            return self.OPERATORS[m.group(3)]
+        if group == 1:
+            value = parse_integer(m.group(1))
+            if value is None:
+                self.error(m.start(1))
+            return Token(EToken.INTEGER, value, m.start(1), m.end())
+        if group == 2:
+            return Token(EToken.ID, m.group(2), m.start(2), m.end())
+        self.error()
 
 
 class AstNode(abc.ABC):
 
+    __slots__ = ()
+
     @classmethod
     @abc.abstractmethod
     def name(cls) -> str: raise NotImplemented
@@ -107,6 +408,8 @@ class AstNode(abc.ABC):
 
 class BinOp(AstNode):
 
+    __slots__ = ('__left', '__op', '__right')
+
     __name: str = 'bin_op'
 
     @classmethod
@@ -134,6 +437,8 @@ class BinOp(AstNode):
 
 class Integer(AstNode):
 
+    __slots__ = ('__value',)
+
     __name: str = 'integer'
 
     @classmethod
@@ -149,6 +454,37 @@ class Integer(AstNode):
     def value(self) -> Token: return self.__value
 
 
+class Var(AstNode):
+
+    __slots__ = ('__value',)
+
+    __name: str = 'var'
+
+    @classmethod
+    def name(cls) -> str: return cls.__name
+
+    def __init__(
+            self,
+            value: Token
+    ):
+        self.__value = value
+
+    @property
+    def value(self) -> Token: return self.__value
+
+
+def span(node: AstNode) -> tuple[int, int] | None:
+    # 节点的范围由最左和最右的叶子token推出, 节点本身不额外保存位置; 两端叶子外面的括号不计在内
+    # 只有用开启spans的词法分析器解析出的树才有位置
+    left = right = node
+    while isinstance(left, BinOp):
+        left = left.left
+    while isinstance(right, BinOp):
+        right = right.right
+    start, end = left.value.start, right.value.end
+    return None if start is None or end is None else (start, end)
+
+
 class Parser:
 
     def __init__(
@@ -158,6 +494,10 @@ class Parser:
         self.__lexer = lexer
         self.__cur_token = self.__lexer.get_next_token()
 
+    def reset(self, text: str):
+        self.__lexer.reset(text)
+        self.__cur_token = self.__lexer.get_next_token()
+
     def eat(self, e: EToken):
         if self.__cur_token.typ == e:
             self.__cur_token = self.__lexer.get_next_token()
@@ -169,11 +509,16 @@ class Parser:
             node: AstNode = Integer(self.__cur_token)
             self.eat(self.__cur_token.typ)
             return node
+        if self.__cur_token.typ == EToken.ID:
+            node: AstNode = Var(self.__cur_token)
+            self.eat(self.__cur_token.typ)
+            return node
         if self.__cur_token.typ == EToken.LPAREN:
             self.eat(self.__cur_token.typ)
             node: AstNode = self.expr()
             self.eat(EToken.RPAREN)
             return node
+        self.__lexer.error()
 
     def term(self) -> AstNode:
         node: AstNode = self.factor()
@@ -181,14 +526,10 @@ class Parser:
             EToken.MUL,
             EToken.DIV,
         ):
-            if self.__cur_token.typ == EToken.MUL:
-                op: Token = Token(EToken.MUL, EToken.MUL.value)
-                self.eat(op.typ)
-                node = BinOp(node, op, self.factor())
-            elif self.__cur_token.typ == EToken.DIV:
-                op: Token = Token(EToken.DIV, EToken.DIV.value)
-                self.eat(op.typ)
-                node = BinOp(node, op, self.factor())
+            # 直接用词法分析器给出的token, 运算符总是共享的token, 不带位置
+            op: Token = self.__cur_token
+            self.eat(op.typ)
+            node = BinOp(node, op, self.factor())
         return node
 
     def expr(self) -> AstNode:
@@ -197,14 +538,9 @@ class Parser:
             EToken.PLUS,
             EToken.MINUS,
         ):
-            if self.__cur_token.typ == EToken.PLUS:
-                op: Token = Token(EToken.PLUS, EToken.PLUS.value)
-                self.eat(op.typ)
-                node = BinOp(node, op, self.term())
-            elif self.__cur_token.typ == EToken.MINUS:
-                op: Token = Token(EToken.MINUS, EToken.MINUS.value)
-                self.eat(op.typ)
-                node = BinOp(node, op, self.term())
+            op: Token = self.__cur_token
+            self.eat(op.typ)
+            node = BinOp(node, op, self.term())
         return node
 
     def parse(self) -> AstNode:
@@ -212,61 +548,382 @@ class Parser:
 
 class NodeVisitor(abc.ABC):
 
+    # 每个visitor类一张 节点类型 -> visit_xxx函数 的表
+    # 某种节点第一次出现时按名字getattr一次, 之后每个节点只需一次字典查找
+    __dispatch: dict[type, Callable[['NodeVisitor', AstNode], int]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.__dispatch = {}
+
+    @classmethod
+    def resolve(cls, node_type: type) -> Callable[['NodeVisitor', AstNode], int]:
+        method = getattr(cls, f'visit_{node_type.name()}', None)
+        if method is None:
+            raise RuntimeError(f'{cls.__name__}不支持节点{node_type.name()}')
+        cls.__dispatch[node_type] = method
+        return method
+
     def visit(self, node: AstNode) -> int:
-        method_name: str = f'visit_{node.name()}'
-        method: Callable[[AstNode], int] = getattr(self, method_name, None)
-        if method:
-            return method(node)
-        raise RuntimeError
+        try:
+            method = self.__dispatch[node.__class__]
+        except KeyError:
+            method = self.resolve(node.__class__)
+        return method(self, node)
+
+BIN_OPS: dict[EToken, Callable[[int, int], int]] = {
+    EToken.PLUS: operator.add,
+    EToken.MINUS: operator.sub,
+    EToken.MUL: operator.mul,
+    EToken.DIV: operator.floordiv,
+}
+
+# 与Python运算符优先级一致: 加减低于乘除, 且都是左结合; 渲染, 编译和迭代解析共用这一张表
+PRECEDENCE: dict[EToken, int] = {
+    EToken.PLUS: 1,
+    EToken.MINUS: 1,
+    EToken.MUL: 2,
+    EToken.DIV: 2,
+}
+
 
 class Interpreter(NodeVisitor):
 
     def __init__(
             self,
-            parser: Parser
+            parser: Parser,
+            env: Mapping[str, int] | None = None
     ):
         self.__parser = parser
+        self.__env = {} if env is None else env
+
+    @property
+    def env(self) -> Mapping[str, int]: return self.__env
+
+    @env.setter
+    def env(self, env: Mapping[str, int]): self.__env = env
 
     def visit_integer(self, node: Integer) -> int:
-        # print(node.value)
-        print(node.value.val, end='')
         return node.value.val
 
+    def visit_var(self, node: Var) -> int:
+        try:
+            return self.__env[node.value.val]
+        except KeyError:
+            raise NameError(f'未定义的变量: {node.value.val}') from None
+
     def visit_bin_op(self, node: BinOp) -> int:
-        if node.op.typ == EToken.PLUS:
-            print(f'({node.op.val}', end='')
-            left = self.visit(node.left)
-            right = self.visit(node.right)
-            print(')', end='')
-            # print(node.op)
-            return left + right
-        if node.op.typ == EToken.MINUS:
-            print(f'({node.op.val}', end='')
-            left = self.visit(node.left)
-            right = self.visit(node.right)
-            print(')', end='')
-            # print(node.op)
-            return left - right
-        if node.op.typ == EToken.MUL:
-            print(f'({node.op.val}', end='')
-            left = self.visit(node.left)
-            right = self.visit(node.right)
-            print(')', end='')
-            # print(node.op)
-            return left * right
-        if node.op.typ == EToken.DIV:
-            print(f'({node.op.val}', end='')
-            left = self.visit(node.left)
-            right = self.visit(node.right)
-            print(')', end='')
-            # print(node.op)
-            return left // right
+        return BIN_OPS[node.op.typ](self.visit(node.left), self.visit(node.right))
 
     def interpret(self):
         ast: AstNode = self.__parser.parse()
         return self.visit(ast)
 
-def main():
+
+class PrefixRenderer(NodeVisitor):
+
+    # 输出形如(+1(*23))的前缀表示, 所有片段先放进列表, 最后一次拼接
+
+    def __init__(self):
+        self.__parts: list[str] = []
+
+    def visit_integer(self, node: Integer):
+        self.__parts.append(str(node.value.val))
+
+    def visit_var(self, node: Var):
+        self.__parts.append(node.value.val)
+
+    def visit_bin_op(self, node: BinOp):
+        self.__parts.append(f'({node.op.val}')
+        self.visit(node.left)
+        self.visit(node.right)
+        self.__parts.append(')')
+
+    def render(self, node: AstNode) -> str:
+        self.__parts = []
+        self.visit(node)
+        return ''.join(self.__parts)
+
+
+class InfixRenderer(NodeVisitor):
+
+    # 只在优先级或结合性需要时加括号, 输出可以被Parser解析回同样的树
+
+    def __init__(self):
+        self.__parts: list[str] = []
+
+    def visit_integer(self, node: Integer) -> int:
+        value = node.value.val
+        # 语法里没有一元负号, 常量折叠得到的负数写成(0 - n), 解析回来值不变
+        self.__parts.append(str(value) if value >= 0 else f'(0 - {-value})')
+        return 3
+
+    def visit_var(self, node: Var) -> int:
+        self.__parts.append(node.value.val)
+        return 3
+
+    def visit_bin_op(self, node: BinOp) -> int:
+        prec = PRECEDENCE[node.op.typ]
+        self.__child(node.left, prec)
+        self.__parts.append(f' {node.op.val} ')
+        self.__child(node.right, prec + 1)
+        return prec
+
+    def __child(self, node: AstNode, prec: int):
+        if isinstance(node, BinOp) and PRECEDENCE[node.op.typ] < prec:
+            self.__parts.append('(')
+            self.visit(node)
+            self.__parts.append(')')
+        else:
+            self.visit(node)
+
+    def render(self, node: AstNode) -> str:
+        self.__parts = []
+        self.visit(node)
+        return ''.join(self.__parts)
+
+
+class RpnRenderer(NodeVisitor):
+
+    # 逆波兰表示, token之间用空格分隔
+
+    def __init__(self):
+        self.__parts: list[str] = []
+
+    def visit_integer(self, node: Integer):
+        self.__parts.append(str(node.value.val))
+
+    def visit_var(self, node: Var):
+        self.__parts.append(node.value.val)
+
+    def visit_bin_op(self, node: BinOp):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.__parts.append(node.op.val)
+
+    def render(self, node: AstNode) -> str:
+        self.__parts = []
+        self.visit(node)
+        return ' '.join(self.__parts)
+
+
+RENDERERS: dict[str, Callable[[], PrefixRenderer | InfixRenderer | RpnRenderer]] = {
+    'prefix': PrefixRenderer,
+    'infix': InfixRenderer,
+    'rpn': RpnRenderer,
+}
+
+
+def evaluate_many(
+        texts: Iterable[str],
+        parse: Callable[[str], AstNode] | None = None,
+        env: Mapping[str, int] | None = None
+) -> Iterator[tuple[int | None, Exception | None]]:
+    # 单条表达式出错时产出(None, 异常), 不中断整批
+    # 默认整批共用一个RegexLexer(一条正则扫完一行, 比逐字符的Lexer快)和Parser, 每条表达式只重置状态;
+    # 解析结果按文本放进这一批自己的ParseCache, 批里重复的行不再解析
+    # parse可替换为其他解析函数, 例如跨批共享的cache.ParseCache().get
+    if parse is None:
+        from cache import ParseCache
+        parser = Parser(RegexLexer(''))
+
+        def compile(text: str) -> AstNode:
+            parser.reset(text)
+            return parser.parse()
+
+        # 不限字节数, 不必逐个数节点估算大小
+        parse = ParseCache(compile, sizeof=lambda text, value: 0).get
+    interpreter = Interpreter(None, env)
+    for text in texts:
+        try:
+            yield interpreter.visit(parse(text)), None
+        except Exception as e:
+            yield None, e
+
+
+def evaluate_chunk(
+        chunk: tuple[int, list[str]],
+        env: Mapping[str, int] | None = None
+) -> tuple[int, list[str], int, float]:
+    # 在工作进程里求值一块连续的行, 返回(首行下标, 每行的输出, 进程号, 耗时)
+    first, lines = chunk
+    start = time.perf_counter()
+    outputs: list[str] = []
+    texts = [line.strip() for line in lines]
+    results = evaluate_many((text for text in texts if text), env=env)
+    for text in texts:
+        if not text:
+            outputs.append('')
+            continue
+        value, error = next(results)
+        outputs.append(str(value) if error is None else f'error: {type(error).__name__}: {error}')
+    return first, outputs, os.getpid(), time.perf_counter() - start
+
+
+def read_chunks(lines: Iterable[str], chunk_size: int) -> Iterator[tuple[int, list[str]]]:
+    lines = iter(lines)
+    first = 0
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield first, chunk
+        first += len(chunk)
+
+
+def batch(args: argparse.Namespace):
+    env = defines(args)
+    workers = args.workers or os.cpu_count() or 1
+    # 同时在途的块数有上限, 大文件不会整个读进内存
+    window = workers * 2
+    stats: dict[int, list[float]] = {}
+    total = 0
+    start = time.perf_counter()
+
+    def record(result: tuple[int, list[str], int, float]):
+        first, outputs, pid, seconds = result
+        worker = stats.setdefault(pid, [0, 0.0])
+        worker[0] += len(outputs)
+        worker[1] += seconds
+        if args.unordered:
+            out.writelines(f'{first + i + 1}\t{line}\n' for i, line in enumerate(outputs))
+        else:
+            out.writelines(f'{line}\n' for line in outputs)
+        return len(outputs)
+
+    with open(args.file, encoding='utf-8') as src, \
+            (open(args.output, 'w', encoding='utf-8') if args.output else contextlib.nullcontext(sys.stdout)) as out, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: collections.deque[concurrent.futures.Future] = collections.deque()
+        for chunk in read_chunks(src, args.chunk_size):
+            pending.append(executor.submit(evaluate_chunk, chunk, env))
+            if len(pending) < window:
+                continue
+            if args.unordered:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    total += record(future.result())
+            else:
+                total += record(pending.popleft().result())
+        if args.unordered:
+            for future in concurrent.futures.as_completed(pending):
+                total += record(future.result())
+        else:
+            while pending:
+                total += record(pending.popleft().result())
+
+    seconds = time.perf_counter() - start
+    for pid, (count, busy) in sorted(stats.items()):
+        print(f'worker {pid}: {int(count)} 条, 忙碌 {busy:.2f} s, {count / busy if busy else 0:.0f} 条/s', file=sys.stderr)
+    print(f'total: {total} 条, {seconds:.2f} s, {total / seconds if seconds else 0:.0f} 条/s, {workers} 个进程', file=sys.stderr)
+
+
+def positive_int(text: str) -> int:
+    value = int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f'必须是正整数: {text}')
+    return value
+
+
+def arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='spi')
+    parser.add_argument(
+        '--backend',
+        choices=('tree', 'vm', 'iterative'),
+        default='tree',
+        help='tree: 遍历AST求值; vm: 编译为字节码后在栈虚拟机上求值; iterative: 显式栈解析和求值, 不受嵌套深度限制',
+    )
+    parser.add_argument(
+        '-O', '--optimize',
+        action='store_true',
+        help='求值前做常量折叠和代数化简, 并输出折叠的节点数',
+    )
+    parser.add_argument(
+        '--render',
+        choices=(*RENDERERS, 'none'),
+        default='prefix',
+        help='求值前输出AST的文本形式, none表示只输出结果',
+    )
+    parser.add_argument(
+        '--cse',
+        action='store_true',
+        help='合并相同的子表达式为共享节点, 求值时每个共享节点只算一次, 并输出共享比例',
+    )
+    parser.add_argument(
+        '-D', '--define',
+        action='append',
+        default=[],
+        metavar='NAME=VALUE',
+        help='定义变量, 可以多次指定',
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='统计token数, 各类节点数, 访问次数, 最大递归深度和各阶段耗时, 输出在结果之后; 非tree后端或--cse时访问次数和深度标为未统计',
+    )
+    parser.add_argument(
+        '--result-cache',
+        metavar='PATH',
+        help='把求值结果按AST持久化到sqlite文件, 下次遇到相同的表达式和变量取值时直接读出; 退出时输出命中率',
+    )
+
+    commands = parser.add_subparsers(dest='command')
+    batch_parser = commands.add_parser('batch', help='多进程批量求值一个每行一条表达式的文件')
+    batch_parser.add_argument('file', help='输入文件, 每行一条表达式')
+    batch_parser.add_argument('-o', '--output', help='输出文件, 默认写到标准输出')
+    batch_parser.add_argument('-w', '--workers', type=positive_int, default=None, help='工作进程数, 默认为CPU核数')
+    batch_parser.add_argument('-c', '--chunk-size', type=positive_int, default=1000, help='每个任务包含的行数')
+    batch_parser.add_argument(
+        '--unordered',
+        action='store_true',
+        help='按完成顺序输出, 每行前加上"行号\\t"; 默认按输入顺序输出',
+    )
+    serve_parser = commands.add_parser('serve', help='启动asyncio服务, 按行接收表达式并按顺序返回结果')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--unix', metavar='PATH', help='监听Unix域套接字, 指定后忽略--host/--port')
+    serve_parser.add_argument('-w', '--workers', type=positive_int, default=None, help='求值进程数, 默认为CPU核数')
+    serve_parser.add_argument('--max-pending', type=positive_int, default=None, help='所有连接共享的进程池在途任务上限, 默认为进程数的4倍')
+    serve_parser.add_argument('--per-connection', type=positive_int, default=64, help='每个连接的在途请求上限')
+    serve_parser.add_argument('--inline-limit', type=int, default=256, help='不超过这个长度的表达式直接在事件循环里求值')
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    args = arg_parser().parse_args(argv)
+    if args.command == 'batch':
+        batch(args)
+    elif args.command == 'serve':
+        import server
+        server.main(args, defines(args))
+    else:
+        repl(args)
+
+
+def defines(args: argparse.Namespace) -> dict[str, int]:
+    env: dict[str, int] = {}
+    for definition in args.define:
+        name, _, value = definition.partition('=')
+        env[name.strip()] = int(value)
+    return env
+
+
+def repl(args: argparse.Namespace):
+    env = defines(args)
+    results = None
+    if args.result_cache:
+        from resultcache import ResultCache
+        results = ResultCache(args.result_cache)
+    try:
+        loop(args, env, results)
+    finally:
+        if results is not None:
+            print(results, file=sys.stderr)
+            results.close()
+
+
+def loop(args: argparse.Namespace, env: dict[str, int], results):
     while True:
         try:
             try:
@@ -278,12 +935,99 @@ def main():
         if not text:
             continue
 
-        lexer = Lexer(text)
-        parser = Parser(lexer)
-        interpreter = Interpreter(parser)
-        result = interpreter.interpret()
-        print(f'\n{result}')
+        stats = None
+        if args.profile:
+            from profiler import ProfileStats, ProfilingInterpreter, ProfilingLexer, ProfilingParser
+            stats = ProfileStats()
+            lexer = ProfilingLexer(text, stats)
+        else:
+            lexer = Lexer(text)
+        if args.backend == 'iterative':
+            from iterative import IterativeParser
+        start = time.perf_counter()
+        try:
+            # Parser在构造时就读入第一个token, 开头的词法错误也要在这里报告
+            if args.backend == 'iterative':
+                parser = IterativeParser(lexer)
+                if stats is not None:
+                    stats.parse_traced = False
+            elif stats is not None:
+                parser = ProfilingParser(lexer, stats)
+            else:
+                parser = Parser(lexer)
+            ast = parser.parse()
+        except ParseError as e:
+            # 输入只有一行, 在出错的列下面标出位置
+            print(text)
+            print(f'{" " * (e.column - 1)}^ {e}')
+            continue
+        if stats is not None:
+            # 词法分析穿插在解析中, 它的时间已经单独记在lex里
+            stats.add_phase('parse', time.perf_counter() - start - stats.phases.get('lex', 0.0))
+            stats.count_nodes(ast)
+        folded = None
+        if args.optimize:
+            from optimizer import fold
+            start = time.perf_counter()
+            ast, folded = fold(ast, env)
+            if stats is not None:
+                stats.add_phase('fold', time.perf_counter() - start)
+        # 键在共享子表达式之前计算, 序列化按树展开, 不能用在DAG上
+        key = None
+        if results is not None:
+            from resultcache import result_key
+            key = result_key(ast, env)
+        sharing = None
+        if args.cse:
+            from dag import share
+            start = time.perf_counter()
+            ast, sharing = share(ast)
+            if stats is not None:
+                stats.add_phase('share', time.perf_counter() - start)
+
+        start = time.perf_counter()
+        error = None
+        traced = False
+        try:
+            cached = None if key is None else results.get(key)
+            if cached is not None:
+                result = cached
+            elif args.backend == 'vm':
+                from vm import VM, compile_ast
+                result = VM().run(compile_ast(ast), env)
+            elif args.backend == 'iterative':
+                from iterative import IterativeInterpreter
+                result = IterativeInterpreter(env).evaluate(ast)
+            elif args.cse:
+                from dag import MemoInterpreter
+                result = MemoInterpreter(env=env).evaluate(ast)
+            elif stats is not None:
+                result = ProfilingInterpreter(stats, env).visit(ast)
+                traced = True
+            else:
+                interpreter = Interpreter(parser, env)
+                result = interpreter.visit(ast)
+        except Exception as e:
+            # 除以0, 未定义的变量等求值错误只报告这一条, 不退出REPL
+            error = e
+        else:
+            if key is not None and cached is None:
+                results.put(key, result)
+        if stats is not None:
+            stats.add_phase('eval', time.perf_counter() - start)
+            stats.eval_traced = traced
+        if args.render != 'none':
+            print(RENDERERS[args.render]().render(ast))
+        print(result if error is None else f'error: {type(error).__name__}: {error}')
+        if folded is not None:
+            print(f'folded: {folded}')
+        if sharing is not None:
+            print(f'shared: {sharing.unique}/{sharing.total} 个节点, 节省 {sharing.ratio:.1%}')
+        if stats is not None:
+            print(stats.format())
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # 以模块spi的身份运行, 保证vm等同目录模块和这里用的是同一份EToken等类
+    import spi
+    spi.main()
@@ -0,0 +1,62 @@
+import struct
+import unittest
+
+from arena import ArenaInterpreter, ArenaParser, AstArena, HEADER
+from spi import Lexer, RegexLexer
+from testsupport import exprs, parse, render, tree_eval
+
+
+class ArenaTest(unittest.TestCase):
+
+    def test_matches_tree_interpreter(self):
+        interpreter = ArenaInterpreter()
+        for text in exprs(300, 7):
+            self.assertEqual(interpreter.evaluate(ArenaParser(RegexLexer(text)).parse()), tree_eval(text), text)
+            self.assertEqual(interpreter.evaluate(ArenaParser(Lexer(text)).parse()), tree_eval(text), text)
+
+    def test_bytes_round_trip(self):
+        interpreter = ArenaInterpreter()
+        for text in exprs(50, 6) + [f'{1 << 200} - {1 << 70} * 3', f'0 - {1 << 70}']:
+            arena = ArenaParser(RegexLexer(text)).parse()
+            again = AstArena.from_bytes(arena.to_bytes())
+            self.assertEqual(interpreter.evaluate(again), interpreter.evaluate(arena), text)
+            self.assertEqual(again.to_bytes(), arena.to_bytes())
+        with self.assertRaises(ValueError):
+            AstArena.from_bytes(b'XXXX' + arena.to_bytes()[4:])
+
+    def test_bytes_layout(self):
+        # 各列固定为4字节小端, 不随主机变化
+        data = ArenaParser(RegexLexer('7 - 300')).parse().to_bytes()
+        columns = struct.unpack_from('<12i', data, HEADER.size)
+        self.assertEqual(columns, (0, 0, 2, -1, -1, 0, -1, -1, 1, 0, 1, -1))
+
+    def test_length_mismatch(self):
+        data = ArenaParser(RegexLexer(f'1 + {1 << 70} * 3')).parse().to_bytes()
+        for bad in (data[:HEADER.size - 1], data[:HEADER.size + 8], data[:-1], data + b'\0'):
+            with self.assertRaises(ValueError):
+                AstArena.from_bytes(bad)
+
+    def test_ast_round_trip(self):
+        for text in exprs(50, 6):
+            node = parse(text)
+            arena = AstArena.from_ast(node)
+            self.assertEqual(render(arena.to_ast()), render(node))
+            self.assertEqual(ArenaInterpreter().evaluate(arena), tree_eval(text))
+
+    def test_subtree(self):
+        arena = ArenaParser(RegexLexer('(1 + 2) * (3 - 4)')).parse()
+        left = arena.lefts[arena.root]
+        self.assertEqual(ArenaInterpreter().evaluate(arena, left), 3)
+        self.assertEqual(render(arena.to_ast(left)), '(+12)')
+
+    def test_long_chain(self):
+        text = '-'.join(['1'] * 100_000)
+        self.assertEqual(ArenaInterpreter().evaluate(ArenaParser(RegexLexer(text)).parse()), 1 - 99_999)
+
+    def test_variables_are_rejected(self):
+        with self.assertRaises(TypeError):
+            AstArena.from_ast(parse('x + 1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import threading
+import unittest
+
+from cache import count_nodes, parse, ParseCache
+from canonical import source_key
+from spi import PrefixRenderer
+
+
+class ParseCacheTest(unittest.TestCase):
+
+    def test_hit_returns_same_tree(self):
+        cache = ParseCache()
+        first = cache.get('1 + 2 * 3')
+        self.assertIs(cache.get('1 + 2 * 3'), first)
+        self.assertEqual(PrefixRenderer().render(first), '(+1(*23))')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertIn('1 + 2 * 3', cache)
+
+    def test_lru_eviction(self):
+        cache = ParseCache(max_entries=2)
+        cache.get('1')
+        cache.get('2')
+        cache.get('1')
+        cache.get('3')
+        self.assertIn('1', cache)
+        self.assertNotIn('2', cache)
+        self.assertEqual((len(cache), cache.evictions), (2, 1))
+
+    def test_byte_budget(self):
+        cache = ParseCache(max_bytes=2000)
+        for i in range(50):
+            cache.get(f'{i} + {i} * {i}')
+        self.assertLessEqual(cache.bytes, 2000)
+        self.assertGreater(cache.evictions, 0)
+        self.assertEqual(cache.stats()['entries'], len(cache))
+        # 单独一项就超过预算的不进缓存
+        cache.get('+'.join(['1'] * 1000))
+        self.assertNotIn('+'.join(['1'] * 1000), cache)
+
+    def test_errors_are_not_cached(self):
+        cache = ParseCache()
+        for _ in range(2):
+            with self.assertRaises(EOFError):
+                cache.get('1 +')
+        self.assertEqual((len(cache), cache.misses), (0, 2))
+
+    def test_key(self):
+        cache = ParseCache(key=source_key)
+        first = cache.get('1 + 2')
+        self.assertIs(cache.get(' 1+2 '), first)
+        self.assertIn('1+ 2', cache)
+        self.assertIsNot(cache.get('12'), first)
+
+    def test_threads(self):
+        cache = ParseCache(max_entries=8)
+        texts = [f'{i} * ({i} + 1)' for i in range(32)]
+        errors = []
+
+        def run():
+            try:
+                for text in texts * 4:
+                    self.assertEqual(count_nodes(cache.get(text)), 5)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.hits + cache.misses, 4 * 4 * len(texts))
+        self.assertEqual(count_nodes(parse('1')), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
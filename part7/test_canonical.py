@@ -0,0 +1,70 @@
+import random
+import unittest
+
+from canonical import canonical_text, Canonicalizer, fingerprint, normalize, source_key
+from spi import BinOp, EToken, InfixRenderer, Interpreter, Parser, RegexLexer
+from testsupport import exprs, parse, spaced
+
+
+def swap(node):
+    if isinstance(node, BinOp):
+        left, right = swap(node.left), swap(node.right)
+        if node.op.typ in (EToken.PLUS, EToken.MUL):
+            left, right = right, left
+        return BinOp(left, node.op, right)
+    return node
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_spelling_does_not_matter(self):
+        rng = random.Random(6)
+        for text in exprs(200, 6, seed=6):
+            node = parse(text)
+            for variant in (spaced(rng, text), f'(({text}))'):
+                self.assertEqual(fingerprint(parse(variant)), fingerprint(node), variant)
+
+    def test_commutative(self):
+        for text in exprs(200, 6, seed=7):
+            node = parse(text)
+            other = parse(InfixRenderer().render(swap(node)))
+            self.assertEqual(fingerprint(other, True), fingerprint(node, True), text)
+            self.assertEqual(canonical_text(other, True), canonical_text(node, True), text)
+            self.assertEqual(Interpreter(None).visit(normalize(other, True)), Interpreter(None).visit(node), text)
+
+    def test_distinct(self):
+        texts = ['1 + 2', '2 + 1', '1 - 2', '2 - 1', '1 * 2', '12', 'x + 1', 'y + 1', '1 + 2 + 3', '1 + (2 + 3)', '0 - 1']
+        self.assertEqual(len({fingerprint(parse(text)) for text in texts}), len(texts))
+        self.assertNotEqual(fingerprint(parse('2 - 1'), True), fingerprint(parse('1 - 2'), True))
+        self.assertNotEqual(fingerprint(parse('x')), fingerprint(parse('0')))
+
+    def test_names(self):
+        canonicalizer = Canonicalizer()
+        canonicalizer.fingerprint(parse('b * a + b'))
+        canonicalizer.fingerprint(parse('c'))
+        self.assertEqual(canonicalizer.names, ('b', 'a', 'c'))
+
+    def test_normalize_reuses_subtrees(self):
+        node = parse('(a - 1) * (2 + b)')
+        normalized = normalize(node, True)
+        self.assertTrue(normalized.left is node.left or normalized.right is node.left)
+        self.assertIs(normalize(node), node)
+
+    def test_deep_tree(self):
+        node = Parser(RegexLexer('+'.join(f'x{i % 7}*{i}' for i in range(50_000)))).parse()
+        self.assertEqual(len(fingerprint(node, True)), 16)
+
+
+class SourceKeyTest(unittest.TestCase):
+
+    def test_whitespace(self):
+        self.assertEqual(source_key(' 1 +\t2\n'), '1+2')
+        self.assertEqual(source_key('( x * y )'), '(x*y)')
+        self.assertEqual(source_key('1 2'), '1 2')
+        self.assertEqual(source_key('x  \n y + 0x1F   3'), 'x y+0x1F 3')
+        self.assertNotEqual(source_key('1 2'), source_key('12'))
+        self.assertNotEqual(source_key('a b'), source_key('ab'))
+
+
+if __name__ == '__main__':
+    unittest.main()
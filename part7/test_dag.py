@@ -0,0 +1,56 @@
+import unittest
+
+from cache import count_nodes
+from dag import HashConser, MemoInterpreter, share
+from spi import Interpreter, Lexer, Parser
+from testsupport import parse, render
+
+
+class HashConsTest(unittest.TestCase):
+
+    def test_shared_subtrees(self):
+        node = parse('(a + 1) * (a + 1) - (a + 1)')
+        dag, stats = share(node)
+        self.assertEqual((stats.total, stats.unique), (11, 5))
+        self.assertAlmostEqual(stats.ratio, 1 - 5 / 11)
+        self.assertIs(dag.left.left, dag.left.right)
+        self.assertIs(dag.left.left, dag.right)
+        self.assertEqual(render(dag), render(node))
+
+    def test_across_trees(self):
+        conser = HashConser()
+        first, _ = conser.share(parse('x * 2 + 3'))
+        second, _ = conser.share(parse('(x * 2) - 3'))
+        self.assertIs(first.left, second.left)
+        self.assertIs(first.right, second.right)
+
+    def test_unique_tree_is_kept(self):
+        node = parse('1 + 2 * x')
+        dag, stats = share(node)
+        self.assertIs(dag, node)
+        self.assertEqual((stats.total, stats.unique), (5, 5))
+
+
+class MemoInterpreterTest(unittest.TestCase):
+
+    def test_matches_tree(self):
+        text = '(a + 3)'
+        for depth in range(8):
+            text = f'({text} * {text} - {text} / {depth + 2})'
+        node = parse(text)
+        dag, stats = share(node)
+        env = {'a': 5}
+        self.assertEqual(MemoInterpreter(env=env).evaluate(dag), Interpreter(None, env).visit(node))
+        self.assertLess(stats.unique, count_nodes(node) // 100)
+
+    def test_memo_is_per_call(self):
+        interpreter = MemoInterpreter(env={'a': 1})
+        dag, _ = share(parse('a * a'))
+        self.assertEqual(interpreter.evaluate(dag), 1)
+        interpreter.env = {'a': 3}
+        self.assertEqual(interpreter.evaluate(dag), 9)
+        self.assertEqual(MemoInterpreter(Parser(Lexer('2 * 3'))).interpret(), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
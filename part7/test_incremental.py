@@ -0,0 +1,84 @@
+import random
+import unittest
+
+from incremental import CachedInterpreter, IncrementalParser
+from spi import Interpreter, Parser, RegexLexer
+from testsupport import exprs, render
+
+
+class IncrementalParserTest(unittest.TestCase):
+
+    def assertSameAsFresh(self, parser: IncrementalParser):
+        fresh = IncrementalParser(parser.text)
+        self.assertEqual(render(parser.ast), render(fresh.ast), parser.text)
+        if fresh.error is None:
+            self.assertIsNone(parser.error, parser.text)
+            self.assertEqual(render(parser.ast), render(Parser(RegexLexer(parser.text)).parse()), parser.text)
+        else:
+            self.assertEqual(parser.error.offset, fresh.error.offset, parser.text)
+
+    def test_random_edits(self):
+        # 随机位置插入, 删除, 替换, 中途会出现非法的文本, 之后的编辑可能再把它改回合法
+        rng = random.Random(3)
+        alphabet = '0123456789+-*/() xy'
+        for text in exprs(40, 4, seed=3) + ['+'.join(f'{i}*x' for i in range(1, 30))]:
+            parser = IncrementalParser(text)
+            for _ in range(25):
+                offset = rng.randint(0, len(parser.text))
+                removed = rng.randint(0, min(3, len(parser.text) - offset))
+                inserted = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 3)))
+                parser.edit(offset, removed, inserted)
+                self.assertSameAsFresh(parser)
+
+    def test_invalid_text(self):
+        parser = IncrementalParser('(1 + 2')
+        self.assertIsNone(parser.ast)
+        self.assertEqual(parser.error.offset, 6)
+        node = parser.edit(6, 0, ')')
+        self.assertIsNone(parser.error)
+        self.assertEqual(render(node), '(+12)')
+        self.assertIsNone(parser.edit(0, 1, '$'))
+        self.assertEqual(parser.error.offset, 0)
+        with self.assertRaises(ValueError):
+            parser.edit(5, 10, '')
+
+    def test_reuses_untouched_subtrees(self):
+        text = '(1 + 2) * 3 + 4 * 5 - (6 / 7)'
+        parser = IncrementalParser(text)
+        before = parser.ast
+        parser.edit(text.index('4'), 1, '9')
+        after = parser.ast
+        self.assertEqual(render(after), render(Parser(RegexLexer(parser.text)).parse()))
+        self.assertIs(after.left.left.left, before.left.left.left)
+        self.assertIs(after.right, before.right)
+        self.assertEqual(parser.relexed, 1)
+        self.assertEqual(parser.group_span(after.right), (text.index('(6'), len(text)))
+
+    def test_flat_formula(self):
+        # 不带括号的长链, 编辑中间的一项时只有它所在的项和链上后面的加法节点是新建的
+        text = '+'.join(f'{i % 9 + 1}*{i % 7 + 1}' for i in range(200))
+        parser = IncrementalParser(text)
+        interpreter = CachedInterpreter()
+        interpreter.evaluate(parser.ast)
+        offset = text.index('+', len(text) // 2) + 1
+        node = parser.edit(offset, 1, '8')
+        self.assertEqual(interpreter.evaluate(node), Interpreter(Parser(RegexLexer(parser.text))).interpret())
+        self.assertLess(interpreter.computed, 200)
+        self.assertGreater(parser.reused, 0)
+
+
+class CachedInterpreterTest(unittest.TestCase):
+
+    def test_env_change_clears_cache(self):
+        node = IncrementalParser('x * 2 + 1').ast
+        interpreter = CachedInterpreter({'x': 1})
+        self.assertEqual(interpreter.evaluate(node), 3)
+        self.assertEqual(interpreter.evaluate(node), 3)
+        self.assertEqual(interpreter.computed, 0)
+        interpreter.env = {'x': 5}
+        self.assertEqual(interpreter.evaluate(node), 11)
+        self.assertEqual(interpreter.computed, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
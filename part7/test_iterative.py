@@ -0,0 +1,39 @@
+import unittest
+
+from iterative import evaluate, IterativeInterpreter, IterativeParser
+from spi import Lexer, ParseError, RegexLexer
+from testsupport import exprs, parse, render, tree_eval
+
+
+class IterativeTest(unittest.TestCase):
+
+    def test_matches_recursive_parser(self):
+        for text in exprs(300, 7):
+            node = IterativeParser(RegexLexer(text)).parse()
+            self.assertEqual(render(node), render(parse(text)), text)
+            self.assertEqual(IterativeInterpreter().evaluate(node), tree_eval(text), text)
+
+    def test_associativity(self):
+        self.assertEqual(evaluate('2 - 3 - 4'), -5)
+        self.assertEqual(evaluate('64 / 4 / 2'), 8)
+        self.assertEqual(evaluate('2 + 3 * 4 - 6 / 2'), 11)
+
+    def test_deep_nesting(self):
+        depth = 100_000
+        self.assertEqual(evaluate('(' * depth + '1' + '+1)' * depth), depth + 1)
+        self.assertEqual(evaluate('-'.join(['1'] * depth)), 2 - depth)
+
+    def test_variables(self):
+        self.assertEqual(evaluate('x * (y - 1)', {'x': 3, 'y': 5}), 12)
+        with self.assertRaises(NameError):
+            evaluate('x + y', {'x': 1})
+
+    def test_errors(self):
+        for text, offset in (('(1 + 2', 6), ('1 + * 2', 4), (')', 0)):
+            with self.assertRaises(ParseError) as cm:
+                IterativeParser(Lexer(text)).parse()
+            self.assertEqual(cm.exception.offset, offset, text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import io
+import mmap
+import random
+import sys
+import tempfile
+import unittest
+
+from spi import decimal, EToken, Lexer, parse_integer, ParseError, Parser, RegexLexer, span
+from testsupport import exprs, spaced, stream, tokens
+
+
+def error(lexer: Lexer | RegexLexer) -> tuple[int, int, int]:
+    try:
+        tokens(lexer)
+    except ParseError as e:
+        return e.offset, e.line, e.column
+    raise AssertionError('没有报错')
+
+
+class LexerEquivalenceTest(unittest.TestCase):
+
+    SAMPLES = [
+        '', '1', '  7', '123456789012345678901234567890', '((1))', '1 +\t2\n* 3',
+        'x_1 + _y * αβ', '0x1F + 0o17 - 0b101 * 0XaB', '1_000 * 2', '007 + 0', '²', 'x² + ½ * ٣',
+    ]
+
+    def test_random_expressions(self):
+        rng = random.Random(1)
+        samples = exprs(200, 6) + [spaced(rng, text) for text in exprs(200, 6, seed=2)]
+        for text in samples:
+            self.assertEqual(stream(Lexer(text)), stream(RegexLexer(text)), text)
+
+    def test_edge_cases(self):
+        for text in self.SAMPLES:
+            self.assertEqual(stream(Lexer(text)), stream(RegexLexer(text)), text)
+        self.assertEqual(stream(Lexer('x1+2')), [
+            (EToken.ID, 'x1'), (EToken.PLUS, '+'), (EToken.INTEGER, 2), (EToken.EOF, None),
+        ])
+
+    def test_error_position(self):
+        for text, expected in (
+                ('1 + $', (4, 1, 5)),
+                ('1 +\n  2 @', (8, 2, 5)),
+                ('1\n\n12abc', (3, 3, 1)),
+                ('2 * 0xZ', (4, 1, 5)),
+                ('1__2', (0, 1, 1)),
+                ('0b2', (0, 1, 1)),
+                ('1_', (0, 1, 1)),
+        ):
+            self.assertEqual(error(Lexer(text)), expected, text)
+            self.assertEqual(error(RegexLexer(text)), expected, text)
+
+    def test_parser_error_position(self):
+        # Parser报错时位置在它当前看到的token的起点
+        for text, expected in (('1 +\n  )', (6, 2, 3)), ('(1 + 2', (6, 1, 7))):
+            for lexer in (Lexer(text), RegexLexer(text)):
+                with self.assertRaises(ParseError) as cm:
+                    Parser(lexer).parse()
+                self.assertEqual((cm.exception.offset, cm.exception.line, cm.exception.column), expected, text)
+
+
+class ChunkedInputTest(unittest.TestCase):
+
+    def test_chunks_split_tokens(self):
+        text = ' '.join(self.samples())
+        expected = stream(Lexer(text))
+        for size in (1, 2, 3, 7, 64):
+            pieces = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(stream(Lexer(pieces)), expected, size)
+            self.assertEqual(stream(Lexer(iter(pieces))), expected, size)
+
+    def test_identifier_across_chunks(self):
+        text = 'long_variable_name_1 * αβγδ_2 + x'
+        expected = [(EToken.ID, 'long_variable_name_1'), (EToken.ID, 'αβγδ_2'), (EToken.ID, 'x')]
+        for size in (1, 4, 9):
+            found = [t for t in stream(Lexer([text[i:i + size] for i in range(0, len(text), size)])) if t[0] == EToken.ID]
+            self.assertEqual(found, expected, size)
+        found = [t for t in stream(Lexer(text.encode('utf-8'))) if t[0] == EToken.ID]
+        self.assertEqual(found, expected)
+
+    def test_error_position_across_chunks(self):
+        text = '1 +\n  2 *\n 0x1F + 12abc'
+        expected = error(Lexer(text))
+        self.assertEqual(expected, (18, 3, 9))
+        for size in (1, 2, 5):
+            self.assertEqual(error(Lexer([text[i:i + size] for i in range(0, len(text), size)])), expected, size)
+
+    def test_bytes_and_files(self):
+        # 多字节的变量名会在块边界被切开
+        text = 'αβγ * (12 + δ_1) / 0x7F'
+        expected = stream(Lexer(text))
+        data = text.encode('utf-8')
+        self.assertEqual(stream(Lexer(data)), expected)
+        self.assertEqual(stream(Lexer(bytearray(data))), expected)
+        self.assertEqual(stream(Lexer(io.StringIO(text))), expected)
+        self.assertEqual(stream(Lexer(io.BytesIO(data))), expected)
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                self.assertEqual(stream(Lexer(view)), expected)
+
+    @staticmethod
+    def samples() -> list[str]:
+        return exprs(20, 5, seed=3) + ['x_1 + _y', '0x1F + 0o17 - 0b1_01', '1_000_000 * 2']
+
+
+
+class SpanTest(unittest.TestCase):
+
+    TEXT = ' (12 + x1)\n * 0x1F - _y '
+
+    def test_literal_and_identifier_spans(self):
+        for lexer_type in (Lexer, RegexLexer):
+            lexer = lexer_type(self.TEXT, spans=True)
+            found = [
+                (token.val, self.TEXT[token.start:token.end])
+                for token in tokens(lexer) if token.typ in (EToken.INTEGER, EToken.ID)
+            ]
+            self.assertEqual(found, [(12, '12'), ('x1', 'x1'), (31, '0x1F'), ('_y', '_y')], lexer_type.__name__)
+
+    def test_spans_do_not_change_tokens(self):
+        for lexer_type in (Lexer, RegexLexer):
+            self.assertEqual(stream(lexer_type(self.TEXT, spans=True)), stream(lexer_type(self.TEXT)))
+
+    def test_node_span(self):
+        for lexer_type in (Lexer, RegexLexer):
+            node = Parser(lexer_type(self.TEXT, spans=True)).parse()
+            # 首尾的括号不属于任何叶子, 范围从第一个叶子到最后一个叶子
+            self.assertEqual(span(node), (self.TEXT.index('12'), self.TEXT.index('_y') + 2))
+            self.assertEqual(span(node.left.left), (self.TEXT.index('12'), self.TEXT.index('x1') + 2))
+        self.assertIsNone(span(Parser(Lexer(self.TEXT)).parse()))
+
+
+
+class IntegerLiteralTest(unittest.TestCase):
+
+    def test_parse_integer(self):
+        for literal, value in (
+                ('0', 0), ('007', 7), ('1_000', 1000), ('0x1F', 31), ('0XaB', 171), ('0o17', 15),
+                ('0b101', 5), ('0x_ff', 255), ('0b1_0', 2),
+        ):
+            self.assertEqual(parse_integer(literal), value, literal)
+        for literal in ('0x', '1__2', '1_', '12abc', '0b2', '0o8', '0xZ', '0_x1'):
+            self.assertIsNone(parse_integer(literal), literal)
+
+    def test_decimal_beyond_str_digits_limit(self):
+        rng = random.Random(9)
+        limit = sys.get_int_max_str_digits()
+        sys.set_int_max_str_digits(0)
+        try:
+            for n in (1, 4000, 4001, 9999, 50_000):
+                digits = ''.join(rng.choice('0123456789') for _ in range(n))
+                self.assertEqual(decimal(digits), int(digits), n)
+            digits = '7' * 20_000
+            expected = int(digits)
+        finally:
+            sys.set_int_max_str_digits(limit)
+        self.assertEqual(stream(Lexer(digits))[0], (EToken.INTEGER, expected))
+        self.assertEqual(stream(RegexLexer('_'.join(digits[i:i + 4] for i in range(0, len(digits), 4))))[0],
+                         (EToken.INTEGER, expected))
+
+    def test_literal_across_chunks(self):
+        text = '0x' + 'f' * 1000
+        self.assertEqual(stream(Lexer([text[i:i + 64] for i in range(0, len(text), 64)]))[0],
+                         (EToken.INTEGER, 16 ** 1000 - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from optimizer import fold
+from spi import InfixRenderer, Interpreter
+from testsupport import exprs, parse, tree_eval
+
+
+def folded(text: str) -> tuple[str, int]:
+    node, count = fold(parse(text))
+    return InfixRenderer().render(node), count
+
+
+class ConstantFolderTest(unittest.TestCase):
+
+    def test_preserves_results(self):
+        for text in exprs(300, 7):
+            node, _ = fold(parse(text))
+            self.assertEqual(Interpreter(None).visit(node), tree_eval(text), text)
+
+    def test_constants(self):
+        self.assertEqual(folded('(1 + 2) * 3 - 4 / 2'), ('7', 4))
+        self.assertEqual(folded('x * (2 + 3)'), ('x * 5', 1))
+
+    def test_identities(self):
+        for text, expected in (
+                ('x + 0', 'x'),
+                ('0 + x', 'x'),
+                ('x - 0', 'x'),
+                ('x * 1', 'x'),
+                ('1 * x', 'x'),
+                ('x / 1', 'x'),
+                ('(x + 0) * (3 - 2)', 'x'),
+                ('0 - x', '0 - x'),
+                ('1 / x', '1 / x'),
+        ):
+            self.assertEqual(folded(text)[0], expected, text)
+
+    def test_division_by_zero_is_kept(self):
+        self.assertEqual(folded('1 / 0')[0], '1 / 0')
+        self.assertEqual(folded('(1 / 0) * 0')[0], '1 / 0 * 0')
+        self.assertEqual(folded('0 * (2 / (1 - 1))')[0], '0 * (2 / 0)')
+        with self.assertRaises(ZeroDivisionError):
+            Interpreter(None).visit(fold(parse('0 * (2 / (1 - 1))'))[0])
+
+    def test_unbound_variable_is_kept(self):
+        # 变量没有绑定时求值会抛NameError, 不能化为0
+        self.assertEqual(folded('y * 0')[0], 'y * 0')
+        self.assertEqual(folded('0 * (x + 1)')[0], '0 * (x + 1)')
+        with self.assertRaises(NameError):
+            Interpreter(None).visit(fold(parse('y * 0'))[0])
+        node, count = fold(parse('y * 0 + x * (0 * z)'), {'x': 1, 'y': 2})
+        self.assertEqual(InfixRenderer().render(node), 'x * (0 * z)')
+        self.assertEqual(count, 2)
+
+    def test_negative_literals_round_trip(self):
+        for text, value in (('a * (1 - 2)', -3), ('(2 - 5) * (0 - 4) - (1 - 8)', 19), ('a / (3 - 10)', -1)):
+            node, _ = fold(parse(text))
+            again = parse(InfixRenderer().render(node))
+            self.assertEqual(Interpreter(None, {'a': 3}).visit(again), value, text)
+        self.assertEqual(folded('a * (1 - 2)')[0], 'a * (0 - 1)')
+
+    def test_unchanged_tree_is_reused(self):
+        node = parse('x * y + z')
+        self.assertEqual(fold(node), (node, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
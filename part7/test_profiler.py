@@ -0,0 +1,49 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from profiler import profile
+from spi import main
+from testsupport import exprs, tree_eval
+
+
+class ProfileTest(unittest.TestCase):
+
+    def test_same_result(self):
+        for text in exprs(100, 6):
+            self.assertEqual(profile(text)[0], tree_eval(text), text)
+
+    def test_counts(self):
+        value, stats = profile('(x + 2) * (3 - x)', {'x': 4})
+        self.assertEqual(value, -6)
+        self.assertEqual(stats.tokens, 12)
+        self.assertEqual(dict(stats.nodes), {'bin_op': 3, 'integer': 2, 'var': 2})
+        self.assertEqual(stats.visits, stats.nodes)
+        self.assertEqual(stats.eval_depth, 3)
+        self.assertGreater(stats.parse_depth, 3)
+        self.assertEqual(set(stats.phases), {'lex', 'parse', 'eval'})
+        self.assertIn('tokens: 12', stats.format())
+
+    def test_errors_propagate(self):
+        with self.assertRaises(ZeroDivisionError):
+            profile('1 / 0')
+
+    def test_untraced_backends(self):
+        # 没有插桩的后端不能输出看似测量过的0
+        for argv, visits, depth in (
+                ([], 'visits: bin_op=1, integer=2', 'max depth: parse=3, eval=2'),
+                (['--backend', 'vm'], 'visits: 未统计', 'max depth: parse=3, eval=未统计'),
+                (['--backend', 'iterative'], 'visits: 未统计', 'max depth: parse=未统计, eval=未统计'),
+                (['--cse'], 'visits: 未统计', 'max depth: parse=3, eval=未统计'),
+        ):
+            out = io.StringIO()
+            with mock.patch('builtins.input', side_effect=['1 + 2', EOFError]), contextlib.redirect_stdout(out):
+                main(['--render', 'none', '--profile', *argv])
+            lines = out.getvalue().splitlines()
+            self.assertIn(visits, lines, argv)
+            self.assertIn(depth, lines, argv)
+
+
+if __name__ == '__main__':
+    unittest.main()
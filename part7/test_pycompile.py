@@ -0,0 +1,81 @@
+import sys
+import unittest
+
+from pycompile import compile_closure, compile_formula, compile_function, compile_with_variables, Formula
+from spi import Interpreter, Lexer, Parser, RegexLexer
+from testsupport import exprs, parse, tree_eval
+
+
+class CompileTest(unittest.TestCase):
+
+    def test_matches_tree_interpreter(self):
+        for text in exprs(300, 7):
+            node = parse(text)
+            self.assertEqual(compile_closure(node)(), tree_eval(text), text)
+            self.assertEqual(compile_function(node)(), tree_eval(text), text)
+
+    def test_variables(self):
+        node = parse('(b - a) * a / c')
+        for compile in (compile_closure, compile_function):
+            self.assertEqual(compile(node)(7, 3, 2), (7 - 3) * 3 // 2)
+        func, variables = compile_with_variables(node)
+        self.assertEqual(variables, ('b', 'a', 'c'))
+        self.assertEqual(func(3, 7, 2), (3 - 7) * 7 // 2)
+
+    def test_big_literals(self):
+        text = f'{10 ** 50} * 3 - {1 << 100}'
+        self.assertEqual(compile_function(parse(text))(), 3 * 10 ** 50 - (1 << 100))
+
+    def test_deep_tree_falls_back(self):
+        # compile()处理不了的深度退回到闭包
+        text = '+'.join(['1'] * 5000)
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 20_000))
+        try:
+            func, _ = compile_with_variables(Parser(RegexLexer(text)).parse())
+            self.assertEqual(func(), 5000)
+        finally:
+            sys.setrecursionlimit(limit)
+
+
+class FormulaTest(unittest.TestCase):
+
+    TEXT = '(price * qty - discount) * (100 + tax) / 100'
+
+    def rows(self) -> list[dict[str, int]]:
+        return [
+            {'price': p, 'qty': q, 'discount': d, 'tax': t}
+            for p, q, d, t in ((10, 3, 5, 8), (999, 1, 0, 0), (1, 50, 100, 25), (-3, 7, 2, 13))
+        ]
+
+    def expected(self) -> list[int]:
+        return [Interpreter(Parser(Lexer(self.TEXT)), row).interpret() for row in self.rows()]
+
+    def test_evaluate(self):
+        formula = compile_formula(self.TEXT)
+        self.assertEqual(formula.variables, ('price', 'qty', 'discount', 'tax'))
+        self.assertEqual([formula.evaluate(row) for row in self.rows()], self.expected())
+        self.assertEqual([formula(**row) for row in self.rows()], self.expected())
+
+    def test_evaluate_many(self):
+        formula = compile_formula(self.TEXT)
+        self.assertEqual(list(formula.evaluate_many(self.rows())), self.expected())
+        rows = [tuple(row[name] for name in formula.variables) for row in self.rows()]
+        self.assertEqual(list(formula.evaluate_rows(rows)), self.expected())
+        self.assertEqual(list(compile_formula('x * 2').evaluate_many([{'x': 1}, {'x': 4}])), [2, 8])
+        self.assertEqual(list(compile_formula('6 / 4').evaluate_many([{}, {}])), [1, 1])
+
+    def test_missing_variable(self):
+        formula = Formula(parse('a + b'))
+        with self.assertRaises(NameError) as cm:
+            formula.evaluate({'a': 1})
+        self.assertIn('b', str(cm.exception))
+        with self.assertRaises(NameError) as cm:
+            list(formula.evaluate_many([{'a': 1, 'b': 2}, {'a': 1}]))
+        self.assertEqual(str(cm.exception), '未定义的变量: b')
+        with self.assertRaises(NameError):
+            list(compile_formula('x * 2').evaluate_many([{'y': 1}]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+from resultcache import decode_int, encode_int, PersistentInterpreter, result_key, ResultCache
+from spi import Lexer, Parser
+from testsupport import parse
+
+
+class ResultKeyTest(unittest.TestCase):
+
+    def test_encoding(self):
+        for value in (0, 1, -1, 127, 128, -129, 1 << 100, -(1 << 100)):
+            self.assertEqual(decode_int(encode_int(value)), value)
+
+    def test_key(self):
+        env = {'x': 3, 'y': 4}
+        self.assertEqual(result_key(parse('x * (y + 1)'), env), result_key(parse('(x) * ((y + 1))'), env))
+        # 交换律下等价的树共用一个键
+        self.assertEqual(result_key(parse('x * (y + 1)'), env), result_key(parse('((1 + y)) * x'), env))
+        self.assertNotEqual(result_key(parse('x - y'), env), result_key(parse('y - x'), env))
+        self.assertNotEqual(result_key(parse('x + 1'), env), result_key(parse('x + 1'), {'x': 4}))
+        # 只有用到的变量参与计算
+        self.assertEqual(result_key(parse('x + 1'), env), result_key(parse('x + 1'), {'x': 3}))
+        self.assertIsNone(result_key(parse('x + z'), env))
+        self.assertIsNotNone(result_key(parse('1 + 2')))
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'results.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_persistence(self):
+        env = {'x': (1 << 300) - 1}
+        with ResultCache(self.path) as cache:
+            self.assertEqual(cache.evaluate(parse('x * x'), env), env['x'] ** 2)
+            self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 1, 1))
+        with ResultCache(self.path) as cache:
+            # 第二次只读缓存, compute不会被调用
+            self.assertEqual(cache.evaluate(parse('(x) * x'), env, compute=lambda node: 0 / 0), env['x'] ** 2)
+            self.assertEqual(cache.stats()['hit_rate'], 1.0)
+
+    def test_version(self):
+        with ResultCache(self.path) as cache:
+            cache.evaluate(parse('1 + 2'))
+        with ResultCache(self.path, version=-1) as cache:
+            self.assertEqual(len(cache), 0)
+
+    def test_errors_and_undefined_variables_are_not_cached(self):
+        with ResultCache(self.path) as cache:
+            with self.assertRaises(ZeroDivisionError):
+                cache.evaluate(parse('1 / 0'))
+            with self.assertRaises(NameError):
+                cache.evaluate(parse('x + 1'))
+            self.assertEqual(len(cache), 0)
+
+    def test_eviction(self):
+        with ResultCache(self.path, max_bytes=2000) as cache:
+            keys = [result_key(parse(f'{i} + 1')) for i in range(100)]
+            for i, key in enumerate(keys[:10]):
+                cache.put(key, i)
+            # 反复命中的第一项不会被淘汰
+            for i, key in enumerate(keys[10:], 10):
+                self.assertEqual(cache.get(keys[0]), 0)
+                cache.put(key, i)
+            self.assertLessEqual(cache.bytes, 2000)
+            self.assertGreater(cache.evictions, 0)
+            self.assertEqual(cache.get(keys[0]), 0)
+            self.assertIsNone(cache.get(keys[1]))
+            self.assertEqual(cache.get(keys[-1]), 99)
+            cache.clear()
+            self.assertEqual((len(cache), cache.bytes), (0, 0))
+
+    def test_persistent_interpreter(self):
+        with ResultCache(self.path) as cache:
+            self.assertEqual(PersistentInterpreter(Parser(Lexer('x * 7')), cache, {'x': 6}).interpret(), 42)
+            self.assertEqual(PersistentInterpreter(Parser(Lexer(' x*7 ')), cache, {'x': 6}).interpret(), 42)
+            self.assertEqual(PersistentInterpreter(Parser(Lexer('7 * x')), cache, {'x': 6}).interpret(), 42)
+            self.assertEqual(cache.hits, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from serialize import dump, dumps, Library, load, loads, read_varint, write_varint
+from spi import Interpreter
+from testsupport import exprs, parse, render
+
+
+def render_all(nodes) -> dict[str, str]:
+    return {name: render(node) for name, node in nodes.items()}
+
+
+class SerializeTest(unittest.TestCase):
+
+    def library(self) -> dict[str, str]:
+        texts = exprs(100, 6) + ['x * (y - 1)', f'{1 << 100} - {10 ** 30} * x', '0']
+        return {f'f{i}': text for i, text in enumerate(texts)}
+
+    def test_round_trip(self):
+        library = self.library()
+        parsed = {name: parse(text) for name, text in library.items()}
+        self.assertEqual(render_all(loads(dumps(library))), render_all(parsed))
+        self.assertEqual(render_all(loads(dumps(parsed))), render_all(parsed))
+
+    def test_file(self):
+        library = self.library()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'library.spil')
+            dump(library, path)
+            nodes = load(path)
+        self.assertEqual(render_all(nodes), render_all(loads(dumps(library))))
+
+    def test_negative_and_big_literals(self):
+        # 常量折叠后的AST里可能有负数字面量
+        from optimizer import fold
+        node, _ = fold(parse(f'(1 - 5) * x + (0 - {1 << 90}) + {(1 << 63) - 1} + {1 << 63}'))
+        again = loads(dumps({'f': node}))['f']
+        self.assertEqual(render(again), render(node))
+        self.assertEqual(Interpreter(None, {'x': 2}).visit(again), Interpreter(None, {'x': 2}).visit(node))
+
+    def test_lazy_library(self):
+        library = Library(dumps(self.library()))
+        self.assertEqual(len(library), len(self.library()))
+        self.assertEqual(list(library), list(self.library()))
+        self.assertIs(library['f1'], library['f1'])
+        library.release()
+
+    def test_bad_data(self):
+        data = dumps(self.library())
+        for bad in (b'XXXX' + data[4:], data[:-1], data + b'\0'):
+            with self.assertRaises(ValueError):
+                Library(bad)
+
+    def test_varint(self):
+        for value in (0, 1, 127, 128, 300, 1 << 35, (1 << 64) - 1):
+            out = bytearray(b'\xff')
+            write_varint(out, value)
+            self.assertEqual(read_varint(out, 1), (value, len(out)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from server import EvalServer, evaluate_text
+from spi import main
+
+
+class EvaluateTextTest(unittest.TestCase):
+
+    def test_results_and_errors(self):
+        self.assertEqual(evaluate_text('1 + 2 * x', {'x': 3}), '7')
+        self.assertEqual(evaluate_text('1 / 0'), 'error: ZeroDivisionError: integer division or modulo by zero')
+        self.assertTrue(evaluate_text('1 +').startswith('error: ParseError'))
+        self.assertTrue(evaluate_text('y').startswith('error: NameError'))
+
+    def test_rejects_non_positive_options(self):
+        for option in (['-w', '0'], ['--max-pending', '0'], ['--per-connection', '-1']):
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                main(['serve', *option])
+
+
+class EvalServerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'spi.sock')
+
+    async def asyncTearDown(self):
+        self.directory.cleanup()
+
+    async def request(self, lines: list[str]) -> list[str]:
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        writer.write(''.join(f'{line}\n' for line in lines).encode())
+        await writer.drain()
+        writer.write_eof()
+        replies = (await asyncio.wait_for(reader.read(), 60)).decode().splitlines()
+        writer.close()
+        await writer.wait_closed()
+        return replies
+
+    async def test_pipelined_requests(self):
+        # 长表达式送进进程池, 短表达式就地求值, 回复仍按请求的顺序
+        long = '+'.join(['x'] * 200)
+        lines = ['1 + 2', long, '', '1 / 0', 'x * 3', long]
+        with EvalServer({'x': 2}, workers=1, inline_limit=16) as server:
+            listener = await server.start(path=self.path)
+            async with listener:
+                replies = await self.request(lines)
+                self.assertEqual(replies[:2] + replies[3:], ['3', '400', '6', '400'])
+                self.assertTrue(replies[2].startswith('error: ZeroDivisionError'))
+                self.assertEqual((server.requests, server.offloaded), (5, 2))
+                # 工作进程启动以后, 之后的连接关闭时客户端照常收到EOF
+                self.assertEqual(await self.request(['5 - 7', long]), ['-2', '400'])
+
+    async def test_line_too_long(self):
+        with EvalServer(workers=1, max_line=64) as server:
+            listener = await server.start(path=self.path)
+            async with listener:
+                replies = await self.request(['1 + 1', '+'.join(['1'] * 100)])
+                self.assertEqual(replies, ['2', 'error: ValueError: 表达式过长'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from cache import ParseCache
+from spi import (
+    evaluate_chunk, evaluate_many, InfixRenderer, Interpreter, Lexer, main, NodeVisitor, ParseError, Parser,
+    PrefixRenderer, RegexLexer, RpnRenderer,
+)
+from testsupport import exprs, parse, render, tree_eval
+
+
+class InterpreterTest(unittest.TestCase):
+
+    def test_arithmetic(self):
+        for text, value in (('7 + 3 * (10 / (12 / (3 + 1) - 1))', 22), ('2 - 3 - 4', -5), ('7 / 2', 3)):
+            self.assertEqual(tree_eval(text), value, text)
+        with self.assertRaises(ZeroDivisionError):
+            tree_eval('1 / (2 - 2)')
+
+    def test_variables(self):
+        self.assertEqual(Interpreter(Parser(Lexer('x * (y + 1)')), {'x': 3, 'y': 4}).interpret(), 15)
+        with self.assertRaises(NameError) as cm:
+            Interpreter(Parser(Lexer('x + z')), {'x': 1}).interpret()
+        self.assertIn('z', str(cm.exception))
+
+    def test_unsupported_node(self):
+        class Only(NodeVisitor):
+
+            def visit_integer(self, node):
+                return node.value.val
+
+        self.assertEqual(Only().visit(parse('5')), 5)
+        with self.assertRaises(RuntimeError):
+            Only().visit(parse('1 + 2'))
+
+    def test_dispatch_per_class(self):
+        # 子类覆盖的visit_xxx不会被父类已经建好的分派表挡住
+        class Doubling(Interpreter):
+
+            def visit_integer(self, node):
+                return node.value.val * 2
+
+        node = parse('1 + 2')
+        self.assertEqual(Interpreter(None).visit(node), 3)
+        self.assertEqual(Doubling(None).visit(node), 6)
+        self.assertEqual(Interpreter(None).visit(node), 3)
+
+
+class RendererTest(unittest.TestCase):
+
+    def test_formats(self):
+        node = parse('1 + 2 * x')
+        self.assertEqual(PrefixRenderer().render(node), '(+1(*2x))')
+        self.assertEqual(InfixRenderer().render(node), '1 + 2 * x')
+        self.assertEqual(RpnRenderer().render(node), '1 2 x * +')
+
+    def test_infix_parentheses(self):
+        for text, expected in (
+                ('(1 + 2) * 3', '(1 + 2) * 3'),
+                ('1 - (2 - 3)', '1 - (2 - 3)'),
+                ('(1 - 2) - 3', '1 - 2 - 3'),
+                ('8 / (4 / 2)', '8 / (4 / 2)'),
+                ('((x))', 'x'),
+        ):
+            self.assertEqual(InfixRenderer().render(parse(text)), expected, text)
+
+    def test_infix_round_trip(self):
+        for text in exprs(300, 7):
+            node = Parser(RegexLexer(text)).parse()
+            self.assertEqual(render(parse(InfixRenderer().render(node))), render(node), text)
+
+    def test_renderer_reuse(self):
+        renderer = PrefixRenderer()
+        self.assertEqual(renderer.render(parse('1 + 2')), '(+12)')
+        self.assertEqual(renderer.render(parse('3')), '3')
+
+
+class BatchTest(unittest.TestCase):
+
+    def test_evaluate_many(self):
+        texts = exprs(100, 5) + ['1 / 0', '1 +', '$'] + exprs(10, 5, seed=1)
+        results = list(evaluate_many(texts))
+        self.assertEqual(len(results), len(texts))
+        for text, (value, error) in zip(texts, results):
+            if text == '1 / 0':
+                self.assertIsNone(value)
+                self.assertIsInstance(error, ZeroDivisionError)
+            elif text in ('1 +', '$'):
+                self.assertIsNone(value)
+                self.assertIsInstance(error, ParseError)
+            else:
+                self.assertEqual((value, error), (tree_eval(text), None), text)
+
+    def test_repeated_lines(self):
+        # 重复的行共用同一次解析, 结果不变; 出错的行每次都照常报错
+        texts = (exprs(20, 5) + ['1 / 0', '2 *']) * 3
+        results = list(evaluate_many(texts))
+        self.assertEqual([value for value, _ in results], [
+            None if text in ('1 / 0', '2 *') else tree_eval(text) for text in texts
+        ])
+        self.assertEqual(sum(error is not None for _, error in results), 6)
+
+    def test_custom_parse(self):
+        texts = exprs(20, 5) * 3
+        cache = ParseCache()
+        self.assertEqual([value for value, _ in evaluate_many(texts, cache.get)], [tree_eval(text) for text in texts])
+        self.assertEqual(cache.hits, len(texts) - len(set(texts)))
+
+
+    def test_evaluate_many_with_env(self):
+        results = list(evaluate_many(['x * 2', 'y'], env={'x': 21}))
+        self.assertEqual(results[0], (42, None))
+        self.assertIsInstance(results[1][1], NameError)
+
+    def test_evaluate_chunk(self):
+        first, outputs, pid, _ = evaluate_chunk((10, ['1 + 2\n', '\n', '1 / 0\n', ' 4 * 5 ']))
+        self.assertEqual((first, pid), (10, os.getpid()))
+        self.assertEqual(outputs[:2], ['3', ''])
+        self.assertTrue(outputs[2].startswith('error: ZeroDivisionError'))
+        self.assertEqual(outputs[3], '20')
+
+    def test_batch_command(self):
+        texts = exprs(50, 4) + ['', '1 / 0'] + exprs(50, 4, seed=1)
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'input.txt')
+            with open(source, 'w', encoding='utf-8') as f:
+                f.writelines(f'{text}\n' for text in texts)
+            expected = evaluate_chunk((0, texts))[1]
+            for extra in ([], ['--unordered']):
+                output = os.path.join(directory, 'output.txt')
+                with contextlib.redirect_stderr(io.StringIO()):
+                    main(['batch', source, '-o', output, '-w', '2', '-c', '7', *extra])
+                with open(output, encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+                if extra:
+                    lines = [line for _, line in sorted(
+                        (int(number), line) for number, _, line in (row.partition('\t') for row in lines)
+                    )]
+                self.assertEqual(lines, expected, extra)
+
+    def test_batch_defines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'input.txt')
+            output = os.path.join(directory, 'output.txt')
+            with open(source, 'w', encoding='utf-8') as f:
+                f.write('x * y\nx + z\n')
+            with contextlib.redirect_stderr(io.StringIO()):
+                main(['-D', 'x=6', '-D', 'y=7', 'batch', source, '-o', output, '-w', '1'])
+            with open(output, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        self.assertEqual(lines[0], '42')
+        self.assertTrue(lines[1].startswith('error: NameError'))
+
+    def test_batch_rejects_non_positive(self):
+        for option in (['-c', '0'], ['-w', '0'], ['-w', '-2']):
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                main(['batch', os.devnull, *option])
+
+
+
+class ReplTest(unittest.TestCase):
+
+    def run_repl(self, lines: list[str], *argv: str) -> list[str]:
+        out = io.StringIO()
+        with mock.patch('builtins.input', side_effect=[*lines, EOFError]), contextlib.redirect_stdout(out):
+            main(['--render', 'none', *argv])
+        return out.getvalue().splitlines()
+
+    def test_errors_do_not_exit(self):
+        # 求值出错只报告这一条, 之后的输入照常求值
+        for backend in ('tree', 'vm', 'iterative'):
+            output = self.run_repl(['x + y', '1 / 0', 'x * 2', '1 +'], '-D', 'x=4', '--backend', backend)
+            self.assertEqual(output[0], 'error: NameError: 未定义的变量: y', backend)
+            self.assertTrue(output[1].startswith('error: ZeroDivisionError'), backend)
+            self.assertEqual(output[2], '8', backend)
+            self.assertIn('解析错误', output[-1])
+
+    def test_lexer_error_on_first_token(self):
+        # 第一个token就出错时Parser在构造时抛出ParseError, 同样只报告这一条
+        for backend in ('tree', 'vm', 'iterative'):
+            for argv in ([], ['--profile']):
+                output = self.run_repl(['$', '12abc', '0xZ', '@ + 1', '1 + 1'], '--backend', backend, *argv)
+                self.assertEqual(output[:8], [
+                    '$', '^ 解析错误: 第1行第1列',
+                    '12abc', '^ 解析错误: 第1行第1列',
+                    '0xZ', '^ 解析错误: 第1行第1列',
+                    '@ + 1', '^ 解析错误: 第1行第1列',
+                ], (backend, argv))
+                self.assertEqual(output[8], '2', (backend, argv))
+
+    def test_optimize_keeps_name_error(self):
+        self.assertEqual(self.run_repl(['y * 0'], '-O')[0], 'error: NameError: 未定义的变量: y')
+        self.assertEqual(self.run_repl(['y * 0'], '-O', '-D', 'y=3')[:2], ['0', 'folded: 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+from spi import Interpreter, Lexer, Parser
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if np is not None:
+    from vectorized import INT64_MAX, INT64_MIN, evaluate_columns
+
+
+def scalar(text: str, env: dict[str, int]) -> int:
+    return Interpreter(Parser(Lexer(text)), env).interpret()
+
+
+@unittest.skipIf(np is None, '需要安装numpy')
+class VectorInterpreterTest(unittest.TestCase):
+
+    def test_matches_scalar_interpreter(self):
+        text = '(a * b - c) / (d + 1) + a * 3 - b / 7'
+        rng = np.random.default_rng(7)
+        columns = {name: rng.integers(-1000, 1000, 500) for name in 'abc'}
+        columns['d'] = rng.integers(0, 1000, 500)
+        rows = [{name: int(column[i]) for name, column in columns.items()} for i in range(500)]
+        self.assertEqual(evaluate_columns(text, columns).tolist(), [scalar(text, row) for row in rows])
+
+    def test_constant_broadcast(self):
+        self.assertEqual(evaluate_columns('1 + 2', {'x': np.arange(3)}).tolist(), [3, 3, 3])
+
+    def test_zero_division(self):
+        columns = {'x': np.array([7, -7, 7]), 'y': np.array([2, 2, 0])}
+        self.assertEqual(evaluate_columns('x / y', columns, on_zero_division='zero').tolist(), [3, -4, 0])
+        with self.assertRaises(ZeroDivisionError):
+            evaluate_columns('x / y', columns)
+        with self.assertRaises(ZeroDivisionError):
+            evaluate_columns('x + 1 / 0', columns, overflow='object')
+        self.assertEqual(evaluate_columns('x + 1 / 0', columns, 'zero', 'object').tolist(), [7, -7, 7])
+
+    def test_overflow_modes(self):
+        columns = {'x': np.array([INT64_MAX, 1])}
+        self.assertEqual(evaluate_columns('x + 1', columns).tolist(), [INT64_MIN, 2])
+        self.assertEqual(evaluate_columns('x + 1', columns, overflow='object').tolist(), [INT64_MAX + 1, 2])
+        with self.assertRaises(OverflowError):
+            evaluate_columns('x + 1', columns, overflow='raise')
+
+    def test_object_mode_constant_subtree(self):
+        # 两个字面量之间的运算不能经过int64
+        columns = {'x': np.array([1, 2])}
+        text = 'x + 4611686018427387904 * 4'
+        expected = [scalar(text, {'x': 1}), scalar(text, {'x': 2})]
+        self.assertEqual(evaluate_columns(text, columns, overflow='object').tolist(), expected)
+        self.assertEqual(evaluate_columns('2 * 9223372036854775807', columns, overflow='object').tolist(),
+                         [2 * INT64_MAX] * 2)
+
+    def test_out_of_range_columns(self):
+        for column in ([2 ** 63], np.array([2 ** 63], dtype=np.uint64), [INT64_MIN - 1]):
+            for overflow in ('wrap', 'raise'):
+                with self.assertRaises(OverflowError):
+                    evaluate_columns('x', {'x': column}, overflow=overflow)
+            self.assertEqual(evaluate_columns('x', {'x': column}, overflow='object').tolist(), [int(column[0])])
+        self.assertEqual(evaluate_columns('x', {'x': np.array([5], dtype=np.uint64)}).tolist(), [5])
+
+    def test_non_integer_columns(self):
+        # 浮点数不会被截断成整数
+        for column in (np.array([1.5, 2.0]), [1.5, 2], np.array(['1', '2']), np.array([1, 2.5], dtype=object)):
+            for overflow in ('wrap', 'raise', 'object'):
+                with self.assertRaises(TypeError):
+                    evaluate_columns('x', {'x': column}, overflow=overflow)
+        for overflow in ('wrap', 'object'):
+            self.assertEqual(evaluate_columns('x + 1', {'x': np.array([True, False])}, overflow=overflow).tolist(), [2, 1])
+            self.assertEqual(evaluate_columns('x', {'x': [np.int8(3), True, 4]}, overflow=overflow).tolist(), [3, 1, 4])
+
+    def test_out_of_range_literal(self):
+        with self.assertRaises(OverflowError):
+            evaluate_columns('x + 9223372036854775808', {'x': np.arange(2)})
+
+
+if __name__ == '__main__':
+    unittest.main()
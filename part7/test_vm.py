@@ -0,0 +1,31 @@
+import unittest
+
+from spi import Lexer, Parser
+from testsupport import exprs, tree_eval
+from vm import compile_ast, compile_text, evaluate, VM
+
+
+class VMTest(unittest.TestCase):
+
+    def test_matches_tree_interpreter(self):
+        vm = VM()
+        for text in exprs(300, 7):
+            self.assertEqual(vm.run(compile_ast(Parser(Lexer(text)).parse())), tree_eval(text), text)
+
+    def test_code_is_reusable(self):
+        code = compile_text('(a + 2) * b - a / 3')
+        vm = VM()
+        for a, b in ((1, 2), (9, -4), (-7, 0)):
+            self.assertEqual(vm.run(code, {'a': a, 'b': b}), (a + 2) * b - a // 3)
+        self.assertEqual(code.names, ('a', 'b'))
+
+    def test_errors(self):
+        with self.assertRaises(ZeroDivisionError):
+            evaluate('1 / (3 - 3)')
+        with self.assertRaises(NameError) as cm:
+            evaluate('x + y', {'x': 1})
+        self.assertIn('y', str(cm.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
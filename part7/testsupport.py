@@ -0,0 +1,53 @@
+import random
+import re
+
+from spi import AstNode, EToken, Interpreter, Lexer, Parser, PrefixRenderer, RegexLexer, Token
+
+# 测试和benchmark共用的样例生成和小工具; 给定seed时生成的表达式固定不变
+
+
+def random_expr(rng: random.Random, depth: int) -> str:
+    if depth == 0 or rng.random() < 0.2:
+        return str(rng.randint(1, 99))
+    op = rng.choice('+-*/')
+    left = random_expr(rng, depth - 1)
+    right = random_expr(rng, depth - 1)
+    if op == '/':
+        right = f'({right}*0+{rng.randint(1, 9)})'
+    return f'({left}{op}{right})'
+
+
+def exprs(count: int, depth: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [random_expr(rng, depth) for _ in range(count)]
+
+
+def spaced(rng: random.Random, text: str) -> str:
+    # 只在运算符和括号两侧插入空白, 不拆开多位数字
+    return re.sub(r'[-+*/()]', lambda m: f'{" " * rng.randint(0, 2)}{m.group()}{" " * rng.randint(0, 2)}', text).strip()
+
+
+def tokens(lexer: Lexer | RegexLexer) -> list[Token]:
+    result: list[Token] = []
+    while True:
+        token = lexer.get_next_token()
+        result.append(token)
+        if token.typ == EToken.EOF:
+            return result
+
+
+def stream(lexer: Lexer | RegexLexer) -> list[tuple[EToken, int | str | None]]:
+    return [(token.typ, token.val) for token in tokens(lexer)]
+
+
+def parse(text: str) -> AstNode:
+    return Parser(Lexer(text)).parse()
+
+
+def render(node: AstNode | None) -> str | None:
+    # 前缀形式与树结构一一对应, 用来比较两棵树
+    return None if node is None else PrefixRenderer().render(node)
+
+
+def tree_eval(text: str) -> int:
+    return Interpreter(Parser(Lexer(text))).interpret()
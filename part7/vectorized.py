@@ -0,0 +1,155 @@
+from typing import Mapping
+
+from spi import AstNode, BIN_OPS, BinOp, EToken, Integer, Lexer, NodeVisitor, Parser, Var
+
+try:
+    import numpy as np
+except ImportError:  # numpy是可选依赖, 只有这个后端需要
+    np = None
+
+# 整列求值的语义和标量Interpreter的差别:
+#
+# 除法: EToken.DIV用np.floor_divide, 对int64和Python的//一样向负无穷取整
+# 除以0: on_zero_division决定
+#   'raise' (默认) 任意一行除数为0就抛ZeroDivisionError, 与标量解释器一致
+#   'zero'  除数为0的行结果为0, 其余行照常计算, 不告警
+# 溢出: Python整数没有上限, int64列有. overflow决定
+#   'wrap'  (默认) 按二进制补码回绕, 与numpy自身行为一致, 结果可能和标量解释器不同
+#   'raise' 任意一行溢出就抛OverflowError
+#   'object' 转成dtype=object逐元素用Python整数计算, 结果与标量解释器完全一致但慢得多
+# 超出int64范围的字面量或输入列在'wrap'/'raise'下直接抛OverflowError
+
+INT64_MIN: int = -(1 << 63)
+INT64_MAX: int = (1 << 63) - 1
+
+
+class VectorInterpreter(NodeVisitor):
+
+    def __init__(
+            self,
+            columns: Mapping[str, 'np.ndarray'],
+            on_zero_division: str = 'raise',
+            overflow: str = 'wrap'
+    ):
+        if np is None:
+            raise ImportError('向量化求值需要安装numpy')
+        if on_zero_division not in ('raise', 'zero'):
+            raise ValueError(f'未知的除零策略: {on_zero_division}')
+        if overflow not in ('wrap', 'raise', 'object'):
+            raise ValueError(f'未知的溢出策略: {overflow}')
+        self.__on_zero_division = on_zero_division
+        self.__overflow = overflow
+        self.__dtype = object if overflow == 'object' else np.int64
+        self.__columns = {name: self.__column(name, column) for name, column in columns.items()}
+        lengths = {len(column) for column in self.__columns.values()}
+        if len(lengths) > 1:
+            raise ValueError('所有列的长度必须相同')
+        self.__rows = lengths.pop() if lengths else 1
+
+    @property
+    def rows(self) -> int: return self.__rows
+
+    def __column(self, name: str, column) -> 'np.ndarray':
+        # 只接受整数和布尔列, 浮点数等不静默截断
+        if self.__dtype is object:
+            return np.asarray(self.integers(name, column), dtype=object)
+        array = np.asarray(column)
+        if array.dtype == object:
+            values = self.integers(name, array)
+            if values and (min(values) < INT64_MIN or max(values) > INT64_MAX):
+                raise OverflowError(f'列{name}超出int64范围')
+        elif array.dtype.kind not in 'iub':
+            raise TypeError(f'列{name}必须是整数, 不支持{array.dtype}')
+        elif array.dtype.kind == 'u':
+            # np.asarray([2**63])得到uint64, astype会静默回绕
+            if array.size and array.max() > INT64_MAX:
+                raise OverflowError(f'列{name}超出int64范围')
+        return array.astype(np.int64, copy=False)
+
+    @staticmethod
+    def integers(name: str, column) -> list[int]:
+        values = list(column)
+        for v in values:
+            if not isinstance(v, (int, np.integer, np.bool_)):
+                raise TypeError(f'列{name}必须是整数, 不支持{type(v).__name__}')
+        return [int(v) for v in values]
+
+    def visit_integer(self, node: Integer):
+        value = node.value.val
+        if self.__dtype is object:
+            return value
+        if not INT64_MIN <= value <= INT64_MAX:
+            raise OverflowError(f'字面量{value}超出int64范围')
+        return np.int64(value)
+
+    def visit_var(self, node: Var):
+        try:
+            return self.__columns[node.value.val]
+        except KeyError:
+            raise NameError(f'未定义的变量: {node.value.val}') from None
+
+    def visit_bin_op(self, node: BinOp):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        typ = node.op.typ
+        if self.__dtype is object and np.ndim(left) == 0 and np.ndim(right) == 0:
+            # 两个Python整数交给numpy会按int64计算, 常量子树直接用Python运算符
+            if typ == EToken.DIV and right == 0 and self.__on_zero_division == 'zero':
+                return 0
+            return BIN_OPS[typ](left, right)
+        # 标量之间的int64运算溢出时numpy会告警, 和数组保持一致统一静默, 由check_overflow处理
+        with np.errstate(over='ignore', divide='ignore'):
+            if typ == EToken.PLUS:
+                result = np.add(left, right)
+            elif typ == EToken.MINUS:
+                result = np.subtract(left, right)
+            elif typ == EToken.MUL:
+                result = np.multiply(left, right)
+            elif typ == EToken.DIV:
+                zero = np.equal(right, 0)
+                if np.any(zero):
+                    if self.__on_zero_division == 'raise':
+                        raise ZeroDivisionError('integer division or modulo by zero')
+                    # 先把除数里的0换成1再除, 再把这些行的结果置0; object数组也适用
+                    right = np.where(zero, 1, right)
+                    result = np.where(zero, 0, np.floor_divide(left, right))
+                else:
+                    result = np.floor_divide(left, right)
+            else:
+                raise RuntimeError(f'不支持的运算符: {node.op}')
+        if self.__overflow == 'raise':
+            self.check_overflow(typ, left, right, result)
+        return result
+
+    @staticmethod
+    def check_overflow(typ: EToken, left, right, result):
+        # 按二进制补码的规则判断是否回绕, 不需要借助更宽的类型
+        if typ == EToken.PLUS:
+            overflow = ((left ^ result) & (right ^ result)) < 0
+        elif typ == EToken.MINUS:
+            overflow = ((left ^ right) & (left ^ result)) < 0
+        elif typ == EToken.MUL:
+            nonzero = right != 0
+            safe_right = np.where(nonzero, right, 1)
+            with np.errstate(over='ignore'):
+                overflow = nonzero & (result // safe_right != left)
+            overflow |= ((left == -1) & (right == INT64_MIN)) | ((left == INT64_MIN) & (right == -1))
+        else:
+            overflow = (left == INT64_MIN) & (right == -1)
+        if np.any(overflow):
+            raise OverflowError('int64溢出')
+
+    def evaluate(self, node: AstNode) -> 'np.ndarray':
+        result = self.visit(node)
+        # 只由常量组成的表达式得到的是标量, 广播成和输入等长的一列
+        return np.full(self.__rows, result, dtype=self.__dtype) if np.ndim(result) == 0 else result
+
+
+def evaluate_columns(
+        expr: str | AstNode,
+        columns: Mapping[str, 'np.ndarray'],
+        on_zero_division: str = 'raise',
+        overflow: str = 'wrap'
+) -> 'np.ndarray':
+    node = Parser(Lexer(expr)).parse() if isinstance(expr, str) else expr
+    return VectorInterpreter(columns, on_zero_division, overflow).evaluate(node)
@@ -0,0 +1,144 @@
+import operator
+from array import array
+from typing import Callable, Mapping
+
+from spi import AstNode, BinOp, EToken, Integer, Lexer, NodeVisitor, Parser, Var
+
+# 操作码
+# CONST: 将常量池中下标为arg的常量压栈
+# ADD/SUB/MUL/DIV: 弹出右操作数, 与栈顶做运算后写回栈顶
+# LOAD: 将名字表中下标为arg的变量的值压栈
+OP_CONST, OP_ADD, OP_SUB, OP_MUL, OP_DIV, OP_LOAD = range(6)
+
+BIN_OPCODES: dict[EToken, int] = {
+    EToken.PLUS: OP_ADD,
+    EToken.MINUS: OP_SUB,
+    EToken.MUL: OP_MUL,
+    EToken.DIV: OP_DIV,
+}
+
+BIN_FUNCS: tuple[Callable[[int, int], int] | None, ...] = (
+    None,
+    operator.add,
+    operator.sub,
+    operator.mul,
+    operator.floordiv,
+    None,
+)
+
+
+class Code:
+
+    def __init__(
+            self,
+            ops: array,
+            args: array,
+            consts: tuple[int, ...],
+            names: tuple[str, ...] = ()
+    ):
+        self.__ops = ops
+        self.__args = args
+        self.__consts = consts
+        self.__names = names
+
+    @property
+    def ops(self) -> array: return self.__ops
+
+    @property
+    def args(self) -> array: return self.__args
+
+    @property
+    def consts(self) -> tuple[int, ...]: return self.__consts
+
+    @property
+    def names(self) -> tuple[str, ...]: return self.__names
+
+    def __len__(self) -> int: return len(self.__ops)
+
+    def __repr__(self) -> str: return f'Code(ops={len(self.__ops)}, consts={len(self.__consts)})'
+
+
+class Compiler(NodeVisitor):
+
+    def __init__(self):
+        self.__ops = array('B')
+        self.__args = array('I')
+        self.__consts: list[int] = []
+        self.__const_index: dict[int, int] = {}
+        self.__names: list[str] = []
+        self.__name_index: dict[str, int] = {}
+
+    def emit(self, op: int, arg: int = 0):
+        self.__ops.append(op)
+        self.__args.append(arg)
+
+    def const(self, value: int) -> int:
+        index = self.__const_index.get(value)
+        if index is None:
+            index = len(self.__consts)
+            self.__consts.append(value)
+            self.__const_index[value] = index
+        return index
+
+    def name(self, name: str) -> int:
+        index = self.__name_index.get(name)
+        if index is None:
+            index = len(self.__names)
+            self.__names.append(name)
+            self.__name_index[name] = index
+        return index
+
+    def visit_integer(self, node: Integer):
+        self.emit(OP_CONST, self.const(node.value.val))
+
+    def visit_var(self, node: Var):
+        self.emit(OP_LOAD, self.name(node.value.val))
+
+    def visit_bin_op(self, node: BinOp):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(BIN_OPCODES[node.op.typ])
+
+    def compile(self, node: AstNode) -> Code:
+        self.visit(node)
+        return Code(self.__ops, self.__args, tuple(self.__consts), tuple(self.__names))
+
+
+class VM:
+
+    def run(self, code: Code, env: Mapping[str, int] | None = None) -> int:
+        stack: list[int] = []
+        push = stack.append
+        pop = stack.pop
+        consts = code.consts
+        funcs = BIN_FUNCS
+        # 先按名字表把变量取出来, 循环里只按下标取
+        values = [] if not code.names else [lookup(env or {}, name) for name in code.names]
+        for op, arg in zip(code.ops, code.args):
+            if op == OP_CONST:
+                push(consts[arg])
+            elif op == OP_LOAD:
+                push(values[arg])
+            else:
+                right = pop()
+                stack[-1] = funcs[op](stack[-1], right)
+        return stack[-1]
+
+
+def lookup(env: Mapping[str, int], name: str) -> int:
+    try:
+        return env[name]
+    except KeyError:
+        raise NameError(f'未定义的变量: {name}') from None
+
+
+def compile_ast(node: AstNode) -> Code:
+    return Compiler().compile(node)
+
+
+def compile_text(text: str) -> Code:
+    return compile_ast(Parser(Lexer(text)).parse())
+
+
+def evaluate(text: str, env: Mapping[str, int] | None = None) -> int:
+    return VM().run(compile_text(text), env)